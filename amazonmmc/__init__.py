@@ -1,4 +1,47 @@
-from .entrypoint import main
-from .libs import enums, errors
-from .libs.delivery import Delivery
-from .libs.args import MMCArgs, parse_args
\ No newline at end of file
+__version__ = "0.0.9"
+
+# Submodules are only imported when first used, so the CLI's trivial commands and
+# importing one part of the library don't pay for the whole package.
+# Not typing.TYPE_CHECKING, importing typing alone would double the cost of this module.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from .libs import enums, errors
+    from .libs.delivery import Delivery
+    from .libs.filesystem import FileSystem, LocalFileSystem, MemoryFileSystem
+    from .libs.args import MMCArgs, parse_args
+
+_LAZY = {
+    "enums": ("libs.enums", None),
+    "errors": ("libs.errors", None),
+    "Delivery": ("libs.delivery", "Delivery"),
+    "FileSystem": ("libs.filesystem", "FileSystem"),
+    "LocalFileSystem": ("libs.filesystem", "LocalFileSystem"),
+    "MemoryFileSystem": ("libs.filesystem", "MemoryFileSystem"),
+    "MMCArgs": ("libs.args", "MMCArgs"),
+    "parse_args": ("libs.args", "parse_args"),
+}
+
+def main() -> None:
+    '''
+    Console script entry point. A lone --version is answered before argparse
+    or any other module is imported.
+    '''
+    import sys
+    if sys.argv[1:] in (["--version"], ["-version"]):
+        print(f"v{__version__}")
+        return
+    from .entrypoint import main
+    main()
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    modulename, attr = _LAZY[name]
+    module = importlib.import_module(f".{modulename}", __name__)
+    value = module if attr is None else getattr(module, attr)
+    globals()[name] = value
+    return value
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_LAZY])
@@ -1,48 +1,75 @@
-import shutil
-import logging
 from pathlib import Path
+from contextlib import ExitStack
 
-from .libs.args import parse_args
-from .libs.delivery import Delivery
+from .libs.args import MMCArgs, parse_args
 
+# Only what --version and --sample need is imported up front. The pipeline
+# (Delivery, MEC, MMC, hashing, process pools) is imported once there is work to do.
 
 def setlogging(rootdir: Path) -> None:
+    import logging
+    from .libs.batch import LOGFORMAT, LOGDATEFMT
     if not rootdir.is_dir():
         print(f"Not a valid directory: {rootdir}")
         exit()
     logpath = rootdir / "log.txt"
-    logging.basicConfig(level=logging.INFO, filename=str(logpath),
-        format='%(asctime)s.%(msecs)03d - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    logging.basicConfig(level=logging.INFO, filename=str(logpath), format=LOGFORMAT, datefmt=LOGDATEFMT)
 
 def copy_samples(rootdir: Path) -> None:
+    import shutil
     sameplestart = Path(__file__).parent / "samples" / "dirStructure_example_start"
     sameplecomplete = Path(__file__).parent / "samples" / "dirStructure_example_complete"
     shutil.copytree(sameplestart, rootdir / sameplestart.name)
     shutil.copytree(sameplecomplete, rootdir / sameplecomplete.name)
 
+def write_profile(path: Path) -> None:
+    from .libs.profiler import PROFILER
+    PROFILER.disable()
+    PROFILER.write_trace(path)
+    print(PROFILER.summary())
+    print(f"Profile written to {path}")
+
 def main():
+    args = parse_args()
+    if args.profile is None:
+        run(args)
+        return
+    from .libs.profiler import PROFILER
+    PROFILER.enable()
+    try:
+        run(args)
+    finally:
+        write_profile(args.profile)
+
+def run(args: MMCArgs) -> None:
+    if args.serve is not None:
+        from .server import serve
+        serve(args)
+        return
+    if len(args.rootdirs) > 1 and not args.sample:
+        from .runner import batch
+        batch(args)
+        return
+    stack = ExitStack()
     try:
-        args = parse_args()
         setlogging(args.rootdir)
         if args.sample:
             copy_samples(args.rootdir)
             exit()
-        deliv = Delivery(args.rootdir)
-        if args.mec:
-            deliv.write_mecs()
-            logging.info("MECs written successfully")
-        if args.md5:
-            deliv.checksums()
-            logging.info("Checksums created successfully")
-        if args.mmc:
-            deliv.write_mmc()
-            logging.info("MMC written successfully")
+        from .runner import single, watch
+        if args.watch:
+            watch(args, stack)
+            return
+        if not single(args, stack):
+            exit(1)
     except Exception as e:
+        import logging
         name = type(e).__name__
         print(f"{name}: {e}")
         logging.exception(e)
         exit()
+    finally:
+        stack.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -2,14 +2,34 @@ import argparse
 from pathlib import Path
 from dataclasses import dataclass
 
+from .. import __version__
+from .defaults import DEBOUNCE, DEFAULT_READER, READER_NAMES
+
 
 @dataclass
 class MMCArgs:
     rootdir: Path
+    rootdirs: list[Path]
     mec: bool
     mmc: bool
+    stream: bool
+    rebuild: bool
     md5: bool
+    verify: bool
+    ingest: list[Path] | None
     sample: bool
+    jobs: int | None
+    device_jobs: int | None
+    digests: list[str] | None
+    read_backend: str
+    progress_json: Path | None
+    profile: Path | None
+    batch_jobs: int | None
+    serve: str | None
+    serve_jobs: int | None
+    watch: bool
+    poll: bool
+    debounce: float
 
 def parse_args() -> MMCArgs:
     parser = argparse.ArgumentParser(description=
@@ -17,8 +37,9 @@ def parse_args() -> MMCArgs:
         AmazonMMC is a tool for creating Amazon MEC, MMC, and running checksums
         """
     )
-    parser.add_argument("-r", "--rootdir", required=True, type=lambda x: Path(x), help="""
-        (Required) Specify the root path of the Amazon delivery.    
+    parser.add_argument("-r", "--rootdir", required=True, nargs="+", help="""
+        (Required) Specify the root path of the Amazon delivery.
+        Several paths or glob patterns (e.g. '/deliveries/*') run them all as one batch.
     """)
     parser.add_argument("-mec", "--mec", default=False, action="store_true", help="""
         (Optional) Create MEC xmls
@@ -26,21 +47,105 @@ def parse_args() -> MMCArgs:
     parser.add_argument("-mmc", "--mmc", default=False, action="store_true", help="""
         (Optional) Create MMC xml
     """)
+    parser.add_argument("--stream", default=False, action="store_true", help="""
+        (Optional) Write the MMC element by element with flat memory use, for very large series
+    """)
+    parser.add_argument("--rebuild", default=False, action="store_true", help="""
+        (Optional) Ignore the build cache and rebuild every MEC and the whole MMC
+    """)
     parser.add_argument("-md5", "--md5", default=False, action="store_true", help="""
         (Optional) Create MD5 checksums
     """)
+    parser.add_argument("-ingest", "--ingest", default=None, nargs="+", type=lambda x: Path(x), help="""
+        (Optional) Copy files (or the contents of directories) into resources while
+        computing their checksums in the same pass. Runs before any other step.
+    """)
+    parser.add_argument("-verify", "--verify", default=False, action="store_true", help="""
+        (Optional) Verify resources against the checksum manifests.
+        Prints a JSON report and exits non-zero on any mismatch.
+    """)
     parser.add_argument("-s", "--sample", default=False, action="store_true", help="""
         (Optional) Create completed and starting sample directories
     """)
-    parser.add_argument("-version", "--version", action="version", version="v0.0.9")
+    parser.add_argument("-j", "--jobs", default=None, type=int, help="""
+        (Optional) Maximum number of parallel workers for checksums,
+        and the number of processes used to build MECs
+    """)
+    parser.add_argument("--device-jobs", default=None, type=int, help="""
+        (Optional) Maximum number of parallel checksum workers per storage device
+    """)
+    parser.add_argument("--digests", default=None, type=lambda x: [d.strip() for d in x.split(",") if d.strip()], help="""
+        (Optional) Comma separated checksum algorithms, e.g. 'md5,sha256'.
+        All are computed in a single read, written to data/checksums.<algorithm>
+        and emitted as Hash elements in the MMC. MD5 is always included.
+    """)
+    parser.add_argument("--read-backend", default=DEFAULT_READER, choices=list(READER_NAMES), help=f"""
+        (Optional) How resources are read while hashing (default: {DEFAULT_READER}).
+        'fadvise' and 'mmap' avoid evicting other processes from the page cache.
+    """)
+    parser.add_argument("--progress-json", default=None, type=lambda x: Path(x), help="""
+        (Optional) Write checksum progress events as JSON lines to this file ('-' for stdout)
+    """)
+    parser.add_argument("--profile", default=None, type=lambda x: Path(x), help="""
+        (Optional) Profile the run: write a Chrome trace (chrome://tracing, ui.perfetto.dev)
+        of every stage to this file and print a summary table of where the time went
+    """)
+    parser.add_argument("--watch", default=False, action="store_true", help="""
+        (Optional) Keep running and update the MECs, checksums and MMC whenever
+        data.json, its data/seasons files or resources change. Only what changed is hashed and rebuilt.
+    """)
+    parser.add_argument("--poll", default=False, action="store_true", help="""
+        (Optional) With --watch, poll for changes instead of using inotify (e.g. on network mounts)
+    """)
+    parser.add_argument("--debounce", default=DEBOUNCE, type=float, help=f"""
+        (Optional) With --watch, seconds without changes before updating (default: {DEBOUNCE})
+    """)
+    parser.add_argument("--batch-jobs", default=None, type=int, help="""
+        (Optional) Number of deliveries processed at the same time in a batch (default: 4).
+        They share one checksum worker pool and one MEC process pool.
+    """)
+    parser.add_argument("--serve", default=None, nargs="?", const="", metavar="ADDRESS", help="""
+        (Optional) Run as a server for the deliveries at or under --rootdir, keeping them parsed
+        between jobs. Listens on host:port or unix:/path/to/socket (default: 127.0.0.1:8765)
+    """)
+    parser.add_argument("--serve-jobs", default=None, type=int, help="""
+        (Optional) With --serve, number of jobs run at the same time (default: 4)
+    """)
+    parser.add_argument("-version", "--version", action="version", version=f"v{__version__}")
 
     args = parser.parse_args()
+    from .batch import expand_roots
+    try:
+        rootdirs = expand_roots(args.rootdir)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    if args.watch and len(rootdirs) > 1:
+        parser.error("--watch takes a single --rootdir")
+    if args.serve is not None and any([args.mec, args.mmc, args.md5, args.verify, args.ingest, args.sample, args.watch]):
+        parser.error("--serve runs the jobs submitted by clients and takes no steps")
     return MMCArgs(
-        rootdir=args.rootdir,
+        rootdir=rootdirs[0],
+        rootdirs=rootdirs,
         mec=args.mec,
         mmc=args.mmc,
+        stream=args.stream,
+        rebuild=args.rebuild,
         md5=args.md5,
-        sample=args.sample
+        verify=args.verify,
+        ingest=args.ingest,
+        sample=args.sample,
+        jobs=args.jobs,
+        device_jobs=args.device_jobs,
+        digests=args.digests,
+        read_backend=args.read_backend,
+        progress_json=args.progress_json,
+        profile=args.profile,
+        batch_jobs=args.batch_jobs,
+        serve=args.serve,
+        serve_jobs=args.serve_jobs,
+        watch=args.watch,
+        poll=args.poll,
+        debounce=args.debounce
     )
 
 if __name__ == "__main__":
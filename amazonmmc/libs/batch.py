@@ -0,0 +1,126 @@
+import glob
+import logging
+import threading
+from pathlib import Path
+from contextvars import ContextVar
+from typing import TextIO
+from dataclasses import dataclass, field
+
+LOGFORMAT = '%(asctime)s.%(msecs)03d - %(levelname)s - %(message)s'
+LOGDATEFMT = '%Y-%m-%d %H:%M:%S'
+
+# The delivery the current thread is working on, records are routed to its log.txt
+current_delivery: ContextVar[Path | None] = ContextVar("current_delivery", default=None)
+
+def expand_roots(patterns: list[str]) -> list[Path]:
+    '''
+    Expands glob patterns (e.g. '/mnt/deliveries/*_S1') to directories.
+    Plain paths are kept as given so missing ones are reported, duplicates are dropped.
+    '''
+    roots: list[Path] = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = [Path(p) for p in sorted(glob.glob(pattern)) if Path(p).is_dir()]
+            if not matches:
+                raise FileNotFoundError(f"No delivery directories match: {pattern}")
+        else:
+            matches = [Path(pattern)]
+        for match in matches:
+            if match not in roots:
+                roots.append(match)
+    return roots
+
+class DeliveryLogHandler(logging.Handler):
+    '''
+    Writes each record to the log.txt of the delivery set in 'current_delivery',
+    so deliveries processed side by side in one run keep separate logs.
+    '''
+    def __init__(self) -> None:
+        super().__init__()
+        self._handlers: dict[Path, logging.FileHandler] = {}
+        self._handlerslock = threading.Lock()
+
+    def open(self, rootdir: Path) -> None:
+        handler = logging.FileHandler(rootdir / "log.txt")
+        handler.setFormatter(logging.Formatter(LOGFORMAT, LOGDATEFMT))
+        with self._handlerslock:
+            self._handlers[rootdir] = handler
+
+    def close_delivery(self, rootdir: Path) -> None:
+        with self._handlerslock:
+            handler = self._handlers.pop(rootdir, None)
+        if handler is not None:
+            handler.close()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        rootdir = current_delivery.get()
+        if rootdir is None:
+            return
+        handler = self._handlers.get(rootdir)
+        if handler is not None:
+            handler.handle(record)
+
+    def close(self) -> None:
+        with self._handlerslock:
+            handlers = list(self._handlers.values())
+            self._handlers.clear()
+        for handler in handlers:
+            handler.close()
+        super().close()
+
+class DeliveryPrefixWriter:
+    '''
+    Stands in for stdout while a batch runs. Lines printed for the delivery set in
+    'current_delivery' are prefixed with "[<rootdir>] " and written whole, so output
+    from deliveries running side by side doesn't interleave.
+    '''
+    def __init__(self, fp: TextIO) -> None:
+        self.fp = fp
+        self._partial = threading.local()
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        rootdir = current_delivery.get()
+        if rootdir is None:
+            with self._lock:
+                self.fp.write(text)
+            return len(text)
+        lines = (getattr(self._partial, "text", "") + text).split("\n")
+        self._partial.text = lines.pop()
+        if lines:
+            with self._lock:
+                self.fp.write("".join(f"[{rootdir}] {line}\n" for line in lines))
+                self.fp.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        with self._lock:
+            self.fp.flush()
+
+@dataclass
+class BatchResult:
+    rootdir: Path
+    status: str = "ok"
+    error: str = ""
+    elapsed: float = 0.0
+    steps: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+def summary(results: list[BatchResult]) -> str:
+    '''
+    A plain text table of every delivery's result, total and per step seconds
+    '''
+    headers = ["Delivery", "Result", "Seconds", "Steps", "Error"]
+    rows = []
+    for result in results:
+        steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result.steps.items())
+        rows.append([str(result.rootdir), result.status, f"{result.elapsed:.2f}", steps, result.error])
+    widths = [max(len(row[i]) for row in [headers, *rows]) for i in range(len(headers))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in [headers, *rows]]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    failed = sum(1 for result in results if not result.ok)
+    lines.append(f"{len(results)} deliveries, {len(results) - failed} ok, {failed} failed")
+    return "\n".join(lines)
@@ -0,0 +1,112 @@
+import json
+import hashlib
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .filesystem import LOCALFS, FileStat, FileSystem
+
+if TYPE_CHECKING:
+    from .media import Media
+
+BUILDCACHE_VERSION = 3
+
+def digest(obj: Any) -> str:
+    '''
+    Stable sha256 of any JSON serializable value, key order doesn't matter
+    '''
+    data = json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(data.encode("UTF-8")).hexdigest()
+
+def mediadeps(media: "Media") -> dict[str, str]:
+    '''
+    One digest per level of the Media's data, e.g. {"series data": ..., "episode data": ...},
+    so a rebuild can say which level changed. Child collections are left out, editing one
+    episode doesn't invalidate its siblings or parents.
+    '''
+    return {f"{str(data.get('mediatype')).lower()} data": digest(data) for data in media.lineage()}
+
+class BuildCache:
+    '''
+    Records what every generated output was built from, as named dependency digests,
+    so a rerun only rebuilds what changed. Targets are kept in groups ("mecs", "mmc").
+    Each rebuild's reasons are collected in 'reasons' as {target: [reason, ...]}.
+    With 'force' every target is stale. save() only writes when an entry changed.
+    '''
+    def __init__(self, path: Path, force: bool=False, fs: FileSystem=LOCALFS) -> None:
+        self.path = path
+        self.force = force
+        self.fs = fs
+        self.entries: dict[str, dict[str, dict]] = {}
+        self.reasons: dict[str, list[str]] = {}
+        self.dirty = False
+        self.load()
+
+    def load(self) -> None:
+        if not self.fs.is_file(self.path):
+            return
+        try:
+            data = json.loads(self.fs.read_bytes(self.path))
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != BUILDCACHE_VERSION:
+            return
+        entries = data.get("entries")
+        if isinstance(entries, dict):
+            self.entries = entries
+
+    def stale(self, group: str, target: str, deps: dict[str, str], output: Path | None=None) -> list[str]:
+        '''
+        Returns why 'target' needs rebuilding, an empty list means it's up to date.
+        If 'output' is given, the file must still match the stat recorded when it was built.
+        '''
+        entry = self.entries.get(group, {}).get(target)
+        reasons: list[str] = []
+        if self.force:
+            reasons.append("full rebuild requested")
+        elif entry is None:
+            reasons.append("not built before")
+        else:
+            recorded: dict[str, str] = entry.get("deps", {})
+            for name in sorted(deps.keys() | recorded.keys()):
+                if name not in recorded:
+                    reasons.append(f"{name} added")
+                elif name not in deps:
+                    reasons.append(f"{name} removed")
+                elif recorded[name] != deps[name]:
+                    reasons.append(f"{name} changed")
+            if output is not None:
+                try:
+                    stat = self.fs.stat(output)
+                except FileNotFoundError:
+                    reasons.append("output missing")
+                else:
+                    if entry.get("output") != self._key(stat):
+                        reasons.append("output modified")
+        if reasons:
+            self.reasons[target] = reasons
+        return reasons
+
+    def put(self, group: str, target: str, deps: dict[str, str], output: Path | None=None) -> None:
+        entry: dict[str, Any] = {"deps": deps}
+        if output is not None:
+            entry["output"] = self._key(self.fs.stat(output))
+        entries = self.entries.setdefault(group, {})
+        if entries.get(target) != entry:
+            entries[target] = entry
+            self.dirty = True
+
+    def prune(self, group: str, keep: set[str]) -> None:
+        entries = self.entries.get(group, {})
+        if any(k not in keep for k in entries):
+            self.entries[group] = {k:v for k,v in entries.items() if k in keep}
+            self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        data = json.dumps({"version": BUILDCACHE_VERSION, "entries": self.entries}, indent=1, sort_keys=True)
+        self.fs.write_bytes(self.path, data.encode("UTF-8"))
+        self.dirty = False
+
+    def _key(self, stat: FileStat) -> list[int]:
+        return [stat.st_size, stat.st_mtime_ns]
@@ -1,40 +1,364 @@
-import sys
-from concurrent import futures
-import subprocess as sub
+import io
+import os
+import json
+import shutil
+import hashlib
+import threading
 from pathlib import Path
+from typing import Iterator
+from dataclasses import dataclass, field, asdict
+
+from .progress import Progress
+from .profiler import PROFILER
+from .filesystem import LOCALFS, FileSystem
+from .scheduler import Scheduler
+from .readers import CHUNKSIZE, DEFAULT_READER, BufferPool, get_reader
+
+CACHE_VERSION = 1
+ALGORITHMS = ["md5"]
+HASH_METHODS = {
+    "md5": "MD5",
+    "sha1": "SHA-1",
+    "sha224": "SHA-224",
+    "sha256": "SHA-256",
+    "sha384": "SHA-384",
+    "sha512": "SHA-512",
+}
+
+def hashmethod(algorithm: str) -> str:
+    '''
+    Returns the MMC 'Hash method' value for a hashlib algorithm name
+    '''
+    return HASH_METHODS.get(algorithm, algorithm.upper())
+
+def manifestname(algorithm: str) -> str:
+    return f"checksums.{algorithm}"
+
+def itermanifest(path: Path, fs: FileSystem=LOCALFS) -> Iterator[tuple[str, str]]:
+    '''
+    Streams (filename, hash) pairs from a 'hash filename' manifest.
+    Filenames may contain spaces.
+    '''
+    with io.TextIOWrapper(fs.open(path, "rb"), encoding="UTF-8") as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            hash, _, name = line.partition(" ")
+            yield name, hash
+
+def readmanifest(path: Path, fs: FileSystem=LOCALFS) -> dict[str, str]:
+    '''
+    Parses a 'hash filename' manifest into {filename: hash}
+    '''
+    return dict(itermanifest(path, fs))
+
+class ChecksumTable:
+    '''
+    A checksum manifest parsed once into a case-insensitive {filename: hash} lookup
+    '''
+    def __init__(self, algorithm: str="md5", hashes: dict[str, str] | None=None) -> None:
+        self.algorithm = algorithm
+        self._hashes: dict[str, str] = {}
+        if hashes is not None:
+            for name, hash in hashes.items():
+                self._hashes[name.lower()] = hash
+
+    @classmethod
+    def read(cls, path: Path, algorithm: str="md5", fs: FileSystem=LOCALFS) -> "ChecksumTable":
+        table = cls(algorithm)
+        for name, hash in itermanifest(path, fs):
+            table._hashes[name.lower()] = hash
+        return table
+
+    def get(self, filename: str) -> str | None:
+        if PROFILER.enabled:
+            PROFILER.count("ChecksumTable.get")
+        return self._hashes.get(filename.lower())
+
+    def __contains__(self, filename: str) -> bool:
+        return filename.lower() in self._hashes
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+def writemanifest(path: Path, hashes: dict[str, str], fs: FileSystem=LOCALFS) -> bool:
+    '''
+    Writes a 'hash filename' manifest sorted by filename.
+    Returns False if the file already had identical contents and was left untouched.
+    '''
+    data = "".join(f"{hashes[name]} {name}\n" for name in sorted(hashes))
+    if fs.is_file(path):
+        with io.TextIOWrapper(fs.open(path, "rb"), encoding="UTF-8") as fp:
+            if fp.read() == data:
+                return False
+    fs.write_bytes(path, data.encode("UTF-8"))
+    return True
+
+@dataclass
+class Mismatch:
+    file: str
+    algorithm: str
+    expected: str
+    actual: str
+
+@dataclass
+class VerifyReport:
+    rootdir: str
+    algorithms: list[str]
+    checked: int = 0
+    missing: list[str] = field(default_factory=list)
+    extra: list[str] = field(default_factory=list)
+    mismatched: list[Mismatch] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not (self.missing or self.extra or self.mismatched)
+
+    def to_dict(self) -> dict:
+        report = asdict(self)
+        report["ok"] = self.ok
+        return report
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=4)
+
+class ChecksumCache:
+    '''
+    Remembers checksums between runs, keyed on filename, size, mtime_ns and inode.
+    A file whose stat signature is unchanged is never read again.
+    save() only writes when an entry changed.
+    '''
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        if not self.path.is_file():
+            return
+        try:
+            with open(self.path, "rb") as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return
+        entries = data.get("entries")
+        if isinstance(entries, dict):
+            self.entries = entries
+
+    def get(self, name: str, stat: os.stat_result, algorithms: list[str]=ALGORITHMS) -> dict[str, str] | None:
+        if PROFILER.enabled:
+            PROFILER.count("ChecksumCache.get")
+        with self._lock:
+            entry = self.entries.get(name)
+            if entry is not None and entry.get("key") == self._key(stat):
+                if all(algo in entry for algo in algorithms):
+                    self.hits += 1
+                    return {algo: entry[algo] for algo in algorithms}
+            self.misses += 1
+            return None
+
+    def put(self, name: str, stat: os.stat_result, digests: dict[str, str]) -> None:
+        key = self._key(stat)
+        with self._lock:
+            entry = self.entries.get(name)
+            if entry is None or entry.get("key") != key:
+                entry = {"key": key}
+                self.entries[name] = entry
+                self.dirty = True
+            if any(entry.get(algo) != digest for algo, digest in digests.items()):
+                entry.update(digests)
+                self.dirty = True
+
+    def prune(self, keep: set[str]) -> None:
+        with self._lock:
+            if any(k not in keep for k in self.entries):
+                self.entries = {k:v for k,v in self.entries.items() if k in keep}
+                self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        temppath = self.path.with_name(self.path.name + ".tmp")
+        with open(temppath, "w", encoding="UTF-8") as fp:
+            json.dump({"version": CACHE_VERSION, "entries": self.entries}, fp, indent=1, sort_keys=True)
+        os.replace(temppath, self.path)
+        self.dirty = False
+
+    def _key(self, stat: os.stat_result) -> list[int]:
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
 
 class MD5:
-    def __init__(self, rootdir: Path) -> None:
+    def __init__(self, rootdir: Path, chunksize: int=CHUNKSIZE, cache: ChecksumCache | None=None,
+                scheduler: Scheduler | None=None, algorithms: list[str]=ALGORITHMS,
+                reader: str=DEFAULT_READER, progress: Progress | None=None) -> None:
         self.rootdir = rootdir
+        self.chunksize = chunksize
+        self.cache = cache
+        self.scheduler = scheduler or Scheduler()
+        self.algorithms = self._validate_algorithms(algorithms)
+        self.reader = get_reader(reader, chunksize, BufferPool(chunksize))
+        self.progress = progress
+        self._verbose = True
 
     def run(self, verbose: bool=True) -> dict[str, str]:
-        if sys.platform != "darwin":
-            raise OSError("Checksums currently only supported on MacOS")
+        '''
+        Returns {filename: digest} for the first configured algorithm
+        '''
+        return self.run_all(verbose)[self.algorithms[0]]
+
+    def run_all(self, verbose: bool=True, names: set[str] | None=None) -> dict[str, dict[str, str]]:
+        '''
+        Returns {algorithm: {filename: digest}} for every configured algorithm.
+        Each file is read once regardless of how many algorithms are requested.
+        If 'names' is given, only those files are hashed.
+        '''
+        self._verbose = verbose
         resourcedir = self.rootdir / "resources"
-        files: list[Path] = []
+        files: list[tuple[Path, os.stat_result]] = []
+        filedigests: dict[str, dict[str, str]] = {}
         for item in resourcedir.iterdir():
             if not item.is_file() or item.name[0] == ".":
                 continue
-            files.append(item)
-        output: list[tuple[str, str]] = []
-        with futures.ThreadPoolExecutor() as executor:
-            checksums = [executor.submit(self._runprocess, file, verbose) for file in files]
-            for md5 in futures.as_completed(checksums):
-                output.append(md5.result())
-        hashdict: dict[str, str] = {}
-        for path, hash in output:
-            hash = hash.split(" ")[0]
-            hashdict[path] = hash
+            if names is not None and item.name not in names:
+                continue
+            stat = item.stat()
+            if self.cache is not None:
+                digests = self.cache.get(item.name, stat, self.algorithms)
+                if digests is not None:
+                    filedigests[item.name] = digests
+                    continue
+            files.append((item, stat))
+        tasks = self.scheduler.plan(files)
+        if self.progress is not None:
+            self.progress.start(sum(stat.st_size for _, stat in files), len(files))
+        with PROFILER.span("MD5.run_all", files=len(files)):
+            output = self.scheduler.run(tasks, self._runprocess)
+        if self.progress is not None:
+            self.progress.finish()
+        for path, digests in output:
+            filedigests[path] = digests
+        if self.cache is not None:
+            if names is None:
+                self.cache.prune(set(filedigests))
+            self.cache.save()
+        hashdict: dict[str, dict[str, str]] = {algo: {} for algo in self.algorithms}
+        for path, digests in filedigests.items():
+            for algo in self.algorithms:
+                hashdict[algo][path] = digests[algo]
         return hashdict
 
-    def _runprocess(self, file: Path, verbose: bool=True) -> tuple[str, str]:
+    def ingest(self, files: list[tuple[Path, os.stat_result]], destdir: Path, verbose: bool=True) -> dict[str, dict[str, str]]:
+        '''
+        Copies each source file into 'destdir' and hashes the copy stream, so the data
+        is only read once. Files are written to a hidden '.partial' temp file and renamed
+        into place when complete. Returns {filename: {algorithm: digest}}.
+        '''
+        self._verbose = verbose
+        tasks = self.scheduler.plan(files)
+        if self.progress is not None:
+            self.progress.start(sum(stat.st_size for _, stat in files), len(files))
+        output = self.scheduler.run(tasks, lambda src, stat: self._copyprocess(src, stat, destdir))
+        if self.progress is not None:
+            self.progress.finish()
+        if self.cache is not None:
+            self.cache.save()
+        return dict(output)
+
+    def _copyprocess(self, src: Path, stat: os.stat_result, destdir: Path) -> tuple[str, dict[str, str]]:
+        if self._verbose:
+            print(f"Ingesting: {src.name}...")
+        if self.progress is not None:
+            self.progress.file_start(src.name, stat.st_size)
+        dest = destdir / src.name
+        temp = destdir / f".{src.name}.partial"
+        try:
+            with PROFILER.span("MD5.copyfile", file=src.name, bytes=stat.st_size):
+                digests = self.copyfile(src, temp)
+            shutil.copystat(src, temp)
+            os.replace(temp, dest)
+        except OSError as e:
+            temp.unlink(missing_ok=True)
+            raise RuntimeError(f"{src.name}: {e}") from e
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+        if self.cache is not None:
+            self.cache.put(dest.name, dest.stat(), digests)
+        if self.progress is not None:
+            self.progress.file_done(src.name)
+        if self._verbose:
+            print(f"Ingest complete: {src.name}")
+        return dest.name, digests
+
+    def copyfile(self, src: Path, dest: Path) -> dict[str, str]:
+        '''
+        Copies 'src' to 'dest' while streaming it through every configured algorithm
+        '''
+        digests = [hashlib.new(algo) for algo in self.algorithms]
+        with open(dest, "wb", buffering=0) as fp:
+            for chunk in self.reader.chunks(src):
+                for digest in digests:
+                    digest.update(chunk)
+                written = 0
+                while written < len(chunk):
+                    written += fp.write(chunk[written:])
+                if self.progress is not None:
+                    self.progress.advance(src.name, len(chunk))
+            os.fsync(fp.fileno())
+        return {algo: digest.hexdigest() for algo, digest in zip(self.algorithms, digests)}
+
+    def _runprocess(self, file: Path, stat: os.stat_result) -> tuple[str, dict[str, str]]:
+        verbose = self._verbose
         if verbose:
             print(f"Running checksum: {file.name}...")
-        proc = sub.run(f"md5 -r {str(file)}", stdout=sub.PIPE, stderr=sub.PIPE, shell=True)
-        stdout = proc.stdout.decode("UTF-8").replace("\r\n", " ")
-        stderr = proc.stderr.decode("UTF-8").replace("\r\n", " ")
-        if stderr:
-            raise RuntimeError(f"{file.name}: {stderr}")
+        if self.progress is not None:
+            self.progress.file_start(file.name, stat.st_size)
+        try:
+            with PROFILER.span("MD5.hashfile", file=file.name, bytes=stat.st_size):
+                digests = self.hashfile(file)
+        except OSError as e:
+            raise RuntimeError(f"{file.name}: {e}") from e
+        if self.cache is not None:
+            self.cache.put(file.name, stat, digests)
+        if self.progress is not None:
+            self.progress.file_done(file.name)
         if verbose:
             print(f"Checksum complete: {file.name}")
-        return file.name, stdout
\ No newline at end of file
+        return file.name, digests
+
+    def hashfile(self, file: Path) -> dict[str, str]:
+        '''
+        Streams 'file' through every configured hashlib algorithm in 'chunksize' reads
+        using the configured read backend.
+        '''
+        digests = [hashlib.new(algo) for algo in self.algorithms]
+        for chunk in self.reader.chunks(file):
+            for digest in digests:
+                digest.update(chunk)
+            if self.progress is not None:
+                self.progress.advance(file.name, len(chunk))
+        return {algo: digest.hexdigest() for algo, digest in zip(self.algorithms, digests)}
+
+    def _validate_algorithms(self, algorithms: list[str]) -> list[str]:
+        validated: list[str] = []
+        for algo in algorithms:
+            algo = algo.lower().replace("-", "")
+            try:
+                digest_size = hashlib.new(algo).digest_size
+            except ValueError:
+                digest_size = 0
+            if not digest_size:
+                raise ValueError(f"Unsupported checksum algorithm: {algo}")
+            if algo not in validated:
+                validated.append(algo)
+        if not validated:
+            raise ValueError("At least one checksum algorithm is required")
+        return validated
@@ -0,0 +1,88 @@
+import json
+from pathlib import Path
+from collections.abc import Sequence
+
+from .errors import JSONParsingError
+from .profiler import PROFILER
+from .filesystem import FileStat, FileSystem, LOCALFS
+
+# Where write_sharded() puts the season files, relative to data/
+SHARDDIR = "seasons"
+
+class SeasonShards(Sequence):
+    '''
+    The seasons of a sharded data.json, whose series lists them as files relative to data/
+    (e.g. "seasons/SHOW_S1.json"), each holding one season with its episodes. A season file
+    is only parsed when that season is first used, 'stats' holds each file's stat from just
+    before it was read. Seasons written inline are returned as they are, so one series can mix both.
+    '''
+    def __init__(self, datadir: Path, entries: list[str | dict], fs: FileSystem=LOCALFS) -> None:
+        self.datadir = datadir
+        self.fs = fs
+        self.names: list[str | None] = [entry if isinstance(entry, str) else None for entry in entries]
+        self._seasons: list[dict | None] = [entry if isinstance(entry, dict) else None for entry in entries]
+        self.stats: dict[str, FileStat] = {}
+
+    @property
+    def loaded(self) -> int:
+        return sum(1 for season in self._seasons if season is not None)
+
+    def __len__(self) -> int:
+        return len(self._seasons)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        season = self._seasons[index]
+        if season is None:
+            season = self._seasons[index] = self._load(self.names[index])
+        return season
+
+    def _load(self, name: str | None) -> dict:
+        if name is None:
+            raise JSONParsingError("A season must be an object or the name of its file")
+        path = self.datadir / name
+        if not self.fs.is_file(path):
+            raise FileNotFoundError(f"Unable to locate season file {name}")
+        self.stats[name] = self.fs.stat(path)
+        with PROFILER.span("SeasonShards.load", file=name), self.fs.open(path, "rb") as fp:
+            season = json.load(fp)
+        if not isinstance(season, dict):
+            raise JSONParsingError(f"{name} must hold a single season object")
+        return season
+
+def read_data(datadir: Path, fs: FileSystem=LOCALFS) -> dict:
+    '''
+    Parses data/data.json. When the series' seasons are listed as files,
+    they're returned as a SeasonShards that reads each one on first use.
+    '''
+    with fs.open(datadir / "data.json", "rb") as fp:
+        data = json.load(fp)
+    if not isinstance(data, dict):
+        raise JSONParsingError("data.json must hold an object")
+    series = data.get("series")
+    seasons = series.get("seasons") if isinstance(series, dict) else None
+    if isinstance(seasons, list) and any(isinstance(season, str) for season in seasons):
+        series["seasons"] = SeasonShards(datadir, seasons, fs)
+    return data
+
+def write_sharded(data: dict, datadir: Path, fs: FileSystem=LOCALFS) -> list[Path]:
+    '''
+    Writes 'data' as a sharded data.json: every season to data/seasons/<season id>.json
+    and data.json listing those files. Returns the paths written.
+    '''
+    series = dict(data["series"])
+    fs.mkdir(datadir / SHARDDIR)
+    written: list[Path] = []
+    names: list[str] = []
+    for number, season in enumerate(series.get("seasons", []), 1):
+        name = f"{SHARDDIR}/{season.get('id') or number}.json"
+        if name in names:
+            raise ValueError(f"Seasons with the same id: {name}")
+        fs.write_bytes(datadir / name, json.dumps(season, indent=4, ensure_ascii=False).encode("UTF-8"))
+        names.append(name)
+        written.append(datadir / name)
+    series["seasons"] = names
+    fs.write_bytes(datadir / "data.json", json.dumps({**data, "series": series}, indent=4, ensure_ascii=False).encode("UTF-8"))
+    written.append(datadir / "data.json")
+    return written
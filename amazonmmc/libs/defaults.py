@@ -0,0 +1,9 @@
+# Option defaults and choices the command line needs, kept apart from the modules that
+# use them (watch.py loads ctypes/inotify, readers.py mmap and threading) so parsing
+# arguments doesn't import those.
+
+# Seconds without changes before --watch updates the delivery
+DEBOUNCE = 2.0
+# --read-backend choices, see readers.READERS
+READER_NAMES = ("readinto", "fadvise", "mmap", "threaded")
+DEFAULT_READER = "readinto"
@@ -1,26 +1,101 @@
+import io
+import os
 import json
+import time
+import hashlib
+import logging
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Union
+from concurrent import futures
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Iterable, Sequence, Union
 from xml.etree import ElementTree as ET
 
 from . import errors
 from .mmc import MMC
-from .media import Media
-from .checksums import MD5
+from .media import Media, ResourceIndex
+from .scheduler import Scheduler
+from .progress import Progress
+from .profiler import PROFILER
+from .filesystem import LOCALFS, FileStat, FileSystem, LocalFileSystem, MemoryFileSystem
+from .datafile import SeasonShards, read_data
+from .readers import DEFAULT_READER
+from .checksums import MD5, ChecksumCache, ChecksumTable, VerifyReport, Mismatch, ALGORITHMS, manifestname, readmanifest, writemanifest
 from .enums import WorkTypes
 from .mec import MEC, MECEpisodic
+from .buildcache import BuildCache, mediadeps
+from .xmlhelpers import indent, tobytes
 
 if TYPE_CHECKING:
     from .mec import MECGroup
 
 class Delivery:
-    def __init__(self, rootpath: str|Path) -> None:
+    '''
+    With 'buildcache', MECs and the MMC are only rebuilt when what they were built
+    from changed, see data/build.cache.json. 'rebuild' rebuilds everything and refreshes the cache.
+    Everything except hashing is read from and written to 'fs', see from_memory().
+    '''
+    def __init__(self, rootpath: str|Path, algorithms: list[str] | None=None, buildcache: bool=True,
+                 rebuild: bool=False, fs: FileSystem=LOCALFS) -> None:
         self.rootdir = Path(rootpath)
+        self.fs = fs
+        self.algorithms = self._algorithms(algorithms)
         self.resourcedir = self.rootdir / "resources"
-        self.data: dict = self._scandir()
+        self._scandir()
         self.worktype = WorkTypes.UNKNOWN
+        self.usebuildcache = buildcache
+        self.rebuild = rebuild
         self._mecgroup: Union["MECGroup", None] = None
         self._mmc: MMC | None = None
+        self._buildcache: BuildCache | None = None
+        self._checksumcache: ChecksumCache | None = None
+        self._data: dict | None = None
+        self._datastat: FileStat | None = None
+
+    @classmethod
+    def from_memory(cls, data: dict, resources: Iterable[str], checksums: dict[str, dict[str, str]] | None=None,
+                    algorithms: list[str] | None=None, buildcache: bool=False) -> "Delivery":
+        '''
+        A Delivery held in a MemoryFileSystem, nothing is read from or written to disk.
+        'data' is the contents of data.json, 'resources' the resource filenames and 'checksums'
+        {algorithm: {filename: hash}} of those resources. See render() for the output.
+        '''
+        fs = MemoryFileSystem()
+        rootdir = Path("/delivery")
+        fs.mkdir(rootdir / "data")
+        fs.mkdir(rootdir / "resources")
+        fs.write_bytes(rootdir / "data" / "data.json", json.dumps(data, ensure_ascii=False).encode("UTF-8"))
+        for name in resources:
+            fs.write_bytes(rootdir / "resources" / name, b"")
+        for algo, hashes in (checksums or {}).items():
+            writemanifest(rootdir / "data" / manifestname(algo), hashes, fs)
+        return cls(rootdir, algorithms, buildcache=buildcache, fs=fs)
+
+    @property
+    def data(self) -> dict:
+        '''
+        The contents of data.json, parsed on first use. The seasons of a sharded
+        data.json are each parsed when first used, see SeasonShards.
+        '''
+        if self._data is None:
+            with PROFILER.span("Delivery.read_data"):
+                # Stat first, an edit made while reading then shows up as a change
+                self._datastat = self.fs.stat(self.rootdir / "data" / "data.json")
+                self._data = read_data(self.rootdir / "data", self.fs)
+        return self._data
+
+    def datastats(self) -> dict[Path, FileStat]:
+        '''
+        The stat of data.json and of every season file read so far, each taken just before
+        it was read, so a Delivery kept between runs can tell if what it parsed is outdated
+        '''
+        stats: dict[Path, FileStat] = {}
+        if self._data is None or self._datastat is None:
+            return stats
+        stats[self.rootdir / "data" / "data.json"] = self._datastat
+        series = self._data.get("series")
+        if isinstance(series, dict) and isinstance(series.get("seasons"), SeasonShards):
+            shards: SeasonShards = series["seasons"]
+            stats.update({shards.datadir / name: stat for name, stat in shards.stats.items()})
+        return stats
 
     @property
     def mecs(self) -> "MECGroup":
@@ -34,48 +109,277 @@ class Delivery:
             self._mmc = self._build_mmc()
         return self._mmc
 
-    def checksums(self) -> None:
+    @property
+    def buildcache(self) -> BuildCache | None:
+        if self._buildcache is None and self.usebuildcache:
+            self._buildcache = BuildCache(self.rootdir / "data" / "build.cache.json", self.rebuild, self.fs)
+        return self._buildcache
+
+    @property
+    def checksumcache(self) -> ChecksumCache:
+        if self._checksumcache is None:
+            self._checksumcache = ChecksumCache(self.rootdir / "data" / "checksums.cache.json")
+        return self._checksumcache
+
+    def reload(self, rebuild: bool=False) -> None:
+        '''
+        Drops data.json and the MECs and MMC built from it, for a Delivery kept between runs.
+        They're read again on use. The build and checksum caches are kept, they check their own entries.
+        '''
+        self._scandir()
+        self._data = None
+        self._datastat = None
+        self.worktype = WorkTypes.UNKNOWN
+        self.rebuild = rebuild
+        self._mecgroup = None
+        self._mmc = None
+        if self._buildcache is not None:
+            self._buildcache.force = rebuild
+
+    def pop_rebuilds(self) -> dict[str, list[str]]:
+        '''
+        Returns {target: [reason, ...]} for everything rebuilt since the last call
+        '''
+        if self._buildcache is None:
+            return {}
+        reasons = self._buildcache.reasons
+        self._buildcache.reasons = {}
+        return reasons
+
+    def checksums(self, jobs: int | None=None, devicejobs: int | None=None, reader: str=DEFAULT_READER,
+                  progress: Progress | None=None, scheduler: Scheduler | None=None) -> None:
+        '''
+        Pass a shared 'scheduler' to hash several deliveries on one worker pool,
+        'jobs' and 'devicejobs' are then ignored.
+        '''
+        self._assertlocal()
         self._mecs_exist(assertexist=True)
-        hashes: dict[str, str] = MD5(self.rootdir).run()
-        md5path = self.rootdir / "data" / "checksums.md5"
-        with open(md5path, "w") as fp:
-            for path, hash in hashes.items():
-                fp.write(f"{hash} {path}\n")
-
-    def write_mecs(self) -> None:
-        self.mecs.generate()
-        for m in self.mecs.all:
+        cache = self.checksumcache
+        cache.hits = cache.misses = 0
+        scheduler = scheduler or Scheduler(jobs, devicejobs)
+        md5 = MD5(self.rootdir, cache=cache, scheduler=scheduler, algorithms=self.algorithms,
+                  reader=reader, progress=progress)
+        allhashes: dict[str, dict[str, str]] = md5.run_all(verbose=progress is None)
+        for algo, hashes in allhashes.items():
+            writemanifest(self.rootdir / "data" / manifestname(algo), hashes)
+        msg = f"Checksum cache: {cache.hits} hits, {cache.misses} misses"
+        print(msg)
+        logging.info(msg)
+        report = scheduler.report()
+        print(report)
+        logging.info(report)
+
+    def ingest(self, sources: list[Path], jobs: int | None=None, devicejobs: int | None=None,
+               reader: str=DEFAULT_READER, progress: Progress | None=None, overwrite: bool=False,
+               scheduler: Scheduler | None=None) -> dict[str, dict[str, str]]:
+        '''
+        Copies source files (or the files inside source directories) into resources/,
+        hashing them from the copy stream. The hashes are merged straight into the
+        checksum manifests and cache so they're never read a second time.
+        '''
+        self._assertlocal()
+        files: dict[str, tuple[Path, os.stat_result]] = {}
+        for source in self._ingest_sources(sources):
+            if source.name in files:
+                raise FileExistsError(f"Multiple ingest sources named {source.name}")
+            if not overwrite and (self.resourcedir / source.name).exists():
+                raise FileExistsError(f"Resource already exists: {source.name}")
+            files[source.name] = (source, source.stat())
+        scheduler = scheduler or Scheduler(jobs, devicejobs)
+        md5 = MD5(self.rootdir, cache=self.checksumcache, scheduler=scheduler, algorithms=self.algorithms,
+                  reader=reader, progress=progress)
+        copied = md5.ingest(list(files.values()), self.resourcedir, verbose=progress is None)
+        for algo in self.algorithms:
+            manifestpath = self.rootdir / "data" / manifestname(algo)
+            hashes = readmanifest(manifestpath) if manifestpath.is_file() else {}
+            for name, digests in sorted(copied.items()):
+                hashes[name] = digests[algo]
+            writemanifest(manifestpath, hashes)
+        logging.info(scheduler.report())
+        return copied
+
+    def verify(self, jobs: int | None=None, devicejobs: int | None=None, reader: str=DEFAULT_READER,
+               progress: Progress | None=None, scheduler: Scheduler | None=None) -> VerifyReport:
+        '''
+        Re-hashes every resource listed in the checksum manifests and compares
+        the results against them. Nothing is read from the checksum cache.
+        '''
+        self._assertlocal()
+        started = time.perf_counter()
+        self._md5exists(assertexists=True)
+        report = VerifyReport(str(self.rootdir), list(self.algorithms))
+        expected = {algo: readmanifest(self.rootdir / "data" / manifestname(algo)) for algo in self.algorithms}
+        listed: set[str] = set()
+        for hashes in expected.values():
+            listed.update(hashes)
+        ondisk: set[str] = set()
+        for item in self.resourcedir.iterdir():
+            if item.is_file() and item.name[0] != ".":
+                ondisk.add(item.name)
+        report.missing = sorted(listed - ondisk)
+        report.extra = sorted(ondisk - listed)
+
+        scheduler = scheduler or Scheduler(jobs, devicejobs)
+        md5 = MD5(self.rootdir, scheduler=scheduler, algorithms=self.algorithms, reader=reader, progress=progress)
+        actual = md5.run_all(verbose=False, names=listed & ondisk)
+        for algo in self.algorithms:
+            for name, hash in sorted(actual[algo].items()):
+                expectedhash = expected[algo].get(name)
+                if expectedhash is None:
+                    report.missing.append(f"{name} ({manifestname(algo)})")
+                elif expectedhash.lower() != hash:
+                    report.mismatched.append(Mismatch(name, algo, expectedhash, hash))
+        report.checked = len(actual[self.algorithms[0]])
+        report.elapsed = round(time.perf_counter() - started, 3)
+        logging.info(scheduler.report())
+        return report
+
+    def write_mecs(self, jobs: int | None=None, executor: futures.Executor | None=None) -> list[str]:
+        '''
+        Returns the names of the MECs whose contents changed, identical files are not rewritten.
+        With the build cache only MECs whose Media data changed (or whose file is missing or
+        was modified) are rebuilt. With 'jobs' > 1 the MECs are built and serialized in that
+        many worker processes, or on 'executor' if one is shared between deliveries.
+        '''
+        cache = self.buildcache
+        mecs = self.mecs.all
+        deps: dict[str, dict[str, str]] = {}
+        if cache is not None:
+            deps = {m.outputname: mediadeps(m.media) for m in mecs}
+            mecs = [m for m in mecs if cache.stale("mecs", m.outputname, deps[m.outputname], self.resourcedir / m.outputname)]
+        changed: list[str] = []
+        for m, data in self._render_mecs(mecs, jobs, executor):
             fullpath = self.resourcedir / m.outputname
-            self.write_xml(m.rootelem, fullpath)
+            if self._write_if_changed(fullpath, data):
+                changed.append(m.outputname)
+            if cache is not None:
+                cache.put("mecs", m.outputname, deps[m.outputname], fullpath)
+        if cache is not None:
+            cache.prune("mecs", set(deps))
+            cache.save()
+        return changed
+
+    def write_mmc(self, stream: bool=False) -> bool:
+        '''
+        With 'stream' the MMC is written element by element instead of being built
+        as one tree, keeping memory flat for very large series. With the build cache the
+        MMC is only generated when something it's built from changed, and then in full.
+        Returns False if the existing MMC was already identical and left untouched.
+        '''
+        if self.buildcache is not None:
+            return self._write_mmc_cached(self.buildcache, stream)
+        return self._write_mmc(stream)
+
+    def render_mecs(self, jobs: int | None=None, executor: futures.Executor | None=None) -> dict[str, bytes]:
+        '''
+        {output name: bytes} of every MEC, exactly as write_mecs() would write them.
+        Nothing is written and the build cache isn't used.
+        '''
+        return {m.outputname: data for m, data in self._render_mecs(self.mecs.all, jobs, executor)}
+
+    def render_mmc(self, checksums: dict[str, ChecksumTable] | None=None) -> bytes:
+        '''
+        The MMC's bytes, exactly as write_mmc() would write them. Nothing is written.
+        'checksums' default to the manifests in data/, which must include every MEC.
+        '''
+        return tobytes(self._build_mmc(checksums).generate())
+
+    def render(self, jobs: int | None=None, executor: futures.Executor | None=None) -> dict[str, bytes]:
+        '''
+        {output name: bytes} of every MEC and then the MMC, without writing anything.
+        The MECs' checksums are computed from their bytes, every other resource's
+        must be in the checksum manifests.
+        '''
+        outputs = self.render_mecs(jobs, executor)
+        checksums: dict[str, ChecksumTable] = {}
+        datadir = self.rootdir / "data"
+        for algo in self.algorithms:
+            manifestpath = datadir / manifestname(algo)
+            hashes = readmanifest(manifestpath, self.fs) if self.fs.is_file(manifestpath) else {}
+            for name, data in outputs.items():
+                hashes[name] = hashlib.new(algo, data).hexdigest()
+            checksums[algo] = ChecksumTable(algo, hashes)
+        mmc = self._build_mmc(checksums)
+        outputs[mmc.outputname] = tobytes(mmc.generate())
+        return outputs
 
-    def write_mmc(self) -> None:
+    def _render_mecs(self, mecs: list[MEC], jobs: int | None=None,
+                     executor: futures.Executor | None=None) -> list[tuple[MEC, bytes]]:
+        if executor is not None or (jobs is not None and jobs > 1):
+            return self.mecs.render(jobs or 1, mecs, executor)
+        with PROFILER.span("MECEpisodic.generate"):
+            self.mecs.generate(mecs)
+        return [(m, tobytes(m.rootelem)) for m in mecs]
+
+    def _write_mmc(self, stream: bool) -> bool:
+        if stream:
+            self.mmc.prepare(stream=True)
+            fullpath = self.rootdir / self.mmc.outputname
+            return self._stream_if_changed(fullpath, self.mmc.stream)
         self.mmc.generate()
         fullpath = self.rootdir / self.mmc.outputname
-        self.write_xml(self.mmc.rootelem, fullpath)
+        return self.write_xml(self.mmc.rootelem, fullpath)
+
+    def _write_mmc_cached(self, cache: BuildCache, stream: bool) -> bool:
+        # A fresh MMC, so the checksums are read again for a Delivery kept between runs
+        self._mmc = self._build_mmc()
+        deps = self.mmc.dependencies()
+        fullpath = self.rootdir / self.mmc.outputname
+        if not cache.stale("mmc", self.mmc.outputname, deps, fullpath):
+            return False
+        written = self._write_mmc(stream)
+        cache.put("mmc", self.mmc.outputname, deps, fullpath)
+        cache.prune("mmc", {self.mmc.outputname})
+        cache.save()
+        return written
 
     def indent(self, elem: ET.Element, level: int=0, spaces: int=4) -> None:
         '''
         Adds newlines and tabs to xml so it's not all on 1 line.
         Pass the root element into 'elem'
         '''
-        i = "\n" + level*(" "*spaces)
-        if len(elem):
-            if not elem.text or not elem.text.strip():
-                elem.text = i + (" "*spaces)
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-            for elem in elem:
-                self.indent(elem, level+1)
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-        else:
-            if level and (not elem.tail or not elem.tail.strip()):
-                elem.tail = i
+        indent(elem, level, spaces)
+
+    def write_xml(self, root: ET.Element, outputpath, encodingtype="UTF-8", xmldecl=True) -> bool:
+        '''
+        Writes 'root' unless 'outputpath' already holds the same bytes.
+        Returns True if the file was written.
+        '''
+        return self._write_if_changed(Path(outputpath), tobytes(root, encodingtype, xmldecl))
+
+    def _write_if_changed(self, outputpath: Path, data: bytes) -> bool:
+        with PROFILER.span("Delivery._write_if_changed", file=outputpath.name):
+            if self._samecontent(outputpath, len(data), hashlib.sha256(data).digest()):
+                return False
+            self.fs.write_bytes(outputpath, data)
+            return True
+
+    def _stream_if_changed(self, outputpath: Path, writefunc: Callable[[BinaryIO], None]) -> bool:
+        temppath = outputpath.with_name(f".{outputpath.name}.tmp")
+        try:
+            with PROFILER.span("Delivery._stream_if_changed", file=outputpath.name), self.fs.open(temppath, "wb") as fp:
+                writer = _DigestWriter(fp)
+                writefunc(writer)
+            if self._samecontent(outputpath, writer.size, writer.digest.digest()):
+                self.fs.unlink(temppath)
+                return False
+            self.fs.replace(temppath, outputpath)
+        except BaseException:
+            self.fs.unlink(temppath, missing_ok=True)
+            raise
+        return True
 
-    def write_xml(self, root: ET.Element, outputpath, encodingtype="UTF-8", xmldecl=True) -> None:
-        self.indent(root)
-        tree = ET.ElementTree(root)
-        tree.write(outputpath, encoding=encodingtype, xml_declaration=xmldecl)
+    def _samecontent(self, path: Path, size: int, digest: bytes) -> bool:
+        try:
+            if self.fs.stat(path).st_size != size:
+                return False
+        except FileNotFoundError:
+            return False
+        existing = hashlib.sha256()
+        with self.fs.open(path, "rb") as fp:
+            while chunk := fp.read(1024 * 1024):
+                existing.update(chunk)
+        return existing.digest() == digest
 
     def _build_mecs(self) -> "MECGroup":
         general: dict = self._assertexists(self.data, "general")
@@ -83,16 +387,18 @@ class Delivery:
         worktype = WorkTypes.get_int(worktype_str)
         if worktype == WorkTypes.EPISODIC:
             self.worktype = WorkTypes.EPISODIC
-            return self._mec_episodic()
+            with PROFILER.span("Delivery._mec_episodic"):
+                return self._mec_episodic()
         else:
             raise NotImplementedError("Only episodic workflows are currently supported")
 
-    def _build_mmc(self) -> MMC:
-        self._md5exists(True)
+    def _build_mmc(self, checksums: dict[str, ChecksumTable] | None=None) -> MMC:
+        if checksums is None:
+            self._md5exists(True)
         if self._mecgroup is None:
             self._mecgroup = self._build_mecs()
         if self.worktype == WorkTypes.EPISODIC:
-            mmc = MMC(self.worktype, self.rootdir, self._mecgroup)
+            mmc = MMC(self.worktype, self.rootdir, self._mecgroup, self.algorithms, checksums, self.fs)
             return mmc
         else:
             raise NotImplementedError("Only episodic workflows are currently supported")
@@ -100,7 +406,7 @@ class Delivery:
     def _mec_episodic(self) -> MECEpisodic:
         general_data: dict = self._assertexists(self.data, "general")
         series_data: dict = self._assertexists(self.data, "series")
-        general_media = Media(self.resourcedir, general_data)
+        general_media = Media(self.resourcedir, general_data, index=ResourceIndex(self.resourcedir, self.fs))
         series_media = Media(self.resourcedir, series_data, general_media)
         series_mec = MEC(series_media)
 
@@ -108,7 +414,7 @@ class Delivery:
         allseasons_mec: dict[MEC, list[MEC]] = {}
         allepisodes_mec: list[MEC] = []
 
-        season_data: list[dict] = self._assertexists(series_data, "seasons")
+        season_data: Sequence[dict] = self._assertexists(series_data, "seasons")
         for season in season_data:
             season_media = Media(self.resourcedir, season, series_media)
             season_mec = MEC(season_media)
@@ -132,31 +438,54 @@ class Delivery:
             episodes=allepisodes_mec
         )
 
-    def _scandir(self) -> dict:
+    def _scandir(self) -> None:
         datadir = self.rootdir / "data"
-        if not datadir.is_dir():
+        if not self.fs.is_dir(datadir):
             raise FileNotFoundError("Unable to locate data folder")
         datapath = datadir / "data.json"
-        if not datapath.is_file():
+        if not self.fs.is_file(datapath):
             raise FileNotFoundError("Unable to locate data.json")
-        if not self.resourcedir.is_dir():
+        if not self.fs.is_dir(self.resourcedir):
             raise FileNotFoundError("Unable to locate resources folder")
-        with open(datapath, "rb") as fp:
-            data = json.load(fp)
-        return data
     
+    def _ingest_sources(self, sources: list[Path]) -> list[Path]:
+        files: list[Path] = []
+        for source in sources:
+            source = Path(source)
+            if source.is_dir():
+                files.extend(sorted(item for item in source.iterdir() if item.is_file() and item.name[0] != "."))
+            elif source.is_file():
+                files.append(source)
+            else:
+                raise FileNotFoundError(f"Unable to locate ingest source: {source}")
+        return files
+
     def _md5exists(self, assertexists: bool=False) -> bool:
         datadir = self.rootdir / "data"
-        checksums = datadir / "checksums.md5"
-        exists = checksums.is_file()
-        if not exists and assertexists:
-            raise FileNotFoundError("Unable to locate checksums.md5 in data directory")
-        return exists
+        for algo in self.algorithms:
+            name = manifestname(algo)
+            if not self.fs.is_file(datadir / name):
+                if assertexists:
+                    raise FileNotFoundError(f"Unable to locate {name} in data directory")
+                return False
+        return True
+
+    def _assertlocal(self) -> None:
+        if not isinstance(self.fs, LocalFileSystem):
+            raise NotImplementedError("Hashing needs resources on a local filesystem, "
+                                      "pass their checksums to Delivery.from_memory() instead")
+
+    def _algorithms(self, algorithms: list[str] | None) -> list[str]:
+        # MD5 is always produced, it's the checksum Amazon requires
+        if algorithms is None:
+            return list(ALGORITHMS)
+        algorithms = [algo.lower().replace("-", "") for algo in algorithms]
+        return ["md5"] + [algo for algo in algorithms if algo != "md5"]
 
     def _mecs_exist(self, assertexist: bool=False) -> bool:
         missing: list[str] = []
         for mec in self.mecs.all:
-            if not (self.resourcedir / mec.outputname).is_file():
+            if not self.fs.is_file(self.resourcedir / mec.outputname):
                 if assertexist:
                     missing.append(mec.outputname)
                 else:
@@ -172,4 +501,21 @@ class Delivery:
             if context is not None:
                 msg += f" in {context}"
             raise LookupError(msg)
-        return value
\ No newline at end of file
+        return value
+
+class _DigestWriter(io.RawIOBase):
+    '''
+    Passes writes through to 'fp' while hashing them
+    '''
+    def __init__(self, fp: BinaryIO) -> None:
+        self.fp = fp
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        return self.fp.write(data)
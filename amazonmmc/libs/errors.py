@@ -3,14 +3,22 @@ class JSONParsingError(Exception):
         super().__init__(msg)
 
 class ResourceError(Exception):
-    def __init__(self, unknowns: list[str]=..., msg: str=...) -> None:
-        if unknowns is not ...:
+    def __init__(self, unknowns: list[str]=..., msg: str=...,
+                duplicates: dict[str, list[str]]=..., missing: list[str]=...) -> None:
+        self.unknowns = [] if unknowns is ... else unknowns
+        self.duplicates = {} if duplicates is ... else duplicates
+        self.missing = [] if missing is ... else missing
+        if unknowns is not ... or duplicates is not ... or missing is not ...:
             finalmsg = "\n"
-            for unknown in unknowns:
+            for unknown in self.unknowns:
                 if msg is not ...:
                     finalmsg += f"{msg}{unknown}\n"
                 else:
                     finalmsg += f"Unknown Resource: {unknown}\n"
+            for resource, claimants in self.duplicates.items():
+                finalmsg += f"Resource claimed by multiple MECs: {resource} ({', '.join(claimants)})\n"
+            for expected in self.missing:
+                finalmsg += f"Missing Resource: {expected}\n"
         elif msg is not ...:
             finalmsg = msg
         else:
@@ -26,4 +34,11 @@ class MD5Error(Exception):
         else:
             if msg is ...:
                 msg = ""
-        super().__init__(msg)
\ No newline at end of file
+        super().__init__(msg)
+
+class ServerBusy(Exception):
+    def __init__(self, waiting: int=...) -> None:
+        if waiting is ...:
+            super().__init__("Server busy")
+        else:
+            super().__init__(f"Server busy: {waiting} jobs already waiting")
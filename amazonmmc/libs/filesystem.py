@@ -0,0 +1,186 @@
+import io
+import os
+import time
+import threading
+from pathlib import Path
+from typing import BinaryIO
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+@dataclass(frozen=True)
+class FileStat:
+    st_size: int
+    st_mtime_ns: int
+
+class FileSystem(ABC):
+    '''
+    Where a Delivery reads data.json and the checksum manifests, lists its resources
+    and writes its xml, manifests and caches. Hashing, verifying and ingesting read
+    media directly and need a LocalFileSystem.
+    '''
+    @abstractmethod
+    def listfiles(self, dirpath: Path) -> list[str]:
+        '''
+        Names of the regular files in 'dirpath', in no particular order
+        '''
+
+    @abstractmethod
+    def is_file(self, path: Path) -> bool:...
+
+    @abstractmethod
+    def is_dir(self, path: Path) -> bool:...
+
+    @abstractmethod
+    def mkdir(self, path: Path) -> None:
+        '''
+        Creates 'path' and its parents, if they don't exist
+        '''
+
+    @abstractmethod
+    def stat(self, path: Path) -> FileStat:
+        '''
+        Raises FileNotFoundError if 'path' doesn't exist
+        '''
+
+    @abstractmethod
+    def open(self, path: Path, mode: str="rb") -> BinaryIO:
+        '''
+        'rb' or 'wb'. How soon readers see a write depends on the backend: on disk 'wb'
+        truncates 'path' straight away, in memory the contents appear when closed.
+        Use write_bytes(), or write a temp file and replace(), to swap 'path' in whole.
+        '''
+
+    @abstractmethod
+    def replace(self, src: Path, dst: Path) -> None:...
+
+    @abstractmethod
+    def unlink(self, path: Path, missing_ok: bool=False) -> None:...
+
+    def read_bytes(self, path: Path) -> bytes:
+        with self.open(path, "rb") as fp:
+            return fp.read()
+
+    def write_bytes(self, path: Path, data: bytes) -> None:
+        '''
+        Writes to a hidden temp file renamed over 'path', readers never see a partial file
+        '''
+        temppath = path.with_name(f".{path.name}.tmp")
+        with self.open(temppath, "wb") as fp:
+            fp.write(data)
+        self.replace(temppath, path)
+
+class LocalFileSystem(FileSystem):
+    def listfiles(self, dirpath: Path) -> list[str]:
+        with os.scandir(dirpath) as entries:
+            return [entry.name for entry in entries if entry.is_file()]
+
+    def is_file(self, path: Path) -> bool:
+        return path.is_file()
+
+    def is_dir(self, path: Path) -> bool:
+        return path.is_dir()
+
+    def mkdir(self, path: Path) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+
+    def stat(self, path: Path) -> FileStat:
+        stat = path.stat()
+        return FileStat(stat.st_size, stat.st_mtime_ns)
+
+    def open(self, path: Path, mode: str="rb") -> BinaryIO:
+        if mode not in ("rb", "wb"):
+            raise ValueError(f"Unsupported mode: {mode}")
+        return open(path, mode)
+
+    def replace(self, src: Path, dst: Path) -> None:
+        os.replace(src, dst)
+
+    def unlink(self, path: Path, missing_ok: bool=False) -> None:
+        path.unlink(missing_ok=missing_ok)
+
+class MemoryFileSystem(FileSystem):
+    '''
+    Files held as bytes in 'files', keyed by path. Directories exist once created with
+    mkdir() or once they hold a file. Safe to share between threads.
+    '''
+    def __init__(self, files: dict[str|Path, bytes] | None=None) -> None:
+        self.files: dict[Path, bytes] = {}
+        self.dirs: set[Path] = set()
+        self._mtimes: dict[Path, int] = {}
+        self._lastmtime = 0
+        self._lock = threading.Lock()
+        for path, data in (files or {}).items():
+            self._store(Path(path), data)
+
+    def mkdir(self, path: str|Path) -> None:
+        path = Path(path)
+        with self._lock:
+            self.dirs.add(path)
+            self.dirs.update(path.parents)
+
+    def listfiles(self, dirpath: Path) -> list[str]:
+        if not self.is_dir(dirpath):
+            raise FileNotFoundError(f"No such directory: {dirpath}")
+        with self._lock:
+            return [path.name for path in self.files if path.parent == dirpath]
+
+    def is_file(self, path: Path) -> bool:
+        return path in self.files
+
+    def is_dir(self, path: Path) -> bool:
+        return path in self.dirs
+
+    def stat(self, path: Path) -> FileStat:
+        with self._lock:
+            if path not in self.files:
+                raise FileNotFoundError(f"No such file: {path}")
+            return FileStat(len(self.files[path]), self._mtimes[path])
+
+    def open(self, path: Path, mode: str="rb") -> BinaryIO:
+        if mode == "rb":
+            with self._lock:
+                if path not in self.files:
+                    raise FileNotFoundError(f"No such file: {path}")
+                return io.BytesIO(self.files[path])
+        if mode == "wb":
+            if not self.is_dir(path.parent):
+                raise FileNotFoundError(f"No such directory: {path.parent}")
+            return _MemoryWriter(self, path)
+        raise ValueError(f"Unsupported mode: {mode}")
+
+    def replace(self, src: Path, dst: Path) -> None:
+        with self._lock:
+            if src not in self.files:
+                raise FileNotFoundError(f"No such file: {src}")
+            self.files[dst] = self.files.pop(src)
+            self._mtimes[dst] = self._mtimes.pop(src)
+
+    def unlink(self, path: Path, missing_ok: bool=False) -> None:
+        with self._lock:
+            if path not in self.files:
+                if missing_ok:
+                    return
+                raise FileNotFoundError(f"No such file: {path}")
+            del self.files[path]
+            del self._mtimes[path]
+
+    def _store(self, path: Path, data: bytes) -> None:
+        with self._lock:
+            self.files[path] = data
+            # Strictly increasing, so every write changes the stat like it would on disk
+            self._lastmtime = max(time.time_ns(), self._lastmtime + 1)
+            self._mtimes[path] = self._lastmtime
+            self.dirs.update(path.parents)
+
+class _MemoryWriter(io.BytesIO):
+    def __init__(self, fs: MemoryFileSystem, path: Path) -> None:
+        super().__init__()
+        self.fs = fs
+        self.path = path
+
+    def close(self) -> None:
+        if not self.closed:
+            self.fs._store(self.path, self.getvalue())
+        super().close()
+
+LOCALFS = LocalFileSystem()
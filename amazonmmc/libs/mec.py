@@ -1,14 +1,23 @@
 from abc import ABC, abstractmethod
+from concurrent import futures
 from typing import TYPE_CHECKING, Any
 from xml.etree import ElementTree as ET
 
 from .enums import MediaTypes
-from .xmlhelpers import newroot, newelement, key_to_element, str_to_element
+from .profiler import PROFILER
+from .xmlhelpers import newroot, newelement, key_to_element, str_to_element, tobytes
 
 if TYPE_CHECKING:
     from .media import Media
 
 
+def _render_mec(task: tuple[str, list[dict]]) -> bytes:
+    from .media import Media
+    resourcedir, lineage = task
+    mec = MEC(Media.from_lineage(resourcedir, lineage))
+    return tobytes(mec.episodic())
+
+
 class MECGroup(ABC):
     def __init__(self, worktype: int, generalmedia: "Media", all: list["MEC"]) -> None:
         self.worktype = worktype
@@ -17,7 +26,28 @@ class MECGroup(ABC):
         self.generated = False
 
     @abstractmethod
-    def generate(self) -> None:...
+    def generate(self, mecs: list["MEC"] | None=None) -> None:...
+
+    def render(self, jobs: int, mecs: list["MEC"] | None=None,
+               executor: futures.Executor | None=None) -> list[tuple["MEC", bytes]]:
+        '''
+        Builds and serializes 'mecs' (default: all) in a pool of 'jobs' worker processes,
+        or on 'executor' if given. Workers rebuild each Media from its lineage and return
+        the bytes that would be written to disk, in the same order as 'mecs'.
+        '''
+        mecs = self.all if mecs is None else mecs
+        if not mecs:
+            return []
+        tasks = [(str(mec.media.resourcedir), mec.media.lineage()) for mec in mecs]
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        # Workers aren't profiled, their MECs show up as this one span
+        with PROFILER.span("MECGroup.render", mecs=len(tasks)):
+            if executor is not None:
+                rendered = list(executor.map(_render_mec, tasks, chunksize=chunksize))
+            else:
+                with futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+                    rendered = list(pool.map(_render_mec, tasks, chunksize=chunksize))
+        return list(zip(mecs, rendered))
 
 class MECEpisodic(MECGroup):
     def __init__(self, worktype: int, generalmedia: "Media", all: list["MEC"], series: "MEC",
@@ -27,12 +57,16 @@ class MECEpisodic(MECGroup):
         self.seasons = seasons
         self.episodes = episodes
 
-    def generate(self) -> None:
+    def generate(self, mecs: list["MEC"] | None=None) -> None:
+        '''
+        Generates 'mecs', or every MEC of the group if None
+        '''
         if self.generated:
             return
-        for mec in self.all:
-            mec.episodic()
-        self.generated = True
+        for mec in self.all if mecs is None else mecs:
+            with PROFILER.span("MEC.episodic", id=mec.id):
+                mec.episodic()
+        self.generated = mecs is None
 
 
 class MEC:
@@ -44,6 +78,8 @@ class MEC:
         self.outputname = f'{self.media.id}_metadata.xml'
 
     def episodic(self) -> ET.Element:
+        if len(self.rootelem):
+            return self.rootelem
         self.rootelem.append(self._basic())
         companycredits = self._companycredits()
         for credit in companycredits:
@@ -113,11 +149,7 @@ class MEC:
         return basicroot
 
     def _contentid(self) -> str:
-        if self.media.mediatype == MediaTypes.GENERAL:
-            return "GENERAL"
-        org: dict[str, str] = self.search_media("AssociatedOrg")
-        orgid: str = org["organizationID"]
-        return f"md:cid:org:{orgid}:{self.id}"
+        return self.media.contentid
 
     def _companycredits(self) -> list[ET.Element]:
         allelem: list[ET.Element] = []
@@ -233,7 +265,7 @@ class MEC:
         return allelem
 
     def _seqinfo(self) -> list[ET.Element]:
-        seq_num = self.search_media("SequenceInfo", assertcurrent=True)
+        seq_num = self.media.sequence
         seq_root = newelement("md", "SequenceInfo")
         seq_root.append(str_to_element("md", "Number", seq_num))
 
@@ -248,10 +280,10 @@ class MEC:
         parent_root = newelement("md", "Parent")
         parent_root.set("relationshipType", relationship)
 
-        currentid = self.search_media("id", assertcurrent=True)
+        currentid = self.media.id
         if self.media.parent is None:
             raise RuntimeError(f"MEC._eqinfo called with no parent media: {currentid}")
-        parentid = self.media.parent.find("id", assertcurrent=True)
+        parentid = self.media.parent.id
         fullid = f"md:cid:org:{self.org}:{parentid}"
         parent_root.append(str_to_element("md", "ParentContentID", fullid))
 
@@ -1,8 +1,16 @@
+import os
+import re
 from . import errors
 from pathlib import Path
+from .profiler import PROFILER
+from .filesystem import LOCALFS, FileSystem
 from .enums import MediaTypes
-from typing import Any, Union
-from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping, Union, cast
+from dataclasses import dataclass, field
+
+# Keys holding child Media data, they're not part of a Media's own metadata
+CHILDKEYS = ("seasons", "episodes")
 
 IMPLEMENTED = [
     MediaTypes.GENERAL,
@@ -11,41 +19,179 @@ IMPLEMENTED = [
     MediaTypes.EPISODE
 ]
 
+# MOV naming - AMAZONKIDS_HELLOKITTY_SEASON1_101_EN-US_ja-JP_PRORESHQ_5120_25_1920x1080_16x9_HD_178.mov
+# Dubbed -     AMAZONKIDS_HELLOKITTY_SEASON1_101_EN-US_ja-JP_PRORESHQ_5120_25_1920x1080_16x9_HD_178_dubbed.mov
+# Sub -        AMAZONKIDS_HELLOKITTY_SEASON1_102_EN-US_ja-JP_FULL_SUBTITLE_25.itt
+NAMING = re.compile(
+    r"^(?:[^_]*_){4}(?P<language>[^_]*)_(?P<region>[^_]*)_(?P<codec>[^_]*)_[^_]*_(?P<fps>[^_]*)"
+    r"(?:_(?P<width>\d+)x(?P<height>\d+)_(?P<aspect>[^_]*))?(?:_|$)",
+    re.IGNORECASE
+)
+
+@dataclass(frozen=True, slots=True)
+class ResourceName:
+    '''
+    The fields of a resource filename, parsed once with the NAMING convention.
+    width/height/aspect are only present on audio/video names.
+    '''
+    language: str
+    region: str
+    codec: str
+    fps: str
+    dubbed: bool
+    width: str | None = None
+    height: str | None = None
+    aspect: str | None = None
+
+    @classmethod
+    def parse(cls, stem: str) -> "ResourceName":
+        match = NAMING.match(stem)
+        if match is None:
+            raise errors.ResourceError(msg=f"Resource does not follow naming convention: {stem}")
+        aspect = match["aspect"]
+        return cls(
+            language=match["language"],
+            region=match["region"],
+            codec=match["codec"],
+            fps=match["fps"],
+            dubbed=stem.rsplit("_", 1)[-1].lower() == "dubbed",
+            width=match["width"],
+            height=match["height"],
+            aspect=None if aspect is None else aspect.lower().replace("x", ":")
+        )
+
 @dataclass
 class Resource:
     mediatype: int
     fullpath: Path
+    _name: ResourceName | None = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def name(self) -> ResourceName:
+        if self._name is None:
+            self._name = ResourceName.parse(self.fullpath.stem)
+        return self._name
+
+class ResourceIndex:
+    '''
+    Lists the resource directory once and indexes every resource by the underscore
+    delimited tokens in its name. Shared by every Media of a delivery, the directory
+    is only listed the first time resources are requested.
+    '''
+    def __init__(self, resourcedir: str|Path, fs: FileSystem=LOCALFS) -> None:
+        self.resourcedir = Path(resourcedir)
+        self.fs = fs
+        self._files: list[Path] | None = None
+        self._tokens: dict[str, list[int]] = {}
+
+    @property
+    def files(self) -> list[Path]:
+        if self._files is None:
+            self._scan()
+        return cast(list[Path], self._files)
+
+    def search(self, term: str) -> list[Path]:
+        '''
+        Returns every resource whose name contains '_{term}_', sorted by name
+        '''
+        if PROFILER.enabled:
+            PROFILER.count("ResourceIndex.search")
+        files = self.files
+        if "_" in term:
+            return [f for f in files if f"_{term}_" in f.name]
+        return [files[i] for i in self._tokens.get(term, [])]
+
+    def _scan(self) -> None:
+        files: list[Path] = []
+        tokens: dict[str, list[int]] = {}
+        with PROFILER.span("ResourceIndex.scan"):
+            # Sorted so output doesn't depend on the filesystem's directory order
+            for name in sorted(self.fs.listfiles(self.resourcedir)):
+                if name[0] == ".":
+                    continue
+                if os.path.splitext(name)[1].lower() == ".xml":
+                    continue
+                index = len(files)
+                files.append(self.resourcedir / name)
+                # A token only matches '_{term}_' if it has an underscore on both sides
+                for token in set(name.split("_")[1:-1]):
+                    tokens.setdefault(token, []).append(index)
+        self._files = files
+        self._tokens = tokens
 
 class Media:
-    def __init__(self, resourcedir: str|Path, data: dict, parent: Union["Media", None]=None) -> None:
+    def __init__(self, resourcedir: str|Path, data: dict, parent: Union["Media", None]=None,
+                index: ResourceIndex | None=None) -> None:
         self.resourcedir = Path(resourcedir)
         self.data = data
         self.parent = parent
+        if index is None:
+            index = parent.index if parent is not None else ResourceIndex(self.resourcedir)
+        self.index = index
+        self.resolved = self._resolve()
         self.mediatype = self._mediatype()
         if self.mediatype not in IMPLEMENTED:
             raise NotImplementedError(MediaTypes.get_str(self.mediatype))
         self.id = self._id()
         self.org = self.find("AssociatedOrg")["organizationID"]
-        self.resources = self._resources()
+        self.contentid = "GENERAL" if self.mediatype == MediaTypes.GENERAL else f"md:cid:org:{self.org}:{self.id}"
+        self._sequence: str | None = None
+        self._resources_list: list[Resource] | None = None
+
+    @property
+    def sequence(self) -> str:
+        if self._sequence is None:
+            self._sequence = self.find("SequenceInfo", assertcurrent=True)
+        return cast(str, self._sequence)
+
+    @property
+    def resources(self) -> list[Resource]:
+        if self._resources_list is None:
+            self._resources_list = self._resources()
+        return self._resources_list
 
     def find(self, key: str, assertcurrent: bool=False, assertexists: bool=True) -> Any:
-        value = self.data.get(key)
-        if value is None:
-            if assertcurrent:
-                if not assertexists:
-                    return None
-                mediatype = MediaTypes.get_str(self.mediatype)
-                raise KeyError(f"Unable to locate '{key}' in {mediatype}")
-            if self.parent is None:
-                if assertexists:
-                    mediatype = MediaTypes.get_str(self.mediatype)
-                    raise KeyError(f"Unable to locate '{key}' in {mediatype}")
-                else:
-                    return None
-            else:
-                return self.parent.find(key)
+        '''
+        Looks up 'key' on this Media, falling back to its parents unless 'assertcurrent'.
+        Inherited lookups are a single read of the precomputed 'resolved' view.
+        '''
+        if PROFILER.enabled:
+            PROFILER.count("Media.find")
+        if assertcurrent:
+            value = self.data.get(key)
+        else:
+            value = self.resolved.get(key)
+        if value is None and assertexists:
+            mediatype = MediaTypes.get_str(self.mediatype)
+            raise KeyError(f"Unable to locate '{key}' in {mediatype}")
         return value
 
+    def lineage(self) -> list[dict]:
+        '''
+        This Media's data and its parents', root first, without child collections.
+        A picklable description that Media can be rebuilt from in another process.
+        '''
+        chain: list[dict] = [] if self.parent is None else self.parent.lineage()
+        chain.append({k:v for k,v in self.data.items() if k not in CHILDKEYS})
+        return chain
+
+    @classmethod
+    def from_lineage(cls, resourcedir: str|Path, lineage: list[dict]) -> "Media":
+        media: Media | None = None
+        for data in lineage:
+            media = cls(resourcedir, data, media)
+        if media is None:
+            raise ValueError("Unable to build Media from an empty lineage")
+        return media
+
+    def _resolve(self) -> Mapping[str, Any]:
+        '''
+        Read-only merge of every key visible from this Media, nearest definition wins
+        '''
+        merged: dict[str, Any] = {} if self.parent is None else dict(self.parent.resolved)
+        merged.update((k, v) for k, v in self.data.items() if v is not None)
+        return MappingProxyType(merged)
+
     def _mediatype(self) -> int:
         mediatype = self.data.get("mediatype")
         if mediatype is None:
@@ -61,27 +207,20 @@ class Media:
 
     def _resources(self) -> list[Resource]:
         if self.mediatype == MediaTypes.EPISODE:
-            ep_seq = self.find("SequenceInfo", assertcurrent=True)
+            ep_seq = self.sequence
             if self.parent is None:
                 raise RuntimeError(f"Unable to locate parent Media in episode {ep_seq}")
             if len(ep_seq) < 2:
                 ep_seq = "0" + ep_seq
-            season_num = self.parent.find("SequenceInfo", assertcurrent=True)
+            season_num = self.parent.sequence
             ep_num = f"{season_num}{ep_seq}"
             searchterm = ep_num   
         elif self.mediatype == MediaTypes.SEASON:
-            season_seq = self.find("SequenceInfo", assertcurrent=True)
+            season_seq = self.sequence
             searchterm = f"SEASON{season_seq}"
         elif self.mediatype == MediaTypes.SERIES:
             searchterm = self.find("title", assertcurrent=True)
         else:
             return []
 
-        allresources: list[Resource] = []
-        for item in self.resourcedir.iterdir():
-            if not item.is_file() or item.name[0] == ".":
-                continue
-            if item.is_file() and item.suffix.lower() != ".xml":
-                if f"_{searchterm}_" in item.name:
-                    allresources.append(Resource(self.mediatype, item))
-        return allresources
\ No newline at end of file
+        return [Resource(self.mediatype, item) for item in self.index.search(searchterm)]
\ No newline at end of file
@@ -56,7 +56,7 @@ class SeasonExperience(Experience):
         self.rootelem.set("ExperienceID", self.id)
         self.rootelem.append(str_to_element("manifest", "ContentID", self.metadata.id))
 
-        for ep in self.season.episodes:
+        for ep in self.season.iter_episodes():
             expchild_root = newelement("manifest", "ExperienceChild")
             expchild_root.append(str_to_element("manifest", "Relationship", "isepisodeof"))
 
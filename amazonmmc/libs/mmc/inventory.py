@@ -1,20 +1,21 @@
 from typing import TYPE_CHECKING
 from abc import ABC, abstractmethod
 
+from .. import errors
 from ..enums import MediaTypes
+from ..checksums import hashmethod
 from ..xmlhelpers import newelement, str_to_element
 
 if TYPE_CHECKING:
     from ..mec import MEC
+    from ..checksums import ChecksumTable
     from ..media import Resource
     from xml.etree import ElementTree as ET
 
-# MOV naming - AMAZONKIDS_HELLOKITTY_SEASON1_101_EN-US_ja-JP_PRORESHQ_5120_25_1920x1080_16x9_HD_178.mov
-# Dubbed -     AMAZONKIDS_HELLOKITTY_SEASON1_101_EN-US_ja-JP_PRORESHQ_5120_25_1920x1080_16x9_HD_178_dubbed.mov
-# Sub -        AMAZONKIDS_HELLOKITTY_SEASON1_102_EN-US_ja-JP_FULL_SUBTITLE_25.itt
+# Resource filenames are parsed once into media.ResourceName, see media.NAMING
 
 class InventoryElem(ABC):
-    def __init__(self, mec: "MEC", roottag: str, checksums: list[str], resource: "Resource"=...) -> None:
+    def __init__(self, mec: "MEC", roottag: str, checksums: dict[str, "ChecksumTable"], resource: "Resource"=...) -> None:
         self.rootelem = newelement("manifest", roottag)
         self.mec = mec
         self.checksums = checksums
@@ -26,15 +27,28 @@ class InventoryElem(ABC):
         self.location = f"file://resources/{self.filepath}"
         self.id: str
         self.hash: str
+        self.hashes: dict[str, str]
 
-    def _hash(self) -> str:
-        if not self.checksums:
-            raise LookupError("MD5 Checksum file is empty")
-        for md5 in self.checksums:
-            splitline = md5.split(" ")
-            if splitline[1].lower() == self.filepath.lower():
-                return splitline[0]
-        raise LookupError(f"Unable to locate hash for {self.filepath}")
+    def _hashes(self) -> dict[str, str]:
+        return {algo: self._hash(algo) for algo in self.checksums}
+
+    def _hash(self, algorithm: str="md5") -> str:
+        table = self.checksums.get(algorithm)
+        method = hashmethod(algorithm)
+        if not table:
+            raise LookupError(f"{method} Checksum file is empty")
+        hash = table.get(self.filepath)
+        if hash is None:
+            raise LookupError(f"Unable to locate {method} hash for {self.filepath}")
+        return hash
+
+    def _hashelems(self) -> list["ET.Element"]:
+        allelem: list["ET.Element"] = []
+        for algo, hash in self.hashes.items():
+            hash_root = str_to_element("manifest", "Hash", hash)
+            hash_root.set("method", hashmethod(algo))
+            allelem.append(hash_root)
+        return allelem
 
     def _trackid(self, tracktype: str, language: str=...) -> str:
         mecid = self.mec.id
@@ -46,13 +60,13 @@ class InventoryElem(ABC):
             mediatype = self.resource.mediatype
             resname = self.resource.fullpath.name
         if mediatype == MediaTypes.EPISODE:
-            seq = self.mec.search_media("SequenceInfo", assertcurrent=True)
+            seq = self.mec.media.sequence
             trackid = f"md:{tracktype}:org:{orgid}:{mecid}:episode.{seq}"
             if language is not ...:
                 trackid += f".{language}"
             return trackid
         elif mediatype == MediaTypes.SEASON:
-            seq = self.mec.search_media("SequenceInfo", assertcurrent=True)
+            seq = self.mec.media.sequence
             return f"md:{tracktype}:org:{orgid}:{mecid}:season.{seq}"
         elif mediatype == MediaTypes.SERIES:
             return f"md:{tracktype}:org:{orgid}:{mecid}:series"
@@ -71,7 +85,7 @@ class InventoryElem(ABC):
 
 
 class Audio(InventoryElem):
-    def __init__(self, mec: "MEC", checksums: list[str], resource: "Resource") -> None:
+    def __init__(self, mec: "MEC", checksums: dict[str, "ChecksumTable"], resource: "Resource") -> None:
         super().__init__(mec, "Audio", checksums, resource)
         self.type = "primary"
         self.codec = "PCM"
@@ -79,14 +93,15 @@ class Audio(InventoryElem):
         self.dubbed: bool
         self.region: str
         self._initialize()
-        self.hash = self._hash()
+        self.hashes = self._hashes()
+        self.hash = self.hashes["md5"]
 
     def _initialize(self) -> None:
-        split_name = self.resource.fullpath.stem.split("_")
         if self.resource.mediatype == MediaTypes.EPISODE:
-            self.language = split_name[4]
-            self.dubbed = True if split_name[-1].lower() == "dubbed" else False
-            self.region = split_name[5]
+            name = self.resource.name
+            self.language = name.language
+            self.dubbed = name.dubbed
+            self.region = name.region
             self.id = self._trackid("audtrackid", self.language)
         else:
             raise NotImplementedError(
@@ -113,14 +128,13 @@ class Audio(InventoryElem):
 
         container_root = newelement("manifest", "ContainerReference")
         container_root.append(str_to_element("manifest", "ContainerLocation", self.location))
-        hash_root = str_to_element("manifest", "Hash", self.hash)
-        hash_root.set("method", "MD5")
-        container_root.append(hash_root)
+        for hash_root in self._hashelems():
+            container_root.append(hash_root)
         self.rootelem.append(container_root)
         return self.rootelem
 
 class Video(InventoryElem):
-    def __init__(self, mec: "MEC", checksums: list[str], resource: "Resource") -> None:
+    def __init__(self, mec: "MEC", checksums: dict[str, "ChecksumTable"], resource: "Resource") -> None:
         super().__init__(mec, "Video", checksums, resource)
         self.type = "primary"
         self.language: str
@@ -130,18 +144,20 @@ class Video(InventoryElem):
         self.height: str
         self.aspect: str
         self._initialize()
-        self.hash = self._hash()
+        self.hashes = self._hashes()
+        self.hash = self.hashes["md5"]
 
     def _initialize(self) -> None:
-        split_name = self.resource.fullpath.stem.split("_")
         if self.resource.mediatype == MediaTypes.EPISODE:
-            self.language = split_name[4]
-            self.region = split_name[5]
-            self.codec = split_name[6]
-            resolution = split_name[9].lower().split("x")
-            self.width = resolution[0]
-            self.height = resolution[1]
-            self.aspect = split_name[10].lower().replace("x", ":")
+            name = self.resource.name
+            if name.width is None or name.height is None or name.aspect is None:
+                raise errors.ResourceError(msg=f"Unable to parse resolution and aspect ratio: {self.resource.fullpath.name}")
+            self.language = name.language
+            self.region = name.region
+            self.codec = name.codec
+            self.width = name.width
+            self.height = name.height
+            self.aspect = name.aspect
             self.id = self._trackid("vidtrackid", self.language)
         else:
             raise NotImplementedError(
@@ -168,14 +184,13 @@ class Video(InventoryElem):
 
         container = newelement("manifest", "ContainerReference")
         container.append(str_to_element("manifest", "ContainerLocation", self.location))
-        hash = str_to_element("manifest", "Hash", self.hash)
-        hash.set("method", "MD5")
-        container.append(hash)
+        for hash in self._hashelems():
+            container.append(hash)
         self.rootelem.append(container)
         return self.rootelem
 
 class Subtitle(InventoryElem):
-    def __init__(self, mec: "MEC", checksums: list[str], resource: "Resource") -> None:
+    def __init__(self, mec: "MEC", checksums: dict[str, "ChecksumTable"], resource: "Resource") -> None:
         super().__init__(mec, "Subtitle", checksums, resource)
         self.type = "SDH"
         self.language: str
@@ -183,14 +198,15 @@ class Subtitle(InventoryElem):
         self.multiplier: str
         self.fps: str
         self._initialize()
-        self.hash = self._hash()
+        self.hashes = self._hashes()
+        self.hash = self.hashes["md5"]
 
     def _initialize(self) -> None:
-        split_name = self.resource.fullpath.stem.split("_")
         if self.resource.mediatype == MediaTypes.EPISODE:
-            self.language = split_name[4]
-            self.region = split_name[5]
-            fps = split_name[8]
+            name = self.resource.name
+            self.language = name.language
+            self.region = name.region
+            fps = name.fps
             if len(fps) == 4:
                 self.multiplier = "1000/1001"
                 self.fps = str(round(int(fps)))
@@ -219,19 +235,19 @@ class Subtitle(InventoryElem):
 
         container = newelement("manifest", "ContainerReference")
         container.append(str_to_element("manifest", "ContainerLocation", self.location))
-        hash = str_to_element("manifest", "Hash", self.hash)
-        hash.set("method", "MD5")
-        container.append(hash)
+        for hash in self._hashelems():
+            container.append(hash)
         self.rootelem.append(container)
         return self.rootelem
 
 class Metadata(InventoryElem):
-    def __init__(self, mec: "MEC", checksums: list[str]) -> None:
+    def __init__(self, mec: "MEC", checksums: dict[str, "ChecksumTable"]) -> None:
         super().__init__(mec, "Metadata", checksums)
         self.type = "common"
         self.id: str
         self._initialize()
-        self.hash = self._hash()
+        self.hashes = self._hashes()
+        self.hash = self.hashes["md5"]
 
     def _initialize(self) -> None:
         self.id = self._trackid("cid")
@@ -241,8 +257,7 @@ class Metadata(InventoryElem):
         container = newelement("manifest", "ContainerReference")
         container.set("type", self.type)
         container.append(str_to_element("manifest", "ContainerLocation", self.location))
-        hash = str_to_element("manifest", "Hash", self.hash)
-        hash.set("method", "MD5")
-        container.append(hash)
+        for hash in self._hashelems():
+            container.append(hash)
         self.rootelem.append(container)
         return self.rootelem
\ No newline at end of file
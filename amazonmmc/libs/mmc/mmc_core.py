@@ -1,11 +1,15 @@
-from abc import ABC
+from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING, BinaryIO, Iterator, cast
 
 from .. import errors
 from ..mec import MECEpisodic
 from ..enums import WorkTypes
-from ..xmlhelpers import newroot, newelement, str_to_element
+from ..profiler import PROFILER
+from ..buildcache import digest, mediadeps
+from ..checksums import ALGORITHMS, ChecksumTable, manifestname
+from ..filesystem import LOCALFS, FileSystem
+from ..xmlhelpers import XMLStreamWriter, newroot, newelement, str_to_element
 
 from .alids import ALID
 from .presentations import EpPresentation
@@ -14,8 +18,23 @@ from .experiences import EpisodeExperience, SeasonExperience, SeriesExperience
 
 if TYPE_CHECKING:
     from ..mec import MEC, MECGroup
+    from ..media import Resource
     from xml.etree import ElementTree as ET
 
+SECTIONS = ("Inventory", "Presentations", "Experiences", "ALIDExperienceMaps")
+
+def entitydeps(mec: "MEC", files: list[str], checksums: dict[str, ChecksumTable], parents: bool=False) -> dict[str, str]:
+    '''
+    Digests of what an entity's MMC elements are built from, keyed "<MEC id> <what>":
+    its own Media data (with 'parents' its parents' too), its files and their checksums.
+    '''
+    datadeps = list(mediadeps(mec.media).items())
+    deps = {f"{mec.id} {name}": value for name, value in (datadeps if parents else datadeps[-1:])}
+    deps[f"{mec.id} resources"] = digest(files)
+    for algo, table in checksums.items():
+        deps[f"{mec.id} {algo} checksums"] = digest([table.get(name) for name in files])
+    return deps
+
 class Extensions:
     def __init__(self, mec: "MEC") -> None:
         self.av_exts = mec.search_media("av_exts")
@@ -23,7 +42,7 @@ class Extensions:
         self.art_exts = mec.search_media("art_exts")
 
 class MMCEntity(ABC):
-    def __init__(self, mec: "MEC", ext: Extensions, checksums: list[str]) -> None:
+    def __init__(self, mec: "MEC", ext: Extensions, checksums: dict[str, ChecksumTable]) -> None:
         self.mec = mec
         self.extensions = ext
         self.checksums = checksums
@@ -32,10 +51,25 @@ class MMCEntity(ABC):
         self.subtitles: list[Subtitle] = []
         self.metadata = Metadata(mec, checksums)
 
+    @abstractmethod
+    def elements(self, section: str) -> list["ET.Element"]:
+        '''
+        This entity's elements in the MMC 'section', one of SECTIONS
+        '''
+
+    def files(self) -> list[str]:
+        '''
+        Every file whose checksum ends up in this entity's elements
+        '''
+        return [self.mec.outputname]
+
+    def dependencies(self) -> dict[str, str]:
+        return entitydeps(self.mec, self.files(), self.checksums)
+
 class Episode(MMCEntity):
-    def __init__(self, mec: "MEC", ext: Extensions, checksums: list[str]) -> None:
+    def __init__(self, mec: "MEC", ext: Extensions, checksums: dict[str, ChecksumTable]) -> None:
         super().__init__(mec, ext, checksums)
-        self.seq = self.mec.search_media("SequenceInfo", assertcurrent=True)
+        self.seq = self.mec.media.sequence
         self._parse_resources()
         self._presentation: EpPresentation | None = None
         self._experience: EpisodeExperience | None = None
@@ -59,18 +93,52 @@ class Episode(MMCEntity):
             self._alid = self._gen_alid()
         return self._alid
 
+    def elements(self, section: str) -> list["ET.Element"]:
+        if section == "Inventory":
+            elems = [video.generate() for video in self.video]
+            elems += [audio.generate() for audio in self.audio]
+            elems += [sub.generate() for sub in self.subtitles]
+            elems.append(self.metadata.generate())
+            return elems
+        if section == "Presentations":
+            return [self.presentation.generate()]
+        if section == "Experiences":
+            return [self.experience.generate()]
+        if section == "ALIDExperienceMaps":
+            return [self.alid.generate()]
+        return []
+
+    def files(self) -> list[str]:
+        return self.resource_files(self.mec, self.extensions)
+
+    @staticmethod
+    def resource_files(mec: "MEC", ext: Extensions) -> list[str]:
+        '''
+        The MEC and the audio/video and subtitle files of an episode, found without building it
+        '''
+        files = [mec.outputname]
+        for res in mec.media.resources:
+            suffix = res.fullpath.suffix.lower()
+            if suffix in ext.av_exts or suffix in ext.sub_exts:
+                files.append(res.fullpath.name)
+        return files
+
     def _parse_resources(self) -> None:
-        videofound = False
+        '''
+        Every audio/video file is an Audio. The Video is the first original language
+        (not '_dubbed') file by name, or the first dubbed one if there's no original.
+        '''
+        avs: list["Resource"] = []
         for res in self.mec.media.resources:
             if res.fullpath.suffix.lower() in self.extensions.av_exts:
                 self.audio.append(Audio(self.mec, self.checksums, res))
-                if not videofound:
-                    self.video.append(Video(self.mec, self.checksums, res))
-                    videofound = True
+                avs.append(res)
             elif res.fullpath.suffix.lower() in self.extensions.sub_exts:
                 self.subtitles.append(Subtitle(self.mec, self.checksums, res))
-        if not videofound:
+        if not avs:
             raise FileNotFoundError(f"Unable to locate video file for {self.mec.id}")
+        primary = next((res for res in avs if not res.name.dubbed), avs[0])
+        self.video.append(Video(self.mec, self.checksums, primary))
 
     def _gen_presentation(self) -> EpPresentation:
         return EpPresentation(self.mec, self.audio, self.video, self.subtitles)
@@ -82,10 +150,12 @@ class Episode(MMCEntity):
         return ALID(self.experience, self.metadata)
 
 class Season(MMCEntity):
-    def __init__(self, mec: "MEC", episodes: list["MEC"], ext: Extensions, checksums: list[str]) -> None:
+    def __init__(self, mec: "MEC", episodes: list["MEC"], ext: Extensions, checksums: dict[str, ChecksumTable]) -> None:
         super().__init__(mec, ext, checksums)
-        self.episodes = [Episode(ep, ext, checksums) for ep in episodes]
-        self.seq = self.mec.search_media("SequenceInfo", assertcurrent=True)
+        self.episodemecs = episodes
+        self.keepepisodes = True
+        self.seq = self.mec.media.sequence
+        self._episodes: list[Episode] | None = None
         self._experience: SeasonExperience | None = None
         self._alid: ALID | None = None
 
@@ -101,6 +171,28 @@ class Season(MMCEntity):
             self._alid = self._gen_alid()
         return self._alid
 
+    def elements(self, section: str) -> list["ET.Element"]:
+        if section == "Inventory":
+            return [self.metadata.generate()]
+        if section == "Experiences":
+            return [self.experience.generate()]
+        if section == "ALIDExperienceMaps":
+            return [self.alid.generate()]
+        return []
+
+    def iter_episodes(self) -> Iterator[Episode]:
+        '''
+        The season's Episodes, built on first use and kept. Without 'keepepisodes' (when
+        streaming) a new Episode is built per episode MEC on every call, so each one is
+        released once its elements are written and memory doesn't grow with the episodes.
+        '''
+        if not self.keepepisodes:
+            self._episodes = None
+            return (Episode(ep, self.extensions, self.checksums) for ep in self.episodemecs)
+        if self._episodes is None:
+            self._episodes = [Episode(ep, self.extensions, self.checksums) for ep in self.episodemecs]
+        return iter(self._episodes)
+
     def _gen_experience(self) -> SeasonExperience:
         return SeasonExperience(self)
 
@@ -108,10 +200,17 @@ class Season(MMCEntity):
         return ALID(self.experience, self.metadata)
 
 class Series(MMCEntity):
-    def __init__(self, rootdir: Path, mecgroup: "MECEpisodic") -> None:
+    '''
+    'checksums' ({algorithm: ChecksumTable}) are read from the manifests in data/ if not given
+    '''
+    def __init__(self, rootdir: Path, mecgroup: "MECEpisodic", algorithms: list[str]=ALGORITHMS,
+                 checksums: dict[str, ChecksumTable] | None=None, fs: FileSystem=LOCALFS) -> None:
         self.rootdir = rootdir
         self.mecgroup = mecgroup
-        super().__init__(mecgroup.series, Extensions(mecgroup.series), self._readmd5())
+        self.algorithms = algorithms
+        self.fs = fs
+        super().__init__(mecgroup.series, Extensions(mecgroup.series), checksums or self._readchecksums())
+        self._validate_names()
         self.seasons = [Season(s, ep, self.extensions, self.checksums) for s, ep in mecgroup.seasons.items()]
         self._experience: SeriesExperience | None = None
 
@@ -121,65 +220,112 @@ class Series(MMCEntity):
             self._experience = self._gen_experience()
         return self._experience
 
+    def elements(self, section: str) -> list["ET.Element"]:
+        if section == "Inventory":
+            return [self.metadata.generate()]
+        if section == "Experiences":
+            return [self.experience.generate()]
+        return []
+
+    def dependencies(self) -> dict[str, str]:
+        return entitydeps(self.mec, self.files(), self.checksums, parents=True)
+
+    def entities(self) -> Iterator[MMCEntity]:
+        '''
+        Every entity in MMC order: each season's episodes then the season, the series last.
+        See Season.iter_episodes() for when episodes are built.
+        '''
+        for season in self.seasons:
+            yield from season.iter_episodes()
+            yield season
+        yield self
+
+    def iter_section(self, section: str) -> Iterator["ET.Element"]:
+        for entity in self.entities():
+            with PROFILER.span(f"{type(entity).__name__}.elements", id=entity.mec.id, section=section):
+                elems = entity.elements(section)
+            yield from elems
+
     def inventory(self) -> "ET.Element":
         inventory_root = newelement("manifest", "Inventory")
-        for season in self.seasons:
-            for ep in season.episodes:
-                for video in ep.video:
-                    inventory_root.append(video.generate())
-                for audio in ep.audio:
-                    inventory_root.append(audio.generate())
-                for sub in ep.subtitles:
-                    inventory_root.append(sub.generate())
-                inventory_root.append(ep.metadata.generate())
-            inventory_root.append(season.metadata.generate())
-        inventory_root.append(self.metadata.generate())
+        for elem in self.iter_inventory():
+            inventory_root.append(elem)
         return inventory_root
 
     def presentations(self) -> "ET.Element":
         presentations_root = newelement("manifest", "Presentations")
-        for season in self.seasons:
-            for ep in season.episodes:
-                presentations_root.append(ep.presentation.generate())
+        for elem in self.iter_presentations():
+            presentations_root.append(elem)
         return presentations_root
 
     def experiences(self) -> "ET.Element":
         exp_root = newelement("manifest", "Experiences")
-        for season in self.seasons:
-            for ep in season.episodes:
-                exp_root.append(ep.experience.generate())
-            exp_root.append(season.experience.generate())
-        exp_root.append(self.experience.generate())
+        for elem in self.iter_experiences():
+            exp_root.append(elem)
         return exp_root
 
     def alids(self) -> "ET.Element":
         alid_root = newelement("manifest", "ALIDExperienceMaps")
-        for season in self.seasons:
-            for ep in season.episodes:
-                alid_root.append(ep.alid.generate())
-            alid_root.append(season.alid.generate())
+        for elem in self.iter_alids():
+            alid_root.append(elem)
         return alid_root
 
-    def _readmd5(self) -> list[str]:
-        checksums = self.rootdir / "data" / "checksums.md5"
-        lines = []
-        with open(checksums, "r", encoding="UTF-8") as fp:
-            for line in fp.readlines():
-                lines.append(line.strip())
-        return lines
+    def iter_inventory(self) -> Iterator["ET.Element"]:
+        return self.iter_section("Inventory")
+
+    def iter_presentations(self) -> Iterator["ET.Element"]:
+        return self.iter_section("Presentations")
+
+    def iter_experiences(self) -> Iterator["ET.Element"]:
+        return self.iter_section("Experiences")
+
+    def iter_alids(self) -> Iterator["ET.Element"]:
+        return self.iter_section("ALIDExperienceMaps")
+
+    def _validate_names(self) -> None:
+        '''
+        Parses every episode audio/video/subtitle filename up front so all naming
+        problems are reported together. The parsed names are cached on each Resource.
+        '''
+        exts = {ext.lower() for ext in self.extensions.av_exts + self.extensions.sub_exts}
+        av_exts = {ext.lower() for ext in self.extensions.av_exts}
+        invalid: list[str] = []
+        for ep in self.mecgroup.episodes:
+            for res in ep.media.resources:
+                suffix = res.fullpath.suffix.lower()
+                if suffix not in exts:
+                    continue
+                try:
+                    name = res.name
+                except errors.ResourceError:
+                    invalid.append(res.fullpath.name)
+                    continue
+                if suffix in av_exts and name.width is None:
+                    invalid.append(res.fullpath.name)
+        if invalid:
+            raise errors.ResourceError(invalid, msg="Resource does not follow naming convention: ")
+
+    def _readchecksums(self) -> dict[str, ChecksumTable]:
+        datadir = self.rootdir / "data"
+        return {algo: ChecksumTable.read(datadir / manifestname(algo), algo, self.fs) for algo in self.algorithms}
 
     def _gen_experience(self) -> SeriesExperience:
         return SeriesExperience(self)
 
 
 class MMC:
-    def __init__(self, worktype: int, rootdir: Path, mecgroup: "MECGroup") -> None:
+    def __init__(self, worktype: int, rootdir: Path, mecgroup: "MECGroup", algorithms: list[str] | None=None,
+                 checksums: dict[str, ChecksumTable] | None=None, fs: FileSystem=LOCALFS) -> None:
         self.rootdir = rootdir
+        self.checksums = checksums
+        self.fs = fs
+        self.algorithms = list(ALGORITHMS) if algorithms is None else algorithms
         self.resourcedir = rootdir / "resources"
         self.worktype = worktype
         self.mecgroup = mecgroup
         self.rootelem = newroot("manifest", "MediaManifest")
         self._outputname = ""
+        self._series: Series | None = None
         self.generated = False
 
     @property
@@ -194,48 +340,111 @@ class MMC:
         if self.generated:
             return self.rootelem
         if self.worktype == WorkTypes.EPISODIC:
-            if isinstance(self.mecgroup, MECEpisodic):
-                mecgroup = cast(MECEpisodic, self.mecgroup)
-            else:
-                raise RuntimeError(f"Delivery worktype is episodic but MECGroup is of type: {type(self.mecgroup)}")
-            self.episodic(mecgroup)
+            with PROFILER.span("MMC.generate"):
+                self.episodic(self._episodic_group())
             self.generated =True
             return self.rootelem
         else:
             raise NotImplementedError("Only episodic workflows are currently supported")
 
+    def prepare(self, stream: bool=False) -> Series:
+        '''
+        Validates resources and builds the Series model without generating any xml.
+        Sets the output name. With 'stream' episodes aren't kept, see Season.iter_episodes().
+        '''
+        if self._series is None:
+            if self.worktype != WorkTypes.EPISODIC:
+                raise NotImplementedError("Only episodic workflows are currently supported")
+            mecgroup = self._episodic_group()
+            with PROFILER.span("MMC.prepare"):
+                self._validate_resources(mecgroup)
+                self._outputname = f"{mecgroup.series.id}_MMC.xml"
+                self._series = Series(self.rootdir, mecgroup, self.algorithms, self.checksums, self.fs)
+        for season in self._series.seasons:
+            season.keepepisodes = not stream
+        return self._series
+
+    def dependencies(self) -> dict[str, str]:
+        '''
+        Digests of everything the MMC is built from, for the build cache, see entitydeps().
+        Only Media data, resource names and checksums are read, no Episode is built.
+        '''
+        series = self.prepare()
+        deps = series.dependencies()
+        for season in series.seasons:
+            for ep in season.episodemecs:
+                deps.update(entitydeps(ep, Episode.resource_files(ep, season.extensions), series.checksums))
+            deps.update(season.dependencies())
+        return deps
+
+    def stream(self, fp: BinaryIO) -> None:
+        '''
+        Writes the MMC to 'fp' section by section. Each element is released once written,
+        so memory doesn't grow with the number of episodes.
+        '''
+        series = self.prepare(stream=True)
+        writer = XMLStreamWriter(fp)
+        writer.start_document(self.rootelem, ["manifest", "md", "xsi"])
+        writer.write(self._compatibility())
+        for tag in SECTIONS:
+            writer.start(newelement("manifest", tag))
+            for entity in series.entities():
+                with PROFILER.span(f"{type(entity).__name__}.elements", id=entity.mec.id, section=tag):
+                    elems = entity.elements(tag)
+                for elem in elems:
+                    writer.write(elem)
+                    elem.clear()
+            writer.end()
+        writer.end()
+        self._series = None
+
     def episodic(self, mecgroup: MECEpisodic) -> "ET.Element":
-        self._validate_resources(mecgroup)
         self.worktype = WorkTypes.EPISODIC
-        seriesid = mecgroup.series.search_media("id", assertcurrent=True)
-        self._outputname = f"{seriesid}_MMC.xml"
+        self.mecgroup = mecgroup
+        series = self.prepare()
         self.rootelem.append(self._compatibility())
-        series = Series(self.rootdir, mecgroup)
-        self.rootelem.append(series.inventory())
-        self.rootelem.append(series.presentations())
-        self.rootelem.append(series.experiences())
-        self.rootelem.append(series.alids())
+        with PROFILER.span("Series.inventory"):
+            self.rootelem.append(series.inventory())
+        with PROFILER.span("Series.presentations"):
+            self.rootelem.append(series.presentations())
+        with PROFILER.span("Series.experiences"):
+            self.rootelem.append(series.experiences())
+        with PROFILER.span("Series.alids"):
+            self.rootelem.append(series.alids())
         return self.rootelem
 
+    def _episodic_group(self) -> MECEpisodic:
+        if isinstance(self.mecgroup, MECEpisodic):
+            return cast(MECEpisodic, self.mecgroup)
+        raise RuntimeError(f"Delivery worktype is episodic but MECGroup is of type: {type(self.mecgroup)}")
+
     def _validate_resources(self, mecgroup: "MECGroup") -> None:
+        '''
+        Reconciles resources/ against the resources claimed by each MEC and reports
+        unknown files, files claimed by more than one MEC of the same mediatype and
+        episodes without a video file, all at once.
+        '''
         if not mecgroup.all:
             raise RuntimeError("MMC did not recieve any MECs")
-        unknowns: list[str] = []
-        for item in self.resourcedir.iterdir():
-            if not item.is_file() or item.suffix.lower() == ".xml" or item.name[0] == ".":
-                continue
-            found = False
-            for mec in mecgroup.all:
-                for res in mec.media.resources:
-                    if res.fullpath.name == item.name:
-                        found = True
-                        break
-                if found:
-                    break
-            if not found:
-                unknowns.append(item.name)
-        if unknowns:
-            raise errors.ResourceError(unknowns)
+        claims: dict[str, dict[int, list[str]]] = {}
+        for mec in mecgroup.all:
+            for res in mec.media.resources:
+                claims.setdefault(res.fullpath.name, {}).setdefault(res.mediatype, []).append(mec.id)
+
+        unknowns = [item.name for item in mecgroup.generalmedia.index.files if item.name not in claims]
+        duplicates: dict[str, list[str]] = {}
+        for name, bytype in claims.items():
+            for claimants in bytype.values():
+                if len(claimants) > 1:
+                    duplicates[name] = claimants
+        missing: list[str] = []
+        if isinstance(mecgroup, MECEpisodic):
+            av_exts = {ext.lower() for ext in Extensions(mecgroup.series).av_exts}
+            for ep in mecgroup.episodes:
+                if not any(res.fullpath.suffix.lower() in av_exts for res in ep.media.resources):
+                    missing.append(f"{ep.id} has no video file")
+        if unknowns or duplicates or missing:
+            raise errors.ResourceError(unknowns, duplicates=duplicates, missing=missing)
 
     def _compatibility(self) -> "ET.Element":
         compat_root = newelement("manifest", "Compatibility")
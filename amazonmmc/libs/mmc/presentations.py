@@ -29,7 +29,7 @@ class Presentation(ABC):
 class EpPresentation(Presentation):
     def __init__(self, mec: "MEC", audio: list["Audio"], video: list["Video"], subtitles: list["Subtitle"]) -> None:
         super().__init__(mec, audio, video, subtitles)
-        self.seq = self.mec.search_media("SequenceInfo", assertcurrent=True)
+        self.seq = self.mec.media.sequence
         self.id = self._id("episode", self.seq)
 
     def generate(self) -> "ET.Element":
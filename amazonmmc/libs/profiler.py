@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Any
+
+class Span:
+    __slots__ = ("profiler", "name", "args", "started", "childtime")
+
+    def __init__(self, profiler: "Profiler", name: str, args: dict[str, Any]) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.started = 0
+        self.childtime = 0
+
+    def __enter__(self) -> "Span":
+        self.profiler._stack().append(self)
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        ended = time.perf_counter_ns()
+        stack = self.profiler._stack()
+        stack.pop()
+        duration = ended - self.started
+        if stack:
+            stack[-1].childtime += duration
+        self.profiler._record(self, duration)
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+NULLSPAN = NullSpan()
+
+class Profiler:
+    '''
+    Records nested timing spans and counters while 'enabled'. When disabled (the default)
+    span() returns a shared no-op context manager, and hot paths check 'enabled' before
+    calling count(), so profiling costs an attribute lookup.
+    Spans are per thread, work done in worker processes is only seen as the span around it.
+    '''
+    def __init__(self) -> None:
+        self.enabled = False
+        self.counters: dict[str, int] = {}
+        # (name, thread id, start ns, duration ns, self ns, args)
+        self.events: list[tuple[str, int, int, int, int, dict[str, Any]]] = []
+        self.threads: dict[int, str] = {}
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self) -> None:
+        with self._lock:
+            self.counters = {}
+            self.events = []
+            self.threads = {}
+            self._origin = time.perf_counter_ns()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def span(self, name: str, **args: Any) -> Span | NullSpan:
+        '''
+        Times the body of a with block, e.g. 'with PROFILER.span("MEC.episodic", id=mec.id):'
+        '''
+        if not self.enabled:
+            return NULLSPAN
+        return Span(self, name, args)
+
+    def count(self, name: str, n: int=1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def trace(self) -> dict:
+        '''
+        The spans and counters in Chrome trace event format,
+        viewable in chrome://tracing or https://ui.perfetto.dev
+        '''
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+            counters = dict(self.counters)
+        traceevents: list[dict] = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        end = 0.0
+        for name, tid, started, duration, _, args in events:
+            ts = (started - self._origin) / 1000
+            end = max(end, ts + duration / 1000)
+            event = {"name": name, "cat": "amazonmmc", "ph": "X", "ts": ts, "dur": duration / 1000, "pid": pid, "tid": tid}
+            if args:
+                event["args"] = args
+            traceevents.append(event)
+        for name, value in sorted(counters.items()):
+            traceevents.append({"name": name, "ph": "C", "ts": end, "pid": pid, "args": {"count": value}})
+        return {"traceEvents": traceevents, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: Path) -> None:
+        with open(path, "w", encoding="UTF-8") as fp:
+            json.dump(self.trace(), fp, default=str)
+
+    def summary(self) -> str:
+        '''
+        Calls, total and self seconds per span name, most self time first, then the counters
+        '''
+        with self._lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+        totals: dict[str, list[int]] = {}
+        for name, _, _, duration, selftime, _ in events:
+            total = totals.setdefault(name, [0, 0, 0])
+            total[0] += 1
+            total[1] += duration
+            total[2] += selftime
+        width = max([len("Span"), *(len(name) for name in totals), *(len(name) for name in counters)])
+        lines = [f"{'Span':<{width}} {'calls':>8} {'total s':>9} {'self s':>9} {'mean ms':>9}"]
+        for name, (calls, total, selftime) in sorted(totals.items(), key=lambda item: -item[1][2]):
+            lines.append(f"{name:<{width}} {calls:>8} {total / 1e9:>9.3f} {selftime / 1e9:>9.3f} {total / calls / 1e6:>9.3f}")
+        if counters:
+            lines.append("")
+            lines.append(f"{'Counter':<{width}} {'count':>8}")
+            for name, value in sorted(counters.items()):
+                lines.append(f"{name:<{width}} {value:>8}")
+        return "\n".join(lines)
+
+    def _stack(self) -> list[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, span: Span, duration: int) -> None:
+        tid = threading.get_native_id()
+        with self._lock:
+            if tid not in self.threads:
+                self.threads[tid] = threading.current_thread().name
+            self.events.append((span.name, tid, span.started, duration, duration - span.childtime, span.args))
+
+PROFILER = Profiler()
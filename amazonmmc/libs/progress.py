@@ -0,0 +1,167 @@
+import sys
+import json
+import time
+import threading
+from dataclasses import dataclass, asdict
+from typing import Callable, TextIO
+
+MB = 1000 * 1000
+
+@dataclass
+class ProgressEvent:
+    event: str
+    bytes_done: int
+    bytes_total: int
+    files_done: int
+    files_total: int
+    elapsed: float
+    rate: float
+    eta: float | None
+    file: str | None = None
+    file_bytes: int | None = None
+    file_size: int | None = None
+    file_seconds: float | None = None
+    file_rate: float | None = None
+
+    def to_dict(self) -> dict:
+        return {k:v for k,v in asdict(self).items() if v is not None}
+
+@dataclass
+class FileProgress:
+    name: str
+    size: int
+    started: float
+    bytes_done: int = 0
+    seconds: float | None = None
+
+    def rate(self, now: float) -> float:
+        seconds = (self.seconds if self.seconds is not None else now - self.started)
+        return self.bytes_done / MB / seconds if seconds > 0 else 0.0
+
+ProgressCallback = Callable[[ProgressEvent], None]
+
+class Progress:
+    '''
+    Thread-safe byte level progress for the checksum stage.
+    Events are passed to every callback: 'start', 'file_start', 'progress' (throttled
+    to one per 'interval' seconds), 'file_done' and 'done'. Rates are MB/s.
+    '''
+    def __init__(self, *callbacks: ProgressCallback, interval: float=0.5) -> None:
+        self.callbacks = list(callbacks)
+        self.interval = interval
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.files_total = 0
+        self.files_done = 0
+        self.files: dict[str, FileProgress] = {}
+        self._started = time.perf_counter()
+        self._lastemit = 0.0
+        self._lock = threading.Lock()
+
+    def start(self, bytes_total: int, files_total: int) -> None:
+        '''
+        Begins a run, counts from an earlier run of a reused Progress are dropped
+        '''
+        with self._lock:
+            self.bytes_total = bytes_total
+            self.bytes_done = 0
+            self.files_total = files_total
+            self.files_done = 0
+            self.files = {}
+            self._started = time.perf_counter()
+            self._lastemit = 0.0
+            self._emit("start")
+
+    def file_start(self, name: str, size: int) -> None:
+        with self._lock:
+            self.files[name] = FileProgress(name, size, time.perf_counter())
+            self._emit("file_start", self.files[name])
+
+    def advance(self, name: str, size: int) -> None:
+        with self._lock:
+            fileprogress = self.files[name]
+            fileprogress.bytes_done += size
+            self.bytes_done += size
+            now = time.perf_counter()
+            if now - self._lastemit >= self.interval:
+                self._lastemit = now
+                self._emit("progress", fileprogress)
+
+    def file_done(self, name: str) -> None:
+        with self._lock:
+            fileprogress = self.files[name]
+            fileprogress.seconds = time.perf_counter() - fileprogress.started
+            self.files_done += 1
+            self._emit("file_done", fileprogress)
+
+    def finish(self) -> None:
+        with self._lock:
+            self._emit("done")
+
+    def durations(self) -> dict[str, float]:
+        return {name: f.seconds for name, f in self.files.items() if f.seconds is not None}
+
+    def _emit(self, event: str, fileprogress: FileProgress | None=None) -> None:
+        if not self.callbacks:
+            return
+        now = time.perf_counter()
+        elapsed = now - self._started
+        rate = self.bytes_done / MB / elapsed if elapsed > 0 else 0.0
+        remaining = self.bytes_total - self.bytes_done
+        eta = remaining / MB / rate if rate > 0 else None
+        progressevent = ProgressEvent(
+            event=event,
+            bytes_done=self.bytes_done,
+            bytes_total=self.bytes_total,
+            files_done=self.files_done,
+            files_total=self.files_total,
+            elapsed=round(elapsed, 3),
+            rate=round(rate, 2),
+            eta=None if eta is None else round(eta, 1)
+        )
+        if fileprogress is not None:
+            progressevent.file = fileprogress.name
+            progressevent.file_bytes = fileprogress.bytes_done
+            progressevent.file_size = fileprogress.size
+            if fileprogress.seconds is not None:
+                progressevent.file_seconds = round(fileprogress.seconds, 3)
+            progressevent.file_rate = round(fileprogress.rate(now), 2)
+        for callback in self.callbacks:
+            callback(progressevent)
+
+# Deliveries of a batch share one progress file, each event is written as a whole line
+_jsonlock = threading.Lock()
+
+def jsonlines(fp: TextIO, delivery: str | None=None) -> ProgressCallback:
+    '''
+    Writes every event as one JSON object per line.
+    With 'delivery' each event names it, so several deliveries can share 'fp'.
+    '''
+    def callback(event: ProgressEvent) -> None:
+        eventdict = event.to_dict()
+        if delivery is not None:
+            eventdict["delivery"] = delivery
+        with _jsonlock:
+            fp.write(json.dumps(eventdict) + "\n")
+            fp.flush()
+    return callback
+
+def consoleline(fp: TextIO=sys.stderr) -> ProgressCallback:
+    '''
+    Redraws a single aggregate status line
+    '''
+    def callback(event: ProgressEvent) -> None:
+        if event.event == "file_start":
+            return
+        total = event.bytes_total / 1024**3
+        done = event.bytes_done / 1024**3
+        pct = event.bytes_done / event.bytes_total if event.bytes_total else 1.0
+        eta = "--" if event.eta is None else time.strftime("%H:%M:%S", time.gmtime(event.eta))
+        line = (
+            f"Checksums: {event.files_done}/{event.files_total} files, "
+            f"{done:.2f}/{total:.2f} GiB ({pct:.0%}), {event.rate:.1f} MB/s, ETA {eta}"
+        )
+        end = "\n" if event.event == "done" else ""
+        fp.write(f"\r\033[K{line}{end}")
+        fp.flush()
+    return callback
@@ -0,0 +1,180 @@
+import os
+import mmap
+import queue
+import threading
+from pathlib import Path
+from typing import Iterator
+from abc import ABC, abstractmethod
+from .defaults import DEFAULT_READER
+
+CHUNKSIZE = 8 * 1024 * 1024
+
+class BufferPool:
+    '''
+    Hands out preallocated, fixed size bytearrays so readers never allocate per chunk.
+    Buffers are only created when the pool runs dry and are kept for reuse.
+    '''
+    def __init__(self, chunksize: int=CHUNKSIZE, prealloc: int=0) -> None:
+        self.chunksize = chunksize
+        self._free: queue.SimpleQueue[bytearray] = queue.SimpleQueue()
+        self.preallocate(prealloc)
+
+    def preallocate(self, count: int) -> None:
+        for _ in range(count):
+            self._free.put(bytearray(self.chunksize))
+
+    def acquire(self) -> bytearray:
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            return bytearray(self.chunksize)
+
+    def release(self, buffer: bytearray) -> None:
+        self._free.put(buffer)
+
+class Reader(ABC):
+    name = ""
+
+    def __init__(self, chunksize: int=CHUNKSIZE, pool: BufferPool | None=None) -> None:
+        self.chunksize = chunksize
+        self.pool = pool or BufferPool(chunksize)
+
+    @abstractmethod
+    def chunks(self, file: Path) -> Iterator[memoryview]:
+        '''
+        Yields the contents of 'file' in order.
+        A chunk is only valid until the next one is requested.
+        '''
+
+class ReadintoReader(Reader):
+    '''
+    Unbuffered readinto() into a pooled buffer
+    '''
+    name = "readinto"
+
+    def chunks(self, file: Path) -> Iterator[memoryview]:
+        buffer = self.pool.acquire()
+        try:
+            with memoryview(buffer) as view, open(file, "rb", buffering=0) as fp:
+                self._advise(fp.fileno())
+                offset = 0
+                while True:
+                    size = fp.readinto(buffer)
+                    if not size:
+                        break
+                    with view[:size] as chunk:
+                        yield chunk
+                    self._consumed(fp.fileno(), offset, size)
+                    offset += size
+        finally:
+            self.pool.release(buffer)
+
+    def _advise(self, fd: int) -> None:
+        pass
+
+    def _consumed(self, fd: int, offset: int, size: int) -> None:
+        pass
+
+class FadviseReader(ReadintoReader):
+    '''
+    readinto() with POSIX_FADV_SEQUENTIAL on open and POSIX_FADV_DONTNEED behind the
+    read position, so hashing large masters doesn't evict other processes' page cache.
+    Behaves like 'readinto' where posix_fadvise is unavailable (MacOS).
+    '''
+    name = "fadvise"
+
+    def _advise(self, fd: int) -> None:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def _consumed(self, fd: int, offset: int, size: int) -> None:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, offset, size, os.POSIX_FADV_DONTNEED)
+
+class MmapReader(Reader):
+    '''
+    Maps the file read-only with MADV_SEQUENTIAL and drops each window once hashed
+    '''
+    name = "mmap"
+
+    def chunks(self, file: Path) -> Iterator[memoryview]:
+        with open(file, "rb", buffering=0) as fp:
+            size = os.fstat(fp.fileno()).st_size
+            if not size:
+                return
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mm) as view:
+                    for offset in range(0, size, self.chunksize):
+                        length = min(self.chunksize, size - offset)
+                        with view[offset:offset + length] as chunk:
+                            yield chunk
+                        self._consumed(mm, fp.fileno(), offset, length)
+
+    def _consumed(self, mm: mmap.mmap, fd: int, offset: int, size: int) -> None:
+        if hasattr(mmap, "MADV_DONTNEED") and offset % mmap.PAGESIZE == 0:
+            mm.madvise(mmap.MADV_DONTNEED, offset, size)
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, offset, size, os.POSIX_FADV_DONTNEED)
+
+class ThreadedReader(Reader):
+    '''
+    Double-buffered read-ahead: a helper thread fills one pooled buffer
+    while the caller hashes the other.
+    '''
+    name = "threaded"
+
+    def chunks(self, file: Path) -> Iterator[memoryview]:
+        buffers = [self.pool.acquire(), self.pool.acquire()]
+        free: queue.SimpleQueue[int | None] = queue.SimpleQueue()
+        filled: queue.SimpleQueue[tuple[int, int] | BaseException] = queue.SimpleQueue()
+        free.put(0)
+        free.put(1)
+        fp = open(file, "rb", buffering=0)
+
+        def readahead() -> None:
+            try:
+                while True:
+                    index = free.get()
+                    if index is None:
+                        return
+                    size = fp.readinto(buffers[index])
+                    filled.put((index, size))
+                    if not size:
+                        return
+            except BaseException as e:
+                filled.put(e)
+
+        thread = threading.Thread(target=readahead, name=f"readahead-{file.name}", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = filled.get()
+                if isinstance(item, BaseException):
+                    raise item
+                index, size = item
+                if not size:
+                    break
+                with memoryview(buffers[index]) as view, view[:size] as chunk:
+                    yield chunk
+                free.put(index)
+        finally:
+            free.put(None)
+            thread.join()
+            fp.close()
+            for buffer in buffers:
+                self.pool.release(buffer)
+
+READERS: dict[str, type[Reader]] = {
+    ReadintoReader.name: ReadintoReader,
+    FadviseReader.name: FadviseReader,
+    MmapReader.name: MmapReader,
+    ThreadedReader.name: ThreadedReader,
+}
+
+def get_reader(name: str=DEFAULT_READER, chunksize: int=CHUNKSIZE, pool: BufferPool | None=None) -> Reader:
+    reader = READERS.get(name.lower())
+    if reader is None:
+        raise ValueError(f"Unknown read backend '{name}'. Options: {', '.join(READERS)}")
+    return reader(chunksize, pool)
@@ -0,0 +1,180 @@
+import os
+import time
+import threading
+from pathlib import Path
+from concurrent import futures
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+SMALLFILE = 4 * 1024 * 1024
+BATCHSIZE = 64 * 1024 * 1024
+
+@dataclass
+class HashTask:
+    device: int
+    files: list[tuple[Path, os.stat_result]] = field(default_factory=list)
+    size: int = 0
+
+    def add(self, path: Path, stat: os.stat_result) -> None:
+        self.files.append((path, stat))
+        self.size += stat.st_size
+
+@dataclass
+class WorkerStats:
+    worker: int
+    busy: float = 0.0
+    elapsed: float = 0.0
+    tasks: int = 0
+    files: int = 0
+    bytes: int = 0
+
+    @property
+    def utilization(self) -> float:
+        if not self.elapsed:
+            return 0.0
+        return self.busy / self.elapsed
+
+class Scheduler:
+    '''
+    Runs per-file work on one bounded thread pool.
+    Files are grouped by storage device (st_dev) and each device is capped at 'devicejobs'
+    concurrent tasks. Within a device the largest task is always dispatched first, and files
+    under 'smallfile' bytes are batched into tasks of up to 'batchsize' bytes.
+    One Scheduler can be shared by several threads (e.g. deliveries in a batch): concurrent
+    run() calls share its pool of 'jobs' threads and the per-device limits, stats are kept
+    per calling thread. The pool is started by the first run() and stopped after the last.
+    '''
+    def __init__(self, jobs: int | None=None, devicejobs: int | None=None,
+                smallfile: int=SMALLFILE, batchsize: int=BATCHSIZE) -> None:
+        if jobs is None:
+            jobs = min(32, (os.cpu_count() or 1) + 4)
+        if jobs < 1:
+            raise ValueError(f"jobs must be at least 1: {jobs}")
+        if devicejobs is not None and devicejobs < 1:
+            raise ValueError(f"devicejobs must be at least 1: {devicejobs}")
+        self.jobs = jobs
+        self.devicejobs = devicejobs or jobs
+        self.smallfile = smallfile
+        self.batchsize = batchsize
+        self._cond = threading.Condition()
+        self._active: dict[int, int] = {}
+        self._running = 0
+        self._users = 0
+        self._executor: futures.ThreadPoolExecutor | None = None
+        self._local = threading.local()
+
+    @property
+    def stats(self) -> list[WorkerStats]:
+        return getattr(self._local, "stats", [])
+
+    @property
+    def elapsed(self) -> float:
+        return getattr(self._local, "elapsed", 0.0)
+
+    def plan(self, files: list[tuple[Path, os.stat_result]]) -> list[HashTask]:
+        tasks: list[HashTask] = []
+        batches: dict[int, HashTask] = {}
+        for path, stat in sorted(files, key=lambda f: f[1].st_size, reverse=True):
+            if stat.st_size >= self.smallfile:
+                task = HashTask(stat.st_dev)
+                task.add(path, stat)
+                tasks.append(task)
+                continue
+            batch = batches.get(stat.st_dev)
+            if batch is None or batch.size + stat.st_size > self.batchsize:
+                batch = HashTask(stat.st_dev)
+                batches[stat.st_dev] = batch
+                tasks.append(batch)
+            batch.add(path, stat)
+        tasks.sort(key=lambda t: t.size, reverse=True)
+        return tasks
+
+    def run(self, tasks: list[HashTask], func: Callable[[Path, os.stat_result], T]) -> list[T]:
+        '''
+        Calls 'func' on every file of 'tasks' and returns the results. The calling thread
+        dispatches each task to the one thread pool shared by every concurrent run() as soon
+        as the 'jobs' and per-device limits allow. The first exception stops dispatching and
+        is raised once the running tasks have finished.
+        '''
+        pending: dict[int, deque[HashTask]] = {}
+        for task in sorted(tasks, key=lambda t: t.size, reverse=True):
+            pending.setdefault(task.device, deque()).append(task)
+        cond = self._cond
+        results: list[T] = []
+        errors: list[BaseException] = []
+        workerstats: dict[int, WorkerStats] = {}
+        inflight = 0
+
+        def runtask(task: HashTask) -> None:
+            nonlocal inflight
+            taskstart = time.perf_counter()
+            with cond:
+                stats = workerstats.setdefault(threading.get_ident(), WorkerStats(len(workerstats)))
+            try:
+                for path, stat in task.files:
+                    result = func(path, stat)
+                    with cond:
+                        results.append(result)
+                    stats.files += 1
+                    stats.bytes += stat.st_size
+            except BaseException as e:
+                with cond:
+                    errors.append(e)
+            finally:
+                stats.busy += time.perf_counter() - taskstart
+                stats.tasks += 1
+                with cond:
+                    self._active[task.device] -= 1
+                    self._running -= 1
+                    inflight -= 1
+                    cond.notify_all()
+
+        started = time.perf_counter()
+        executor: futures.ThreadPoolExecutor | None = None
+        with cond:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="hash")
+            self._users += 1
+            try:
+                while True:
+                    if errors or not any(pending.values()):
+                        if not inflight:
+                            break
+                    elif self._running < self.jobs:
+                        ready = [q for dev, q in pending.items() if q and self._active.get(dev, 0) < self.devicejobs]
+                        if ready:
+                            task = max(ready, key=lambda q: q[0].size).popleft()
+                            self._active[task.device] = self._active.get(task.device, 0) + 1
+                            self._running += 1
+                            inflight += 1
+                            self._executor.submit(runtask, task)
+                            continue
+                    cond.wait()
+            finally:
+                self._users -= 1
+                if not self._users:
+                    # The last run out stops the pool, an idle Scheduler holds no threads
+                    executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        elapsed = time.perf_counter() - started
+        allstats = sorted(workerstats.values(), key=lambda stats: stats.worker)
+        for stats in allstats:
+            stats.elapsed = elapsed
+        self._local.stats = allstats
+        self._local.elapsed = elapsed
+        if errors:
+            raise errors[0]
+        return results
+
+    def report(self) -> str:
+        lines = [f"Scheduler: {len(self.stats)} workers, {self.elapsed:.2f}s wall"]
+        for stats in self.stats:
+            lines.append(
+                f"  worker {stats.worker}: busy {stats.busy:.2f}s ({stats.utilization:.0%}), "
+                f"{stats.tasks} tasks, {stats.files} files, {stats.bytes / 1024**2:.1f} MiB"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,213 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+from pathlib import Path
+from typing import Iterator
+from abc import ABC, abstractmethod
+from .defaults import DEBOUNCE
+from .datafile import SHARDDIR
+
+POLL_INTERVAL = 1.0
+
+# linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCHMASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+EVENT = struct.Struct("iIII")
+
+# Returned when changes were lost and everything has to be assumed changed
+OVERFLOW = "*"
+
+SEASONSDIR = f"data/{SHARDDIR}"
+
+def relevant(dirname: str, name: str) -> bool:
+    '''
+    Only data.json, the season files of a sharded data.json and resource files matter.
+    Hidden files (partial copies, temp files) and the MEC xmls this tool writes into
+    resources/ are ignored.
+    '''
+    if not name or name[0] == ".":
+        return False
+    if dirname == "data":
+        return name == "data.json"
+    if dirname == SEASONSDIR:
+        return os.path.splitext(name)[1].lower() == ".json"
+    return os.path.splitext(name)[1].lower() != ".xml"
+
+class Watcher(ABC):
+    name = ""
+
+    def __init__(self, rootdir: Path) -> None:
+        self.rootdir = rootdir
+        self.dirs = {"data": rootdir / "data", SEASONSDIR: rootdir / SEASONSDIR, "resources": rootdir / "resources"}
+
+    @abstractmethod
+    def poll(self, timeout: float | None) -> set[str]:
+        '''
+        Waits up to 'timeout' seconds (forever if None) for changes and returns the
+        changed paths relative to the root, e.g. 'resources/EP101.mov'
+        '''
+
+    def close(self) -> None:
+        pass
+
+    def changes(self, debounce: float=DEBOUNCE) -> Iterator[set[str]]:
+        '''
+        Yields batches of changes. A batch is only yielded once nothing has changed
+        for 'debounce' seconds, so files still being copied are picked up whole.
+        '''
+        while True:
+            changed = self.poll(None)
+            if not changed:
+                continue
+            while more := self.poll(debounce):
+                changed |= more
+            yield changed
+
+    def __enter__(self) -> "Watcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class InotifyWatcher(Watcher):
+    '''
+    Linux inotify through ctypes, files are reported once closed after writing
+    or moved into place. data/seasons is watched from when it's created.
+    '''
+    name = "inotify"
+
+    def __init__(self, rootdir: Path) -> None:
+        super().__init__(rootdir)
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._wds: dict[int, str] = {}
+        try:
+            for dirname in self.dirs:
+                if dirname != SEASONSDIR or self.dirs[SEASONSDIR].is_dir():
+                    self._addwatch(dirname)
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def _addwatch(self, dirname: str) -> None:
+        path = self.dirs[dirname]
+        # data/ also reports directories created in it, to pick up data/seasons
+        mask = WATCHMASK | IN_CREATE if dirname == "data" else WATCHMASK
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            import ctypes
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        self._wds[wd] = dirname
+
+    def poll(self, timeout: float | None) -> set[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed: set[str] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    changed.add(OVERFLOW)
+                    continue
+                dirname = self._wds.get(wd)
+                if mask & IN_ISDIR:
+                    if dirname == "data" and mask & (IN_CREATE | IN_MOVED_TO) and f"data/{name}" == SEASONSDIR:
+                        # Season files may have been written before the watch was in place
+                        self._addwatch(SEASONSDIR)
+                        changed.add(OVERFLOW)
+                    continue
+                if dirname is not None and relevant(dirname, name):
+                    changed.add(f"{dirname}/{name}")
+        return changed
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher(Watcher):
+    '''
+    Compares (size, mtime_ns) snapshots every 'interval' seconds
+    '''
+    name = "polling"
+
+    def __init__(self, rootdir: Path, interval: float=POLL_INTERVAL) -> None:
+        super().__init__(rootdir)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def poll(self, timeout: float | None) -> set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return set()
+                time.sleep(min(self.interval, remaining))
+            snapshot = self._scan()
+            changed = {
+                path for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self._snapshot = snapshot
+            if changed:
+                return changed
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot: dict[str, tuple[int, int]] = {}
+        for dirname, path in self.dirs.items():
+            try:
+                entries = os.scandir(path)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if not relevant(dirname, entry.name) or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    snapshot[f"{dirname}/{entry.name}"] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+def get_watcher(rootdir: Path, polling: bool=False) -> Watcher:
+    '''
+    inotify where available, polling otherwise or if 'polling' (e.g. for network mounts,
+    which don't deliver inotify events for changes made by other hosts)
+    '''
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(rootdir)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(rootdir)
@@ -1,5 +1,9 @@
+import io
+from typing import BinaryIO
 from xml.etree import ElementTree as ET
 
+from .profiler import PROFILER
+
 NS_RESIGESTER = {
     "manifest": "http://www.movielabs.com/schema/manifest/v1.10/manifest",
     "xsi": "http://www.w3.org/2001/XMLSchema-instance",
@@ -39,4 +43,153 @@ def str_to_element(nskey: str, tag: str, text: str) -> ET.Element:
     ns = NS[nskey]+tag
     root = ET.Element(ns)
     root.text = text
-    return root
\ No newline at end of file
+    return root
+
+def indent(elem: ET.Element, level: int=0, spaces: int=4) -> None:
+    '''
+    Adds newlines and tabs to xml so it's not all on 1 line.
+    Pass the root element into 'elem'
+    '''
+    i = "\n" + level*(" "*spaces)
+    if len(elem):
+        if not elem.text or not elem.text.strip():
+            elem.text = i + (" "*spaces)
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+        for elem in elem:
+            indent(elem, level+1, spaces)
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+    else:
+        if level and (not elem.tail or not elem.tail.strip()):
+            elem.tail = i
+
+def tobytes(root: ET.Element, encoding: str="UTF-8", xmldecl: bool=True) -> bytes:
+    '''
+    Indents 'root' and serializes it exactly as it's written to disk
+    '''
+    with PROFILER.span("indent"):
+        indent(root)
+    with PROFILER.span("serialize"):
+        buffer = io.BytesIO()
+        ET.ElementTree(root).write(buffer, encoding=encoding, xml_declaration=xmldecl)
+        return buffer.getvalue()
+
+QNAMES = {uri: prefix for prefix, uri in NS_RESIGESTER.items()}
+
+def qname(tag: str) -> str:
+    if tag[0] != "{":
+        return tag
+    uri, local = tag[1:].split("}", 1)
+    prefix = QNAMES.get(uri)
+    if prefix is None:
+        raise ValueError(f"Unregistered namespace: {uri}")
+    return f"{prefix}:{local}"
+
+def escape_cdata(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def escape_attrib(text: str) -> str:
+    text = escape_cdata(text).replace("\"", "&quot;")
+    return text.replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#09;")
+
+def serialize(elem: ET.Element, parts: list[str]) -> None:
+    '''
+    Serializes 'elem' into 'parts' the way ElementTree.write does, using the registered
+    prefixes and without namespace declarations
+    '''
+    tag = qname(elem.tag)
+    parts.append("<" + tag)
+    for k, v in elem.items():
+        parts.append(f" {qname(k)}=\"{escape_attrib(v)}\"")
+    if elem.text or len(elem):
+        parts.append(">")
+        if elem.text:
+            parts.append(escape_cdata(elem.text))
+        for child in elem:
+            serialize(child, parts)
+        parts.append("</" + tag + ">")
+    else:
+        parts.append(" />")
+    if elem.tail:
+        parts.append(escape_cdata(elem.tail))
+
+class XMLStreamWriter:
+    '''
+    Writes an indented xml document one element at a time so the whole tree never
+    has to be held in memory. The output matches indent() + ElementTree.write.
+    '''
+    def __init__(self, fp: BinaryIO, encoding: str="UTF-8", spaces: int=4) -> None:
+        self.fp = fp
+        self.encoding = encoding
+        self.spaces = spaces
+        self._stack: list[tuple[str, bool]] = []
+
+    @property
+    def level(self) -> int:
+        return len(self._stack)
+
+    def start_document(self, root: ET.Element, namespaces: list[str]) -> None:
+        self._write(f"<?xml version='1.0' encoding='{self.encoding}'?>\n")
+        tag = qname(root.tag)
+        parts = ["<" + tag]
+        for prefix in sorted(namespaces):
+            parts.append(f" xmlns:{prefix}=\"{escape_attrib(NS_RESIGESTER[prefix])}\"")
+        for k, v in root.items():
+            parts.append(f" {qname(k)}=\"{escape_attrib(v)}\"")
+        self._write("".join(parts))
+        self._stack.append((tag, False))
+
+    def start(self, elem: ET.Element) -> None:
+        '''
+        Opens 'elem' as a container, its own children are ignored
+        '''
+        self._child()
+        parts = ["<" + qname(elem.tag)]
+        for k, v in elem.items():
+            parts.append(f" {qname(k)}=\"{escape_attrib(v)}\"")
+        self._write("".join(parts))
+        self._stack.append((qname(elem.tag), False))
+
+    def write(self, elem: ET.Element) -> None:
+        self.write_fragment(self.fragment(elem))
+
+    def fragment(self, elem: ET.Element) -> str:
+        '''
+        Serializes 'elem' as a child of the open element without writing it.
+        The text can be passed to write_fragment() at the same depth.
+        '''
+        indent(elem, self.level, self.spaces)
+        elem.tail = None
+        parts: list[str] = []
+        serialize(elem, parts)
+        return "".join(parts)
+
+    def write_fragment(self, text: str) -> None:
+        self._child()
+        self._write(text)
+
+    def end(self) -> None:
+        tag, haschildren = self._stack.pop()
+        if haschildren:
+            self._write(self._newline(self.level) + f"</{tag}>")
+            if not self._stack:
+                # indent() gives a root with children a trailing newline
+                self._write("\n")
+        else:
+            self._write(" />")
+
+    def _child(self) -> None:
+        if not self._stack:
+            raise RuntimeError("XMLStreamWriter has no open element")
+        tag, haschildren = self._stack[-1]
+        if not haschildren:
+            self._write(">")
+            self._stack[-1] = (tag, True)
+        self._write(self._newline(self.level))
+
+    def _newline(self, level: int) -> str:
+        return "\n" + level*(" "*self.spaces)
+
+    def _write(self, text: str) -> None:
+        self.fp.write(text.encode(self.encoding, "xmlcharrefreplace"))
@@ -0,0 +1,225 @@
+import sys
+import time
+import logging
+import dataclasses
+import multiprocessing
+from pathlib import Path
+from concurrent import futures
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from typing import Callable, Iterator, TextIO
+
+from .libs.args import MMCArgs
+from .libs.delivery import Delivery
+from .libs.scheduler import Scheduler
+from .libs.checksums import VerifyReport
+from .libs.profiler import PROFILER
+from .libs.progress import Progress, consoleline, jsonlines
+from .libs.watch import OVERFLOW, get_watcher
+from .libs.batch import BatchResult, DeliveryLogHandler, DeliveryPrefixWriter, current_delivery, summary
+
+BATCH_JOBS = 4
+
+def progress_output(args: MMCArgs, stack: ExitStack) -> TextIO | None:
+    '''
+    Where --progress-json events go: stdout for "-", else the file opened for appending
+    '''
+    if args.progress_json is None:
+        return None
+    if str(args.progress_json) == "-":
+        return sys.stdout
+    return stack.enter_context(open(args.progress_json, "a", encoding="UTF-8"))
+
+def checksum_progress(args: MMCArgs, stack: ExitStack) -> Progress:
+    callbacks = [consoleline()]
+    fp = progress_output(args, stack)
+    if fp is not None:
+        callbacks.append(jsonlines(fp))
+    return Progress(*callbacks)
+
+def write_verify_report(deliv: Delivery, report: VerifyReport) -> str:
+    '''
+    Saves 'report' to data/verify.json and returns its json
+    '''
+    reportjson = report.to_json()
+    with open(deliv.rootdir / "data" / "verify.json", "w", encoding="UTF-8") as fp:
+        fp.write(reportjson)
+    return reportjson
+
+def verify(deliv: Delivery, args: MMCArgs, progress: Progress, scheduler: Scheduler | None=None) -> bool:
+    report = deliv.verify(args.jobs, args.device_jobs, args.read_backend, progress, scheduler)
+    print(write_verify_report(deliv, report))
+    if not report.ok:
+        logging.error(f"Verification failed: {len(report.missing)} missing, "
+                      f"{len(report.extra)} extra, {len(report.mismatched)} mismatched")
+        return False
+    logging.info("Checksums verified successfully")
+    return True
+
+def report_rebuilds(deliv: Delivery) -> int:
+    rebuilds = deliv.pop_rebuilds()
+    for target, reasons in rebuilds.items():
+        msg = f"Rebuilding {target}: {', '.join(reasons)}"
+        print(msg)
+        logging.info(msg)
+    return len(rebuilds)
+
+@contextmanager
+def timed(steps: dict[str, float], name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        with PROFILER.span(name):
+            yield
+    finally:
+        steps[name] = time.perf_counter() - started
+
+def run_steps(deliv: Delivery, args: MMCArgs, progress: Callable[[], Progress], steps: dict[str, float],
+              scheduler: Scheduler | None=None, executor: futures.Executor | None=None) -> bool:
+    '''
+    Runs every requested step on 'deliv', recording each step's seconds in 'steps'.
+    'progress' creates the Progress of each checksum step. Returns False if verification failed.
+    '''
+    if args.ingest:
+        with timed(steps, "ingest"):
+            deliv.ingest(args.ingest, args.jobs, args.device_jobs, args.read_backend, progress(), scheduler=scheduler)
+            logging.info("Resources ingested successfully")
+    if args.mec:
+        with timed(steps, "mec"):
+            changed = deliv.write_mecs(args.jobs, executor)
+            rebuilt = report_rebuilds(deliv)
+            for name in changed:
+                logging.info(f"MEC changed: {name}")
+            uptodate = len(deliv.mecs.all) - rebuilt
+            counts = f"{rebuilt} rebuilt, {len(changed)} changed, {uptodate} up to date"
+            print(f"MECs: {counts}")
+            logging.info(f"MECs written successfully ({counts})")
+    if args.md5:
+        with timed(steps, "md5"):
+            deliv.checksums(args.jobs, args.device_jobs, args.read_backend, progress(), scheduler)
+            logging.info("Checksums created successfully")
+    if args.mmc:
+        with timed(steps, "mmc"):
+            written = deliv.write_mmc(args.stream)
+            report_rebuilds(deliv)
+            if written:
+                logging.info("MMC written successfully")
+            else:
+                print("MMC unchanged")
+                logging.info("MMC unchanged")
+    if args.verify:
+        with timed(steps, "verify"):
+            return verify(deliv, args, progress(), scheduler)
+    return True
+
+def run_batch_delivery(rootdir: Path, args: MMCArgs, loghandler: DeliveryLogHandler,
+                       scheduler: Scheduler, executor: futures.Executor | None,
+                       progressfp: TextIO | None=None) -> BatchResult:
+    '''
+    Runs one delivery of a batch. Failures are recorded in the result, never raised,
+    so one bad delivery doesn't stop the others. With 'progressfp' its checksum
+    progress events are written there, tagged with 'rootdir'.
+    '''
+    result = BatchResult(rootdir)
+    token = current_delivery.set(rootdir)
+    started = time.perf_counter()
+    try:
+        if not rootdir.is_dir():
+            raise FileNotFoundError(f"Not a valid directory: {rootdir}")
+        loghandler.open(rootdir)
+        # The console progress line can't be shared by deliveries running side by side
+        callbacks = [] if progressfp is None else [jsonlines(progressfp, str(rootdir))]
+        deliv = Delivery(rootdir, args.digests, rebuild=args.rebuild)
+        if not run_steps(deliv, args, lambda: Progress(*callbacks), result.steps, scheduler, executor):
+            result.status = "verify failed"
+    except Exception as e:
+        result.status = "failed"
+        result.error = f"{type(e).__name__}: {e}"
+        logging.exception(e)
+    finally:
+        result.elapsed = time.perf_counter() - started
+        loghandler.close_delivery(rootdir)
+        current_delivery.reset(token)
+    return result
+
+def batch(args: MMCArgs) -> None:
+    '''
+    Processes every root in 'args.rootdirs', up to 'batch_jobs' at a time. All deliveries
+    hash on one shared Scheduler and build MECs on one shared process pool.
+    Each delivery logs to its own log.txt and its printed lines are prefixed with its rootdir.
+    Ends with a summary table and exits 1 if any failed.
+    '''
+    loghandler = DeliveryLogHandler()
+    rootlogger = logging.getLogger()
+    rootlogger.setLevel(logging.INFO)
+    rootlogger.addHandler(loghandler)
+    scheduler = Scheduler(args.jobs, args.device_jobs)
+    with ExitStack() as stack:
+        progressfp = progress_output(args, stack)
+        stack.enter_context(redirect_stdout(DeliveryPrefixWriter(sys.stdout)))
+        executor = None
+        if args.mec:
+            # Workers are spawned, forking while delivery threads hold locks isn't safe
+            executor = stack.enter_context(futures.ProcessPoolExecutor(
+                max_workers=args.jobs, mp_context=multiprocessing.get_context("spawn")
+            ))
+        batchjobs = min(args.batch_jobs or BATCH_JOBS, len(args.rootdirs))
+        with futures.ThreadPoolExecutor(max_workers=batchjobs) as pool:
+            results = list(pool.map(
+                lambda rootdir: run_batch_delivery(rootdir, args, loghandler, scheduler, executor, progressfp),
+                args.rootdirs
+            ))
+    rootlogger.removeHandler(loghandler)
+    loghandler.close()
+    print(summary(results))
+    if not all(result.ok for result in results):
+        exit(1)
+
+def watch(args: MMCArgs, stack: ExitStack) -> None:
+    '''
+    Brings the delivery up to date, then again after every debounced batch of changes
+    until interrupted. Errors (e.g. an episode whose video hasn't arrived yet) are
+    reported and the delivery keeps being watched.
+    '''
+    stepargs = dataclasses.replace(args, mec=True, md5=True, mmc=True, verify=False, ingest=None)
+
+    def update() -> None:
+        started = time.perf_counter()
+        try:
+            deliv = Delivery(args.rootdir, args.digests, rebuild=args.rebuild)
+            run_steps(deliv, stepargs, lambda: checksum_progress(args, stack), {}, executor=executor)
+        except Exception as e:
+            msg = f"Not ready: {type(e).__name__}: {e}"
+            print(msg)
+            logging.warning(msg)
+            return
+        msg = f"Delivery up to date ({time.perf_counter() - started:.2f}s)"
+        print(msg)
+        logging.info(msg)
+
+    watcher = stack.enter_context(get_watcher(args.rootdir, args.poll))
+    executor = None
+    if args.jobs is not None and args.jobs > 1:
+        executor = stack.enter_context(futures.ProcessPoolExecutor(max_workers=args.jobs))
+    print(f"Watching {args.rootdir} ({watcher.name}), press Ctrl+C to stop")
+    logging.info(f"Watching for changes ({watcher.name})")
+    update()
+    # --rebuild only applies to the first update
+    args = dataclasses.replace(args, rebuild=False)
+    try:
+        for changed in watcher.changes(args.debounce):
+            if OVERFLOW in changed:
+                msg = "Changes: too many to list"
+            else:
+                msg = f"Changes: {', '.join(sorted(changed))}"
+            print(msg)
+            logging.info(msg)
+            update()
+    except KeyboardInterrupt:
+        print("Stopped watching")
+        logging.info("Stopped watching")
+
+def single(args: MMCArgs, stack: ExitStack) -> bool:
+    '''
+    Runs the requested steps on 'args.rootdir', returns False if verification failed
+    '''
+    deliv = Delivery(args.rootdir, args.digests, rebuild=args.rebuild)
+    return run_steps(deliv, args, lambda: checksum_progress(args, stack), {})
@@ -0,0 +1,440 @@
+import json
+import time
+import socket
+import logging
+import threading
+import http.client
+import multiprocessing
+from pathlib import Path
+from concurrent import futures
+from typing import Any
+from dataclasses import dataclass, field, asdict
+from socketserver import ThreadingMixIn, UnixStreamServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import __version__
+from .libs.args import MMCArgs
+from .libs.delivery import Delivery
+from .libs.scheduler import Scheduler
+from .libs.progress import Progress
+from .libs.errors import ServerBusy
+from .libs.readers import DEFAULT_READER
+from .libs.batch import DeliveryLogHandler, current_delivery
+from .runner import timed, write_verify_report
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+SERVER_JOBS = 4
+# Jobs allowed to wait for a free worker, per worker, before new ones are turned away
+QUEUE_FACTOR = 4
+JOBTYPES = ("generate", "hash", "verify")
+
+@dataclass
+class Job:
+    '''
+    A client's request. 'generate' writes the MECs and/or the MMC ('mec', 'mmc'),
+    'hash' updates the checksum manifests and 'verify' re-hashes resources against them.
+    '''
+    type: str
+    rootdir: Path
+    digests: list[str] | None = None
+    rebuild: bool = False
+    stream: bool = False
+    mec: bool = True
+    mmc: bool = True
+
+    @classmethod
+    def from_dict(cls, request: Any) -> "Job":
+        if not isinstance(request, dict):
+            raise ValueError("A job must be a JSON object")
+        unknown = set(request) - {"type", "rootdir", "digests", "rebuild", "stream", "mec", "mmc"}
+        if unknown:
+            raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+        if request.get("type") not in JOBTYPES:
+            raise ValueError(f"Job type must be one of {', '.join(JOBTYPES)}: {request.get('type')}")
+        if not isinstance(request.get("rootdir"), str):
+            raise ValueError("Job rootdir must be a path")
+        digests = request.get("digests")
+        if digests is not None and not (isinstance(digests, list) and all(isinstance(d, str) for d in digests)):
+            raise ValueError("Job digests must be a list of algorithm names")
+        for name in ("rebuild", "stream", "mec", "mmc"):
+            if not isinstance(request.get(name, False), bool):
+                raise ValueError(f"Job {name} must be true or false")
+        return cls(
+            type=request["type"],
+            rootdir=Path(request["rootdir"]),
+            digests=digests,
+            rebuild=request.get("rebuild", False),
+            stream=request.get("stream", False),
+            mec=request.get("mec", True),
+            mmc=request.get("mmc", True)
+        )
+
+@dataclass
+class JobResult:
+    id: int
+    type: str
+    rootdir: str
+    status: str = "ok"
+    error: str = ""
+    warm: bool = False
+    queued: float = 0.0
+    elapsed: float = 0.0
+    steps: dict[str, float] = field(default_factory=dict)
+    result: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+class WarmDelivery:
+    '''
+    A delivery kept parsed between jobs. Jobs hold 'lock', so a delivery runs one job at a time.
+    '''
+    def __init__(self, rootdir: Path) -> None:
+        self.rootdir = rootdir
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.loads = 0
+        self._delivery: Delivery | None = None
+        self._digests: list[str] | None = None
+        self._resourcesmtime: int | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._delivery is not None
+
+    def acquire(self, digests: list[str] | None, rebuild: bool) -> tuple[Delivery, bool]:
+        '''
+        The Delivery for a job and whether it was reused as is. data.json is parsed again
+        if it or one of its season files changed since it was read, if the resources
+        listing changed since the last job started, and for rebuilds.
+        '''
+        self.jobs += 1
+        # Taken before loading, anything changed from here on is seen by the next job
+        resourcesmtime = (self.rootdir / "resources").stat().st_mtime_ns
+        deliv = self._delivery
+        if deliv is None or digests != self._digests:
+            deliv = Delivery(self.rootdir, digests, rebuild=rebuild)
+            self._delivery, self._digests = deliv, digests
+        elif rebuild or deliv.rebuild or self.changed(deliv) or resourcesmtime != self._resourcesmtime:
+            deliv.reload(rebuild)
+        else:
+            return deliv, True
+        self._resourcesmtime = resourcesmtime
+        self.loads += 1
+        return deliv, False
+
+    def release(self, ok: bool) -> None:
+        '''
+        After a job. A failed job drops the delivery.
+        '''
+        if not ok:
+            self._delivery = None
+
+    def changed(self, deliv: Delivery) -> bool:
+        '''
+        Whether data.json or a season file differs from when 'deliv' read it
+        '''
+        for path, stat in deliv.datastats().items():
+            try:
+                if deliv.fs.stat(path) != stat:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+class JobRunner:
+    '''
+    Runs jobs on 'workers' threads, keeping every delivery parsed between jobs.
+    Only deliveries at or under one of 'roots' are accepted. Hashing shares one
+    Scheduler ('jobs', 'devicejobs') and with 'jobs' > 1 MECs are built on one process pool.
+    Once 'workers' * QUEUE_FACTOR jobs are waiting for a worker, submit() raises ServerBusy.
+    '''
+    def __init__(self, roots: list[Path], workers: int=SERVER_JOBS, jobs: int | None=None,
+                 devicejobs: int | None=None, reader: str=DEFAULT_READER) -> None:
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1: {workers}")
+        self.roots = [root.resolve() for root in roots]
+        self.workers = workers
+        self.jobs = jobs
+        self.reader = reader
+        self.maxwaiting = workers * QUEUE_FACTOR
+        self.scheduler = Scheduler(jobs, devicejobs)
+        self.loghandler = DeliveryLogHandler()
+        self.completed = 0
+        self.failed = 0
+        self._started = time.perf_counter()
+        self._deliveries: dict[Path, WarmDelivery] = {}
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._nextid = 1
+        self._pool = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._executor: futures.Executor | None = None
+        if jobs is not None and jobs > 1:
+            # Workers are spawned, forking while job threads hold locks isn't safe
+            self._executor = futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, request: Any) -> JobResult:
+        '''
+        Runs a job described by a Job dict and waits for its result. Invalid jobs raise
+        ValueError, PermissionError or FileNotFoundError, failures are reported in the result.
+        '''
+        job = Job.from_dict(request)
+        job.rootdir = self.resolve(job.rootdir)
+        with self._lock:
+            if self._waiting >= self.maxwaiting:
+                raise ServerBusy(self._waiting)
+            self._waiting += 1
+            result = JobResult(self._nextid, job.type, str(job.rootdir))
+            self._nextid += 1
+            warm = self._deliveries.setdefault(job.rootdir, WarmDelivery(job.rootdir))
+        return self._pool.submit(self._run, job, warm, result, time.perf_counter()).result()
+
+    def resolve(self, rootdir: Path) -> Path:
+        path = rootdir.resolve()
+        if not any(path == root or root in path.parents for root in self.roots):
+            raise PermissionError(f"Not under a served root: {rootdir}")
+        if not path.is_dir():
+            raise FileNotFoundError(f"Not a valid directory: {rootdir}")
+        return path
+
+    def status(self) -> dict:
+        with self._lock:
+            deliveries = list(self._deliveries.values())
+            return {
+                "version": __version__,
+                "uptime": round(time.perf_counter() - self._started, 3),
+                "roots": [str(root) for root in self.roots],
+                "workers": self.workers,
+                "running": self._running,
+                "waiting": self._waiting,
+                "completed": self.completed,
+                "failed": self.failed,
+                "deliveries": [
+                    {"rootdir": str(warm.rootdir), "jobs": warm.jobs, "loads": warm.loads, "loaded": warm.loaded}
+                    for warm in deliveries
+                ]
+            }
+
+    def close(self) -> None:
+        self._pool.shutdown()
+        if self._executor is not None:
+            self._executor.shutdown()
+        self.loghandler.close()
+
+    def _run(self, job: Job, warm: WarmDelivery, result: JobResult, submitted: float) -> JobResult:
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+        token = current_delivery.set(job.rootdir)
+        try:
+            # The delivery's log handler is opened, used and closed by one job at a time
+            with warm.lock:
+                # Includes waiting for an earlier job on the same delivery
+                result.queued = round(time.perf_counter() - submitted, 4)
+                started = time.perf_counter()
+                ok = False
+                try:
+                    self.loghandler.open(job.rootdir)
+                    logging.info(f"Job {result.id}: {job.type}")
+                    with timed(result.steps, "load"):
+                        deliv, result.warm = warm.acquire(job.digests, job.rebuild)
+                    self._steps(deliv, job, result)
+                    ok = True
+                except Exception as e:
+                    result.status = "failed"
+                    result.error = f"{type(e).__name__}: {e}"
+                    logging.exception(e)
+                finally:
+                    warm.release(ok)
+                    result.elapsed = round(time.perf_counter() - started, 4)
+                    result.steps = {name: round(seconds, 4) for name, seconds in result.steps.items()}
+                    logging.info(f"Job {result.id}: {result.status} ({result.elapsed:.2f}s)")
+                    self.loghandler.close_delivery(job.rootdir)
+        finally:
+            current_delivery.reset(token)
+            with self._lock:
+                self._running -= 1
+                self.completed += 1
+                if not result.ok:
+                    self.failed += 1
+        print(f"Job {result.id} {job.type} {job.rootdir}: {result.status} ({result.elapsed:.2f}s)")
+        return result
+
+    def _steps(self, deliv: Delivery, job: Job, result: JobResult) -> None:
+        if job.type == "generate":
+            if job.mec:
+                with timed(result.steps, "mec"):
+                    changed = deliv.write_mecs(self.jobs, self._executor)
+                    result.result["mecs"] = {"total": len(deliv.mecs.all), "changed": changed,
+                                             "rebuilt": self._rebuilds(deliv)}
+            if job.mmc:
+                with timed(result.steps, "mmc"):
+                    written = deliv.write_mmc(job.stream)
+                    result.result["mmc"] = {"written": written, "rebuilt": self._rebuilds(deliv)}
+        elif job.type == "hash":
+            with timed(result.steps, "md5"):
+                # A silent Progress, the per file console output isn't wanted in a server
+                deliv.checksums(reader=self.reader, progress=Progress(), scheduler=self.scheduler)
+            cache = deliv.checksumcache
+            result.result = {"files": cache.hits + cache.misses, "cache_hits": cache.hits, "cache_misses": cache.misses}
+        elif job.type == "verify":
+            with timed(result.steps, "verify"):
+                report = deliv.verify(reader=self.reader, progress=Progress(), scheduler=self.scheduler)
+                write_verify_report(deliv, report)
+            result.result = report.to_dict()
+            if not report.ok:
+                result.status = "verify failed"
+
+    def _rebuilds(self, deliv: Delivery) -> dict[str, list[str]]:
+        rebuilds = deliv.pop_rebuilds()
+        for target, reasons in rebuilds.items():
+            logging.info(f"Rebuilding {target}: {', '.join(reasons)}")
+        return rebuilds
+
+class JobHandler(BaseHTTPRequestHandler):
+    '''
+    POST /jobs with a Job as JSON runs it and answers with its JobResult.
+    GET /status answers with the JobRunner's status.
+    '''
+    server: "JobHTTPServer | UnixJobServer"
+
+    def do_GET(self) -> None:
+        if self.path != "/status":
+            self._reply(404, {"error": f"Not found: {self.path}"})
+            return
+        self._reply(200, self.server.runner.status())
+
+    def do_POST(self) -> None:
+        if self.path != "/jobs":
+            self._reply(404, {"error": f"Not found: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            result = self.server.runner.submit(json.loads(self.rfile.read(length)))
+        except ServerBusy as e:
+            self._reply(503, {"error": str(e)})
+        except PermissionError as e:
+            self._reply(403, {"error": str(e)})
+        except FileNotFoundError as e:
+            self._reply(404, {"error": str(e)})
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+        else:
+            self._reply(200, result.to_dict())
+
+    def _reply(self, code: int, body: dict) -> None:
+        data = json.dumps(body).encode("UTF-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class JobHTTPServer(ThreadingHTTPServer):
+    def __init__(self, address: tuple[str, int], runner: JobRunner) -> None:
+        self.runner = runner
+        super().__init__(address, JobHandler)
+
+class UnixJobServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path, runner: JobRunner) -> None:
+        self.runner = runner
+        super().__init__(str(path), JobHandler)
+
+    def get_request(self) -> tuple[socket.socket, tuple[str, int]]:
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler logs the client as a (host, port) pair
+        return request, ("unix", 0)
+
+def make_server(address: str, runner: JobRunner) -> JobHTTPServer | UnixJobServer:
+    '''
+    'address' is 'host:port' or 'unix:/path/to/socket'
+    '''
+    if address.startswith("unix:"):
+        path = Path(address[len("unix:"):])
+        if path.is_socket():
+            # Left behind by a server that didn't shut down cleanly
+            path.unlink()
+        return UnixJobServer(path, runner)
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Server address must be host:port or unix:/path: {address}")
+    return JobHTTPServer((host or "127.0.0.1", int(port)), runner)
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socketpath: str, timeout: float | None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socketpath = socketpath
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socketpath)
+
+class Client:
+    '''
+    Submits jobs to a running server, e.g. Client("unix:/run/amazonmmc.sock").submit("hash", "/mnt/show").
+    Safe to share between threads, every request uses its own connection.
+    '''
+    def __init__(self, address: str=DEFAULT_ADDRESS, timeout: float | None=None) -> None:
+        self.address = address
+        self.timeout = timeout
+
+    def submit(self, type: str, rootdir: str|Path, **options: Any) -> dict:
+        '''
+        Runs a job and returns its JobResult as a dict, see Job for the 'options'
+        '''
+        return self._request("POST", "/jobs", {"type": type, "rootdir": str(rootdir), **options})
+
+    def status(self) -> dict:
+        return self._request("GET", "/status")
+
+    def _request(self, method: str, path: str, body: dict | None=None) -> dict:
+        if self.address.startswith("unix:"):
+            conn: http.client.HTTPConnection = _UnixConnection(self.address[len("unix:"):], self.timeout)
+        else:
+            host, _, port = self.address.rpartition(":")
+            conn = http.client.HTTPConnection(host or "127.0.0.1", int(port), timeout=self.timeout)
+        try:
+            data = None if body is None else json.dumps(body).encode("UTF-8")
+            conn.request(method, path, data, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            reply = json.loads(response.read())
+        finally:
+            conn.close()
+        if response.status == 503:
+            raise ServerBusy()
+        if response.status != 200:
+            raise RuntimeError(f"{response.status} {response.reason}: {reply.get('error')}")
+        return reply
+
+def serve(args: MMCArgs) -> None:
+    '''
+    Serves jobs for the deliveries at or under 'args.rootdirs' until interrupted.
+    Each job logs to its delivery's log.txt.
+    '''
+    runner = JobRunner(args.rootdirs, args.serve_jobs or SERVER_JOBS, args.jobs, args.device_jobs, args.read_backend)
+    rootlogger = logging.getLogger()
+    rootlogger.setLevel(logging.INFO)
+    rootlogger.addHandler(runner.loghandler)
+    address = args.serve or DEFAULT_ADDRESS
+    try:
+        server = make_server(address, runner)
+        print(f"Serving {', '.join(str(root) for root in runner.roots)} on {address}, press Ctrl+C to stop")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Stopped serving")
+        finally:
+            server.server_close()
+            if isinstance(server, UnixJobServer):
+                Path(server.server_address).unlink(missing_ok=True)
+    finally:
+        rootlogger.removeHandler(runner.loghandler)
+        runner.close()
@@ -0,0 +1,161 @@
+"""
+Times every stage of building a delivery on a synthetic catalog (see catalog.py)
+and checks that the outputs are byte-identical to a stored baseline.
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --seasons 20 --episodes 26 --languages EN-US,FR-FR,DE-DE
+    python benchmarks/bench_pipeline.py --update-baseline
+
+Stages run in order on one Delivery without the build or checksum caches, so every
+run does the full work: JSON load, resource scan, MEC build, MEC serialization,
+hashing, MMC build and MMC serialization. 'peak' is the most memory traced by
+tracemalloc during the stage (tracing slows everything down, --no-memory turns it off).
+
+The sha256 of every output is compared to benchmarks/baseline.json for the same catalog
+settings, a difference exits with 1. --update-baseline records the current outputs;
+only do that when an output change is intended.
+"""
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from amazonmmc.libs.delivery import Delivery
+from amazonmmc.libs.checksums import MD5, manifestname, writemanifest
+from amazonmmc.libs.scheduler import Scheduler
+from amazonmmc.libs.xmlhelpers import tobytes
+
+from catalog import MiB, make_catalog
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+class Stages:
+    def __init__(self, memory: bool) -> None:
+        self.memory = memory
+        self.results: list[tuple[str, float, int | None]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if self.memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if self.memory else None
+        self.results.append((name, elapsed, peak))
+
+    def table(self) -> str:
+        lines = [f"{'stage':<18} {'seconds':>9} {'peak MiB':>9}"]
+        for name, elapsed, peak in self.results:
+            peakstr = "n/a" if peak is None else f"{peak / MiB:.1f}"
+            lines.append(f"{name:<18} {elapsed:>9.3f} {peakstr:>9}")
+        lines.append(f"{'total':<18} {sum(r[1] for r in self.results):>9.3f}")
+        return "\n".join(lines)
+
+def run(rootdir: Path, jobs: int | None, stages: Stages) -> dict[str, str]:
+    '''
+    Builds everything for the delivery at 'rootdir', returns {output name: sha256}
+    '''
+    outputs: dict[str, bytes] = {}
+    with stages.stage("json load"):
+        deliv = Delivery(rootdir, buildcache=False)
+        deliv.data
+    with stages.stage("scan"):
+        deliv.mecs.generalmedia.index.files
+    with stages.stage("mec build"):
+        deliv.mecs.generate()
+    with stages.stage("mec serialize"):
+        for mec in deliv.mecs.all:
+            data = tobytes(mec.rootelem)
+            (deliv.resourcedir / mec.outputname).write_bytes(data)
+            outputs[mec.outputname] = data
+    with stages.stage("hashing"):
+        md5 = MD5(rootdir, scheduler=Scheduler(jobs), algorithms=deliv.algorithms)
+        for algo, hashes in md5.run_all(verbose=False).items():
+            path = rootdir / "data" / manifestname(algo)
+            writemanifest(path, hashes)
+            outputs[path.name] = path.read_bytes()
+    with stages.stage("mmc build"):
+        deliv.mmc.generate()
+    with stages.stage("mmc serialize"):
+        data = tobytes(deliv.mmc.rootelem)
+        (rootdir / deliv.mmc.outputname).write_bytes(data)
+        outputs[deliv.mmc.outputname] = data
+    return {name: hashlib.sha256(data).hexdigest() for name, data in sorted(outputs.items())}
+
+def compare(expected: dict[str, str], actual: dict[str, str]) -> list[str]:
+    problems = [f"missing: {name}" for name in sorted(expected.keys() - actual.keys())]
+    problems += [f"unexpected: {name}" for name in sorted(actual.keys() - expected.keys())]
+    problems += [f"changed: {name}" for name in sorted(expected.keys() & actual.keys()) if expected[name] != actual[name]]
+    return problems
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the delivery pipeline on a synthetic catalog")
+    parser.add_argument("--seasons", type=int, default=4)
+    parser.add_argument("--episodes", type=int, default=26, help="Episodes per season (max 99)")
+    parser.add_argument("--languages", default="EN-US,FR-FR")
+    parser.add_argument("--video-size", type=int, default=8, help="MiB per video file")
+    parser.add_argument("--subtitle-size", type=int, default=64, help="KiB per subtitle file")
+    parser.add_argument("--dense", action="store_true", help="Write real data instead of sparse files")
+    parser.add_argument("--sharded", action="store_true", help="One data file per season, loaded during the MEC build")
+    parser.add_argument("-j", "--jobs", type=int, help="Hashing workers")
+    parser.add_argument("--keep", type=Path, help="Build the catalog here and keep it instead of a temp dir")
+    parser.add_argument("--no-memory", action="store_true", help="Don't trace memory")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    languages = args.languages.split(",")
+    # Only settings that change output bytes, --dense writes different media so it's included.
+    # --sharded must produce the same outputs as a single data.json, so it shares the baseline.
+    config = f"s{args.seasons}-e{args.episodes}-{'+'.join(languages)}-v{args.video_size}-t{args.subtitle_size}"
+    if args.dense:
+        config += "-dense"
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        rootdir = args.keep or Path(tempdir) / "catalog"
+        started = time.perf_counter()
+        make_catalog(rootdir, args.seasons, args.episodes, languages,
+                     args.video_size * MiB, args.subtitle_size * 1024, args.dense, args.sharded)
+        resources = sum(1 for _ in (rootdir / "resources").iterdir())
+        print(f"Catalog {config}: {args.seasons * args.episodes} episodes, {resources} resources "
+              f"({time.perf_counter() - started:.2f}s to generate)")
+
+        stages = Stages(not args.no_memory)
+        if stages.memory:
+            tracemalloc.start()
+        try:
+            actual = run(rootdir, args.jobs, stages)
+        finally:
+            if stages.memory:
+                tracemalloc.stop()
+    print(stages.table())
+
+    baseline: dict[str, dict[str, str]] = {}
+    if BASELINE.is_file():
+        baseline = json.loads(BASELINE.read_text(encoding="UTF-8"))
+    if args.update_baseline:
+        baseline[config] = actual
+        BASELINE.write_text(json.dumps(baseline, indent=4, sort_keys=True) + "\n", encoding="UTF-8")
+        print(f"Baseline for {config} updated ({len(actual)} outputs)")
+        return
+    if config not in baseline:
+        print(f"No baseline for {config}, run with --update-baseline to record one")
+        return
+    problems = compare(baseline[config], actual)
+    if problems:
+        print(f"Outputs differ from the baseline for {config}:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print(f"Outputs match the baseline ({len(actual)} files)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compares the checksum read backends on this host.
+
+    python benchmarks/bench_readers.py /path/to/master.mov [...]
+    python benchmarks/bench_readers.py --size 2048
+
+With no paths a temporary file of --size MiB is created. Before every run the file's
+pages are dropped from the page cache with POSIX_FADV_DONTNEED (no root needed), so
+each backend starts cold. 'cached' is how much of the file is still resident afterwards;
+lower means the backend leaves more room for other workloads.
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from amazonmmc.libs.readers import READERS, CHUNKSIZE, get_reader
+
+
+def dropcache(path: Path) -> None:
+    if not hasattr(os, "posix_fadvise"):
+        return
+    with open(path, "rb") as fp:
+        # Dirty pages can't be dropped, flush them first
+        os.fsync(fp.fileno())
+        os.posix_fadvise(fp.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+def resident(path: Path) -> float | None:
+    '''
+    Fraction of the file in the page cache, using mincore(2) through ctypes on Linux
+    '''
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+    import mmap
+    size = path.stat().st_size
+    if not size:
+        return 0.0
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_char_p]
+    pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+    vec = ctypes.create_string_buffer(pages)
+    with open(path, "rb") as fp:
+        addr = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fp.fileno(), 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            return None
+        try:
+            if libc.mincore(addr, size, vec) != 0:
+                return None
+        finally:
+            libc.munmap(addr, size)
+    return sum(b & 1 for b in vec.raw) / pages
+
+def bench(name: str, paths: list[Path], chunksize: int, repeat: int) -> tuple[float, float | None]:
+    reader = get_reader(name, chunksize)
+    best = float("inf")
+    for _ in range(repeat):
+        for path in paths:
+            dropcache(path)
+        started = time.perf_counter()
+        for path in paths:
+            digest = hashlib.md5()
+            for chunk in reader.chunks(path):
+                digest.update(chunk)
+        best = min(best, time.perf_counter() - started)
+    fractions = [resident(p) for p in paths]
+    cached = None if None in fractions else sum(fractions) / len(fractions)
+    return best, cached
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark checksum read backends")
+    parser.add_argument("paths", nargs="*", type=Path)
+    parser.add_argument("--size", type=int, default=1024, help="MiB of test data when no paths are given")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE // 1024**2, help="Chunk size in MiB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backends", default=",".join(READERS))
+    args = parser.parse_args()
+
+    tempdir = None
+    paths: list[Path] = args.paths
+    if not paths:
+        tempdir = tempfile.TemporaryDirectory()
+        path = Path(tempdir.name) / "bench.bin"
+        block = os.urandom(1024**2)
+        with open(path, "wb") as fp:
+            for _ in range(args.size):
+                fp.write(block)
+        paths = [path]
+    total = sum(p.stat().st_size for p in paths)
+    try:
+        print(f"{'backend':<10} {'seconds':>9} {'MiB/s':>9} {'cached':>7}")
+        for name in args.backends.split(","):
+            seconds, cached = bench(name.strip(), paths, args.chunksize * 1024**2, args.repeat)
+            rate = total / 1024**2 / seconds if seconds else float("inf")
+            cachedstr = "n/a" if cached is None else f"{cached:.0%}"
+            print(f"{name:<10} {seconds:>9.3f} {rate:>9.1f} {cachedstr:>7}")
+    finally:
+        if tempdir is not None:
+            tempdir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Checks that importing the package and the CLI's trivial commands stay cheap.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --scale 2 --repeat 21
+
+Each command runs in a fresh interpreter under '-X importtime'. 'imports' is the
+cumulative import time of every module the command loads beyond a bare interpreter,
+it must stay within the command's budget (multiplied by --scale on slow hosts) and none
+of the command's forbidden modules may be loaded. 'wall' is the median run time minus
+that of a bare interpreter, it's reported but not checked as it depends on the host.
+Exits with 1 if a budget is exceeded.
+"""
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def cli(*argv: str) -> str:
+    return f"import sys; sys.argv = ['amazonmmc', {', '.join(repr(a) for a in argv)}]; from amazonmmc import main; main()"
+
+PIPELINE = ["amazonmmc.runner", "amazonmmc.server", "amazonmmc.libs.delivery", "amazonmmc.libs.mec", "amazonmmc.libs.mmc",
+            "amazonmmc.libs.checksums", "xml.etree.ElementTree", "concurrent.futures", "multiprocessing"]
+
+# name: (code, import budget in ms, forbidden modules)
+COMMANDS = {
+    "import amazonmmc": ("import amazonmmc", 2, ["amazonmmc.libs", *PIPELINE]),
+    "amazonmmc --version": (cli("--version"), 2, ["argparse", "amazonmmc.libs", *PIPELINE]),
+    "amazonmmc --sample": (cli("-r", "{tempdir}", "--sample"), 120,
+                           ["amazonmmc.libs.watch", "amazonmmc.libs.readers", *PIPELINE]),
+    "import amazonmmc.libs.delivery": ("import amazonmmc.libs.delivery", 250, ["amazonmmc.runner", "multiprocessing"]),
+}
+
+def run(args: list[str], code: str) -> subprocess.CompletedProcess:
+    '''
+    Runs 'code' in a fresh interpreter, with '{tempdir}' replaced by a new empty directory
+    '''
+    with tempfile.TemporaryDirectory() as tempdir:
+        return subprocess.run([sys.executable, *args, "-c", code.replace("{tempdir}", tempdir)],
+                              cwd=ROOT, capture_output=True, text=True, check=True)
+
+def importtimes(code: str) -> tuple[set[str], dict[str, int]]:
+    '''
+    Every module loaded by running 'code', and {module: cumulative microseconds}
+    for the top level imports, whose times include their nested imports
+    '''
+    result = run(["-X", "importtime"], code)
+    loaded: set[str] = set()
+    toplevel: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        loaded.add(name.strip())
+        # Nested imports are indented further
+        if not name.startswith("  "):
+            toplevel[name.strip()] = int(cumulative)
+    return loaded, toplevel
+
+def walltime(code: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run([], code)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check package import and CLI startup budgets")
+    parser.add_argument("--repeat", type=int, default=11, help="Runs per command for the wall time median")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget, for slow hosts")
+    args = parser.parse_args()
+
+    baseline, _ = importtimes("pass")
+    barewall = walltime("pass", args.repeat)
+    failed = False
+    print(f"{'command':<32} {'imports ms':>10} {'budget ms':>10} {'wall ms':>8}  result")
+    for name, (code, budget, forbidden) in COMMANDS.items():
+        loaded, toplevel = importtimes(code)
+        cost = sum(us for m, us in toplevel.items() if m not in baseline) / 1000
+        wall = (walltime(code, args.repeat) - barewall) * 1000
+        problems = []
+        if cost > budget * args.scale:
+            problems.append("over budget")
+        bad = sorted(m for m in loaded if any(m == f or m.startswith(f + ".") for f in forbidden))
+        if bad:
+            problems.append(f"loads {', '.join(bad)}")
+        failed = failed or bool(problems)
+        print(f"{name:<32} {cost:>10.1f} {budget * args.scale:>10.1f} {wall:>8.1f}  {'; '.join(problems) or 'ok'}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Generates synthetic episodic deliveries of any size for benchmarking.
+
+    python benchmarks/catalog.py /tmp/catalog --seasons 10 --episodes 26 --languages ja-JP,en-US,fr-FR
+
+The metadata is cloned from the Hello Kitty sample so MECs and MMCs are realistic.
+Every episode gets one .mov per language (all but the first dubbed) and one .itt per
+language. Media files are sparse unless --dense is given, so a catalog of terabytes
+takes no disk space; hashing them measures CPU cost rather than disk throughput.
+--sharded writes each season's metadata to its own file under data/seasons/.
+Output is deterministic: the same arguments always produce the same bytes.
+"""
+import os
+import sys
+import copy
+import json
+import hashlib
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from amazonmmc.libs.datafile import write_sharded
+
+SAMPLE = Path(__file__).resolve().parent.parent / "amazonmmc" / "samples" / "dirStructure_example_start"
+PREFIX = "AMAZONKIDS_HELLOKITTY"
+REGION = "ja-JP"
+VIDEO = "PRORESHQ_5120_25_1920x1080_16x9_HD_178"
+SUBTITLE = "FULL_SUBTITLE_25"
+MiB = 1024 * 1024
+
+def block(size: int=MiB) -> bytes:
+    '''
+    Deterministic incompressible bytes
+    '''
+    parts: list[bytes] = []
+    digest = b"amazonmmc"
+    while sum(len(p) for p in parts) < size:
+        digest = hashlib.sha512(digest).digest()
+        parts.append(digest)
+    return b"".join(parts)[:size]
+
+def writemedia(path: Path, size: int, dense: bool, data: bytes) -> None:
+    with open(path, "wb") as fp:
+        if not dense:
+            fp.truncate(size)
+            return
+        written = 0
+        while written < size:
+            written += fp.write(data[:size - written])
+
+def renamed(template: dict, old: str, new: str) -> dict:
+    '''
+    Deep copy of 'template' with every occurrence of the id 'old' replaced by 'new'
+    '''
+    return json.loads(json.dumps(template, ensure_ascii=False).replace(old, new))
+
+def make_catalog(rootdir: Path, seasons: int=2, episodes: int=10, languages: list[str] | None=None,
+                 videosize: int=16 * MiB, subsize: int=64 * 1024, dense: bool=False, sharded: bool=False) -> Path:
+    '''
+    Creates rootdir/data/data.json and rootdir/resources/, returns 'rootdir'.
+    With 'sharded' every season goes to its own file under data/seasons/.
+    '''
+    languages = languages or ["EN-US"]
+    if episodes > 99:
+        raise ValueError("At most 99 episodes per season are supported by the naming convention")
+    with open(SAMPLE / "data" / "data.json", "rb") as fp:
+        sample = json.load(fp)
+    series = copy.deepcopy(sample["series"])
+    seasontemplate = series["seasons"][0]
+    episodetemplate = seasontemplate["episodes"][0]
+    seriesid = series["id"]
+    resourcedir = rootdir / "resources"
+    resourcedir.mkdir(parents=True, exist_ok=True)
+    (rootdir / "data").mkdir(exist_ok=True)
+    data = block() if dense else b""
+    subtitle = (b"<tt>" + b"subtitle " * 16 + b"</tt>\n") * (subsize // 150 + 1)
+
+    allseasons: list[dict] = []
+    for s in range(1, seasons + 1):
+        season = renamed({k:v for k,v in seasontemplate.items() if k != "episodes"},
+                         seasontemplate["id"], f"{seriesid}_S{s}")
+        season["SequenceInfo"] = str(s)
+        for info in season.get("LocalizedInfo", []):
+            info["TitleDisplayUnlimited"] = info["TitleDisplayUnlimited"].replace("Season 1", f"Season {s}")
+            for art in info.get("ArtReference", []):
+                art["filename"] = art["filename"].replace("SEASON1", f"SEASON{s}")
+                (resourcedir / art["filename"]).write_bytes(art["filename"].encode() * 64)
+        season["episodes"] = []
+        for e in range(1, episodes + 1):
+            epnum = f"{s}{e:02d}"
+            episode = renamed(episodetemplate, episodetemplate["id"], f"{seriesid}_S{s}_{epnum}")
+            episode["SequenceInfo"] = str(e)
+            for info in episode.get("LocalizedInfo", []):
+                info["TitleDisplayUnlimited"] = f"{info['TitleDisplayUnlimited']} {epnum}"
+            season["episodes"].append(episode)
+            for i, language in enumerate(languages):
+                dubbed = "_dubbed" if i else ""
+                name = f"{PREFIX}_SEASON{s}_{epnum}_{language}_{REGION}_{VIDEO}{dubbed}.mov"
+                writemedia(resourcedir / name, videosize, dense, data)
+                name = f"{PREFIX}_SEASON{s}_{epnum}_{language}_{REGION}_{SUBTITLE}.itt"
+                (resourcedir / name).write_bytes(subtitle[:subsize])
+        allseasons.append(season)
+    series["seasons"] = allseasons
+
+    if sharded:
+        write_sharded({"general": sample["general"], "series": series}, rootdir / "data")
+        return rootdir
+    with open(rootdir / "data" / "data.json", "w", encoding="UTF-8") as fp:
+        json.dump({"general": sample["general"], "series": series}, fp, indent=4, ensure_ascii=False)
+    return rootdir
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic episodic delivery")
+    parser.add_argument("rootdir", type=Path)
+    parser.add_argument("--seasons", type=int, default=2)
+    parser.add_argument("--episodes", type=int, default=10, help="Episodes per season (max 99)")
+    parser.add_argument("--languages", default="EN-US", help="Comma separated audio/subtitle languages")
+    parser.add_argument("--video-size", type=int, default=16, help="MiB per video file")
+    parser.add_argument("--subtitle-size", type=int, default=64, help="KiB per subtitle file")
+    parser.add_argument("--dense", action="store_true", help="Write real data instead of sparse files")
+    parser.add_argument("--sharded", action="store_true", help="Write one data file per season")
+    args = parser.parse_args()
+    if args.rootdir.exists() and any(args.rootdir.iterdir()):
+        sys.exit(f"Not empty: {args.rootdir}")
+    make_catalog(args.rootdir, args.seasons, args.episodes, args.languages.split(","),
+                 args.video_size * MiB, args.subtitle_size * 1024, args.dense, args.sharded)
+    files = sum(1 for _ in os.scandir(args.rootdir / "resources"))
+    print(f"Created {args.rootdir}: {args.seasons} seasons, {args.seasons * args.episodes} episodes, {files} resources")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import json
+import unittest
+from pathlib import Path
+
+from amazonmmc.libs.buildcache import BUILDCACHE_VERSION, BuildCache, digest
+from amazonmmc.libs.filesystem import MemoryFileSystem
+
+CACHEPATH = Path("/delivery/data/build.cache.json")
+OUTPUT = Path("/delivery/resources/EP101_metadata.xml")
+DEPS = {"series data": "a", "episode data": "b"}
+
+class BuildCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fs = MemoryFileSystem({OUTPUT: b"<MEC/>"})
+        self.fs.mkdir(CACHEPATH.parent)
+
+    def cache(self, force: bool=False) -> BuildCache:
+        return BuildCache(CACHEPATH, force, self.fs)
+
+    def built(self) -> BuildCache:
+        cache = self.cache()
+        cache.put("mecs", OUTPUT.name, DEPS, OUTPUT)
+        cache.save()
+        return self.cache()
+
+    def test_digest_ignores_key_order(self) -> None:
+        self.assertEqual(digest({"a": 1, "b": [1, 2]}), digest({"b": [1, 2], "a": 1}))
+        self.assertNotEqual(digest({"a": 1}), digest({"a": 2}))
+
+    def test_not_built_before(self) -> None:
+        cache = self.cache()
+        self.assertEqual(cache.stale("mecs", OUTPUT.name, DEPS, OUTPUT), ["not built before"])
+        self.assertEqual(cache.reasons, {OUTPUT.name: ["not built before"]})
+
+    def test_up_to_date(self) -> None:
+        cache = self.built()
+        self.assertEqual(cache.stale("mecs", OUTPUT.name, DEPS, OUTPUT), [])
+        self.assertEqual(cache.reasons, {})
+
+    def test_dependency_changes(self) -> None:
+        cache = self.built()
+        deps = {"series data": "a", "episode data": "c", "resources": "d"}
+        self.assertEqual(cache.stale("mecs", OUTPUT.name, deps),
+                         ["episode data changed", "resources added"])
+        self.assertEqual(cache.stale("mecs", OUTPUT.name, {"series data": "a"}),
+                         ["episode data removed"])
+
+    def test_output_missing_or_modified(self) -> None:
+        cache = self.built()
+        self.fs.write_bytes(OUTPUT, b"<MEC>edited</MEC>")
+        self.assertEqual(cache.stale("mecs", OUTPUT.name, DEPS, OUTPUT), ["output modified"])
+        self.fs.unlink(OUTPUT)
+        self.assertEqual(cache.stale("mecs", OUTPUT.name, DEPS, OUTPUT), ["output missing"])
+
+    def test_force(self) -> None:
+        self.built()
+        self.assertEqual(self.cache(force=True).stale("mecs", OUTPUT.name, DEPS, OUTPUT), ["full rebuild requested"])
+
+    def test_prune(self) -> None:
+        cache = self.cache()
+        cache.put("mecs", "EP101_metadata.xml", DEPS)
+        cache.put("mecs", "EP102_metadata.xml", DEPS)
+        cache.put("mmc", "SHOW_MMC.xml", DEPS)
+        cache.save()
+        cache.prune("mecs", {"EP101_metadata.xml"})
+        self.assertTrue(cache.dirty)
+        cache.save()
+        cache = self.cache()
+        self.assertEqual(set(cache.entries["mecs"]), {"EP101_metadata.xml"})
+        self.assertEqual(set(cache.entries["mmc"]), {"SHOW_MMC.xml"})
+        cache.prune("mecs", {"EP101_metadata.xml", "EP103_metadata.xml"})
+        self.assertFalse(cache.dirty)
+
+    def test_save_only_when_changed(self) -> None:
+        cache = self.built()
+        mtime = self.fs.stat(CACHEPATH).st_mtime_ns
+        cache.put("mecs", OUTPUT.name, DEPS, OUTPUT)
+        self.assertFalse(cache.dirty)
+        cache.save()
+        self.assertEqual(self.fs.stat(CACHEPATH).st_mtime_ns, mtime)
+        cache.put("mecs", OUTPUT.name, {**DEPS, "episode data": "c"}, OUTPUT)
+        cache.save()
+        self.assertNotEqual(self.fs.stat(CACHEPATH).st_mtime_ns, mtime)
+
+    def test_other_version_is_ignored(self) -> None:
+        self.built()
+        data = json.loads(self.fs.read_bytes(CACHEPATH))
+        data["version"] = BUILDCACHE_VERSION - 1
+        self.fs.write_bytes(CACHEPATH, json.dumps(data).encode("UTF-8"))
+        self.assertEqual(self.cache().stale("mecs", OUTPUT.name, DEPS, OUTPUT), ["not built before"])
+
+    def test_unreadable_cache_is_ignored(self) -> None:
+        self.fs.write_bytes(CACHEPATH, b"{not json")
+        self.assertEqual(self.cache().entries, {})
+
+if __name__ == "__main__":
+    unittest.main()
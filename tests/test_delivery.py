@@ -0,0 +1,97 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from contextlib import redirect_stdout
+from io import StringIO
+
+from amazonmmc.libs.delivery import Delivery
+from amazonmmc.libs.checksums import manifestname, readmanifest
+from amazonmmc.libs.datafile import SeasonShards, read_data, write_sharded
+
+SAMPLE = Path(__file__).resolve().parent.parent / "amazonmmc" / "samples" / "dirStructure_example_start"
+MMCNAME = "HELLO_KITTY_INTL_MMC.xml"
+
+class DeliveryTest(unittest.TestCase):
+    '''
+    Builds a copy of the sample delivery: its MECs are written and every resource hashed
+    '''
+    def setUp(self) -> None:
+        self.tempdir = Path(tempfile.mkdtemp())
+        self.rootdir = self.tempdir / "show"
+        shutil.copytree(SAMPLE, self.rootdir)
+        # Hashing prints its progress and report
+        self.enterContext(redirect_stdout(StringIO()))
+        deliv = Delivery(self.rootdir)
+        deliv.write_mecs()
+        deliv.checksums(jobs=2)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def mmcbytes(self) -> bytes:
+        return (self.rootdir / MMCNAME).read_bytes()
+
+    def test_stream_matches_tree(self) -> None:
+        self.assertTrue(Delivery(self.rootdir, buildcache=False).write_mmc(stream=False))
+        tree = self.mmcbytes()
+        # Identical output is left untouched
+        self.assertFalse(Delivery(self.rootdir, buildcache=False).write_mmc(stream=True))
+        (self.rootdir / MMCNAME).unlink()
+        self.assertTrue(Delivery(self.rootdir, buildcache=False).write_mmc(stream=True))
+        self.assertEqual(self.mmcbytes(), tree)
+        self.assertEqual(Delivery(self.rootdir).render()[MMCNAME], tree)
+        self.assertEqual(list(self.rootdir.glob(".*.tmp")), [])
+
+    def test_mmc_cache(self) -> None:
+        deliv = Delivery(self.rootdir)
+        self.assertTrue(deliv.write_mmc(stream=True))
+        self.assertEqual(deliv.pop_rebuilds(), {MMCNAME: ["not built before"]})
+        deliv = Delivery(self.rootdir)
+        self.assertFalse(deliv.write_mmc())
+        self.assertEqual(deliv.pop_rebuilds(), {})
+        (self.rootdir / MMCNAME).unlink()
+        self.assertTrue(deliv.write_mmc())
+        self.assertEqual(deliv.pop_rebuilds(), {MMCNAME: ["output missing"]})
+
+    def test_sharded_matches_inline(self) -> None:
+        inline = Delivery(self.rootdir, buildcache=False).render()
+        datadir = self.rootdir / "data"
+        write_sharded(read_data(datadir), datadir)
+
+        data = read_data(datadir)
+        seasons = data["series"]["seasons"]
+        self.assertIsInstance(seasons, SeasonShards)
+        self.assertEqual(seasons.names, ["seasons/HELLO_KITTY_INTL_S1.json"])
+        self.assertEqual(seasons.loaded, 0)
+        self.assertEqual(len(seasons[0]["episodes"]), 6)
+        self.assertEqual(seasons.loaded, 1)
+        self.assertEqual(list(seasons.stats), ["seasons/HELLO_KITTY_INTL_S1.json"])
+
+        self.assertEqual(Delivery(self.rootdir, buildcache=False).render(), inline)
+
+    def test_missing_shard(self) -> None:
+        datadir = self.rootdir / "data"
+        write_sharded(read_data(datadir), datadir)
+        (datadir / "seasons" / "HELLO_KITTY_INTL_S1.json").unlink()
+        with self.assertRaisesRegex(FileNotFoundError, "HELLO_KITTY_INTL_S1.json"):
+            read_data(datadir)["series"]["seasons"][0]
+
+    def test_memory_matches_local(self) -> None:
+        Delivery(self.rootdir).write_mmc()
+        local = Delivery(self.rootdir, buildcache=False)
+        resources = sorted(path.name for path in local.resourcedir.iterdir())
+        hashes = readmanifest(self.rootdir / "data" / manifestname("md5"))
+        data = read_data(self.rootdir / "data")
+        memory = Delivery.from_memory(data, resources, {"md5": hashes}, buildcache=True)
+        self.assertEqual(memory.render(), local.render())
+
+        self.assertEqual(len(memory.write_mecs()), 8)
+        self.assertTrue(memory.write_mmc(stream=True))
+        self.assertFalse(memory.write_mmc())
+        for name in [*local.render_mecs(), MMCNAME]:
+            path = self.rootdir / name if name == MMCNAME else local.resourcedir / name
+            self.assertEqual(memory.fs.read_bytes(memory.rootdir / path.relative_to(self.rootdir)), path.read_bytes(), name)
+
+if __name__ == "__main__":
+    unittest.main()
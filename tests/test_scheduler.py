@@ -0,0 +1,128 @@
+import os
+import time
+import threading
+import unittest
+from pathlib import Path
+from concurrent import futures
+
+from amazonmmc.libs.scheduler import HashTask, Scheduler
+
+MB = 1024 * 1024
+
+def fakestat(size: int, device: int=1) -> os.stat_result:
+    return os.stat_result((0o100644, 0, device, 1, 0, 0, size, 0, 0, 0))
+
+def files(*sizes: int, device: int=1) -> list[tuple[Path, os.stat_result]]:
+    return [(Path(f"dev{device}_{i}_{size}"), fakestat(size, device)) for i, size in enumerate(sizes)]
+
+class Concurrency:
+    '''
+    A run() func that sleeps a little and records the most tasks seen at once,
+    overall and per device
+    '''
+    def __init__(self, delay: float=0.02) -> None:
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running: dict[int, int] = {}
+        self.peak: dict[int, int] = {}
+        self.total = 0
+        self.peaktotal = 0
+        self.threads: set[int] = set()
+
+    def __call__(self, path: Path, stat: os.stat_result) -> str:
+        with self.lock:
+            self.running[stat.st_dev] = self.running.get(stat.st_dev, 0) + 1
+            self.peak[stat.st_dev] = max(self.peak.get(stat.st_dev, 0), self.running[stat.st_dev])
+            self.total += 1
+            self.peaktotal = max(self.peaktotal, self.total)
+            self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        with self.lock:
+            self.running[stat.st_dev] -= 1
+            self.total -= 1
+        return path.name
+
+class PlanTest(unittest.TestCase):
+    def test_large_files_get_their_own_task(self) -> None:
+        scheduler = Scheduler(jobs=4, smallfile=4 * MB, batchsize=16 * MB)
+        tasks = scheduler.plan(files(10 * MB, 4 * MB, 20 * MB))
+        self.assertEqual([[p.name for p, _ in task.files] for task in tasks],
+                         [["dev1_2_20971520"], ["dev1_0_10485760"], ["dev1_1_4194304"]])
+
+    def test_small_files_are_batched_per_device(self) -> None:
+        scheduler = Scheduler(jobs=4, smallfile=4 * MB, batchsize=4 * MB)
+        tasks = scheduler.plan(files(*[MB] * 6, device=1) + files(*[MB] * 2, device=2))
+        self.assertEqual(sorted((task.device, len(task.files)) for task in tasks), [(1, 2), (1, 4), (2, 2)])
+        self.assertTrue(all(task.size <= 4 * MB for task in tasks))
+        self.assertEqual(sum(len(task.files) for task in tasks), 8)
+
+    def test_largest_task_first(self) -> None:
+        scheduler = Scheduler(jobs=4, smallfile=4 * MB, batchsize=8 * MB)
+        tasks = scheduler.plan(files(MB, 5 * MB, MB, 30 * MB, device=1) + files(12 * MB, device=2))
+        sizes = [task.size for task in tasks]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+class RunTest(unittest.TestCase):
+    def tasks(self, count: int, device: int) -> list[HashTask]:
+        tasks = []
+        for path, stat in files(*[MB] * count, device=device):
+            task = HashTask(device)
+            task.add(path, stat)
+            tasks.append(task)
+        return tasks
+
+    def test_results(self) -> None:
+        scheduler = Scheduler(jobs=3)
+        tasks = scheduler.plan(files(*range(1, 50)))
+        results = scheduler.run(tasks, lambda path, stat: stat.st_size)
+        self.assertEqual(sorted(results), list(range(1, 50)))
+        self.assertEqual(sum(stats.files for stats in scheduler.stats), 49)
+
+    def test_device_cap(self) -> None:
+        scheduler = Scheduler(jobs=6, devicejobs=2)
+        func = Concurrency()
+        scheduler.run(self.tasks(8, 1) + self.tasks(8, 2), func)
+        self.assertEqual(func.peak, {1: 2, 2: 2})
+        self.assertLessEqual(func.peaktotal, 4)
+
+    def test_jobs_cap(self) -> None:
+        scheduler = Scheduler(jobs=3)
+        func = Concurrency()
+        scheduler.run(self.tasks(6, 1) + self.tasks(6, 2) + self.tasks(6, 3), func)
+        self.assertEqual(func.peaktotal, 3)
+        self.assertLessEqual(len(scheduler.stats), 3)
+
+    def test_error_stops_dispatching(self) -> None:
+        scheduler = Scheduler(jobs=1)
+        called = []
+
+        def fail(path: Path, stat: os.stat_result) -> None:
+            called.append(path)
+            raise OSError("unreadable")
+
+        with self.assertRaisesRegex(OSError, "unreadable"):
+            scheduler.run(self.tasks(5, 1), fail)
+        self.assertEqual(len(called), 1)
+        # The pool is stopped and the next run starts a new one
+        self.assertEqual(scheduler.run(self.tasks(2, 1), lambda path, stat: 1), [1, 1])
+
+    def test_concurrent_runs_share_the_pool(self) -> None:
+        scheduler = Scheduler(jobs=3, devicejobs=2)
+        func = Concurrency()
+        with futures.ThreadPoolExecutor(4) as pool:
+            runs = [pool.submit(scheduler.run, self.tasks(6, device % 2), func) for device in range(4)]
+            results = [run.result() for run in runs]
+        self.assertEqual([len(result) for result in results], [6] * 4)
+        self.assertLessEqual(len(func.threads), 3)
+        self.assertLessEqual(func.peaktotal, 3)
+        self.assertLessEqual(max(func.peak.values()), 2)
+        self.assertIsNone(scheduler._executor)
+
+    def test_invalid_limits(self) -> None:
+        with self.assertRaises(ValueError):
+            Scheduler(jobs=0)
+        with self.assertRaises(ValueError):
+            Scheduler(jobs=2, devicejobs=0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import json
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from concurrent import futures
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from amazonmmc.server import Client, JobRunner, make_server
+from amazonmmc.libs.errors import ServerBusy
+
+SAMPLE = Path(__file__).resolve().parent.parent / "amazonmmc" / "samples" / "dirStructure_example_start"
+
+class ServerTest(unittest.TestCase):
+    '''
+    Runs a server on a Unix socket over a copy of the sample delivery and drives it with Client
+    '''
+    def setUp(self) -> None:
+        self.tempdir = Path(tempfile.mkdtemp())
+        self.root = self.tempdir / "deliveries"
+        self.rootdir = self.root / "show"
+        shutil.copytree(SAMPLE, self.rootdir)
+        # The runner prints a line per job
+        self.output = self.enterContext(redirect_stdout(StringIO()))
+        self.runner = JobRunner([self.root], workers=2)
+        self.address = f"unix:{self.tempdir / 'server.sock'}"
+        self.server = make_server(self.address, self.runner)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = Client(self.address, timeout=60)
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.runner.close()
+        shutil.rmtree(self.tempdir)
+
+    def prepare(self) -> None:
+        self.assertEqual(self.client.submit("generate", self.rootdir, mmc=False)["status"], "ok")
+        self.assertEqual(self.client.submit("hash", self.rootdir)["status"], "ok")
+
+    def edit_title(self, title: str) -> None:
+        datapath = self.rootdir / "data" / "data.json"
+        data = json.loads(datapath.read_text(encoding="UTF-8"))
+        data["series"]["seasons"][0]["episodes"][0]["LocalizedInfo"][0]["TitleDisplayUnlimited"] = title
+        datapath.write_text(json.dumps(data, indent=4), encoding="UTF-8")
+
+    def test_generate_hash_verify(self) -> None:
+        result = self.client.submit("generate", self.rootdir, mmc=False)
+        self.assertEqual(result["status"], "ok", result["error"])
+        self.assertEqual(result["result"]["mecs"]["total"], 8)
+        self.assertNotIn("mmc", result["result"])
+
+        result = self.client.submit("hash", self.rootdir)
+        self.assertEqual(result["status"], "ok", result["error"])
+        self.assertEqual(result["result"]["cache_misses"], result["result"]["files"])
+        self.assertTrue((self.rootdir / "data" / "checksums.md5").is_file())
+
+        result = self.client.submit("generate", self.rootdir)
+        self.assertEqual(result["status"], "ok", result["error"])
+        self.assertTrue(result["result"]["mmc"]["written"])
+        self.assertTrue((self.rootdir / "HELLO_KITTY_INTL_MMC.xml").is_file())
+
+        result = self.client.submit("verify", self.rootdir)
+        self.assertEqual(result["status"], "ok", result["error"])
+        self.assertTrue(result["result"]["ok"])
+        self.assertTrue((self.rootdir / "data" / "verify.json").is_file())
+
+        status = self.client.status()
+        self.assertEqual(status["completed"], 4)
+        self.assertEqual(status["failed"], 0)
+        self.assertEqual([d["rootdir"] for d in status["deliveries"]], [str(self.rootdir.resolve())])
+
+    def test_outside_served_root(self) -> None:
+        other = self.tempdir / "other"
+        shutil.copytree(SAMPLE, other)
+        with self.assertRaisesRegex(RuntimeError, "^403 "):
+            self.client.submit("generate", other)
+        with self.assertRaisesRegex(RuntimeError, "^403 "):
+            self.client.submit("generate", self.rootdir / ".." / ".." / "other")
+
+    def test_missing_delivery(self) -> None:
+        with self.assertRaisesRegex(RuntimeError, "^404 "):
+            self.client.submit("generate", self.root / "missing")
+
+    def test_bad_job(self) -> None:
+        with self.assertRaisesRegex(RuntimeError, "^400 .*Job type"):
+            self.client.submit("publish", self.rootdir)
+        with self.assertRaisesRegex(RuntimeError, "^400 .*Unknown job fields"):
+            self.client.submit("generate", self.rootdir, upload=True)
+        with self.assertRaisesRegex(RuntimeError, "^400 .*rebuild"):
+            self.client.submit("generate", self.rootdir, rebuild="yes")
+
+    def test_queue_full(self) -> None:
+        self.runner.maxwaiting = 0
+        with self.assertRaises(ServerBusy):
+            self.client.submit("hash", self.rootdir)
+        self.assertEqual(self.client.status()["completed"], 0)
+
+    def test_warm_reuse(self) -> None:
+        self.prepare()
+        # The first jobs add files to resources/, which is picked up by the next one
+        results = [self.client.submit("generate", self.rootdir) for _ in range(3)]
+        self.assertTrue(all(result["status"] == "ok" for result in results))
+        self.assertTrue(results[-1]["warm"])
+        self.assertFalse(results[-1]["result"]["mmc"]["written"])
+        loads = self.client.status()["deliveries"][0]["loads"]
+        self.assertTrue(self.client.submit("verify", self.rootdir)["warm"])
+        self.assertEqual(self.client.status()["deliveries"][0]["loads"], loads)
+
+    def test_data_change_invalidates(self) -> None:
+        self.prepare()
+        for _ in range(3):
+            result = self.client.submit("generate", self.rootdir)
+        self.assertTrue(result["warm"])
+
+        self.edit_title("An Edited Title")
+        result = self.client.submit("generate", self.rootdir, mmc=False)
+        self.assertEqual(result["status"], "ok", result["error"])
+        self.assertFalse(result["warm"])
+        self.assertEqual(result["result"]["mecs"]["changed"], ["HELLO_KITTY_INTL_S1_101_metadata.xml"])
+        mec = self.rootdir / "resources" / "HELLO_KITTY_INTL_S1_101_metadata.xml"
+        self.assertIn("An Edited Title", mec.read_text(encoding="UTF-8"))
+
+    def test_edit_during_job_invalidates(self) -> None:
+        self.prepare()
+        self.client.submit("generate", self.rootdir, mmc=False)
+        steps = self.runner._steps
+
+        def edit_while_running(*args) -> None:
+            steps(*args)
+            self.edit_title("Edited During A Job")
+
+        with mock.patch.object(self.runner, "_steps", edit_while_running):
+            self.assertEqual(self.client.submit("verify", self.rootdir)["status"], "ok")
+        result = self.client.submit("generate", self.rootdir, mmc=False)
+        self.assertFalse(result["warm"])
+        self.assertEqual(result["result"]["mecs"]["changed"], ["HELLO_KITTY_INTL_S1_101_metadata.xml"])
+
+    def test_concurrent_jobs_log(self) -> None:
+        rootlogger = logging.getLogger()
+        level = rootlogger.level
+        rootlogger.setLevel(logging.INFO)
+        rootlogger.addHandler(self.runner.loghandler)
+        try:
+            self.prepare()
+            with futures.ThreadPoolExecutor(6) as pool:
+                types = ["generate", "hash", "verify"] * 4
+                results = list(pool.map(lambda type: self.client.submit(type, self.rootdir), types))
+        finally:
+            rootlogger.removeHandler(self.runner.loghandler)
+            rootlogger.setLevel(level)
+        self.assertTrue(all(result["status"] == "ok" for result in results))
+        log = (self.rootdir / "log.txt").read_text(encoding="UTF-8")
+        for result in results:
+            self.assertIn(f"Job {result['id']}: {result['type']}\n", log)
+            self.assertIn(f"Job {result['id']}: ok (", log)
+
+if __name__ == "__main__":
+    unittest.main()
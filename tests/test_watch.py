@@ -0,0 +1,104 @@
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from contextlib import ExitStack, redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from amazonmmc import runner
+from amazonmmc.libs.args import parse_args
+from amazonmmc.libs.datafile import read_data, write_sharded
+from amazonmmc.libs.watch import OVERFLOW, InotifyWatcher, PollingWatcher, Watcher, relevant
+
+SAMPLE = Path(__file__).resolve().parent.parent / "amazonmmc" / "samples" / "dirStructure_example_start"
+SHARD = "data/seasons/HELLO_KITTY_INTL_S1.json"
+
+class WatchTest(unittest.TestCase):
+    '''
+    Runs --watch over a copy of the sample delivery with its data.json sharded
+    '''
+    def setUp(self) -> None:
+        self.tempdir = Path(tempfile.mkdtemp())
+        self.rootdir = self.tempdir / "show"
+        shutil.copytree(SAMPLE, self.rootdir)
+        self.output = self.enterContext(redirect_stdout(StringIO()))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def shard(self) -> None:
+        datadir = self.rootdir / "data"
+        write_sharded(read_data(datadir), datadir)
+
+    def edit_shard(self, title: str) -> None:
+        path = self.rootdir / SHARD
+        season = json.loads(path.read_text(encoding="UTF-8"))
+        season["episodes"][0]["LocalizedInfo"][0]["TitleDisplayUnlimited"] = title
+        path.write_text(json.dumps(season, indent=4), encoding="UTF-8")
+
+    def watch(self, *argv: str) -> set[str]:
+        '''
+        Runs --watch until the changes after editing the shard are handled, returns them.
+        Like Watcher.changes, but gives up after a few seconds instead of waiting forever.
+        '''
+        batches = []
+
+        def edit_once(watcher: Watcher, debounce: float):
+            self.edit_shard("An Edited Title")
+            changed = watcher.poll(5)
+            while more := watcher.poll(debounce):
+                changed |= more
+            batches.append(changed)
+            yield changed
+            raise KeyboardInterrupt
+
+        argv = ["amazonmmc", "-r", str(self.rootdir), "--watch", "--debounce", "0.2", *argv]
+        with mock.patch.object(sys, "argv", argv), mock.patch.object(Watcher, "changes", edit_once), ExitStack() as stack:
+            runner.watch(parse_args(), stack)
+        return batches[0]
+
+    def assert_rebuilt(self) -> None:
+        mec = self.rootdir / "resources" / "HELLO_KITTY_INTL_S1_101_metadata.xml"
+        self.assertIn("An Edited Title", mec.read_text(encoding="UTF-8"))
+        self.assertEqual(self.output.getvalue().count("Delivery up to date"), 2)
+
+    def test_relevant(self) -> None:
+        self.assertTrue(relevant("data", "data.json"))
+        self.assertFalse(relevant("data", "checksums.md5"))
+        self.assertTrue(relevant("data/seasons", "S1.json"))
+        self.assertFalse(relevant("data/seasons", ".S1.json.tmp"))
+        self.assertTrue(relevant("resources", "EP101.mov"))
+        self.assertFalse(relevant("resources", "EP101_metadata.xml"))
+
+    def test_shard_edit_polling(self) -> None:
+        self.shard()
+        self.assertIn(SHARD, self.watch("--poll"))
+        self.assert_rebuilt()
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+    def test_shard_edit_inotify(self) -> None:
+        self.shard()
+        self.assertIn(SHARD, self.watch())
+        self.assert_rebuilt()
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+    def test_seasons_created_while_watching(self) -> None:
+        with InotifyWatcher(self.rootdir) as watcher:
+            self.shard()
+            self.assertIn(OVERFLOW, watcher.poll(5))
+            self.edit_shard("An Edited Title")
+            changed = set()
+            while more := watcher.poll(0.5):
+                changed |= more
+            self.assertIn(SHARD, changed)
+
+    def test_polling_sees_new_seasons(self) -> None:
+        watcher = PollingWatcher(self.rootdir, interval=0.05)
+        self.shard()
+        self.assertIn(SHARD, watcher.poll(5))
+
+if __name__ == "__main__":
+    unittest.main()